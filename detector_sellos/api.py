@@ -1,18 +1,76 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
-from clip_engine import cargar_vectores, comparar_muestra, cargar_vectores_desde_archivos
-import shutil
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from clip_engine import CLIP_BACKEND, DIM, MODEL_ID, Referencias, calcular_scores, calentar, cargar_modelo, cargar_vectores, codificar_muestras, codificar_normalizado, codificar_recortes, configurar_hilos, microbatcher, ordenar_scores, tiempos_arranque
+import clip_engine
+from cache_embeddings import CacheEmbeddings, clave_contenido
+from cache_resultados import CacheResultados
+from jobs import AlmacenJobs, ProcesadorJobs
+from fotos_pendientes import PENDIENTES_UMBRAL, AlmacenPendientes
+from indice_referencias import IndiceReferencias
+from indice_ann import ANN_DIR, ANN_RESCORE, IndiceANN
+from ejecutor import EjecutorInferencia, ColaSaturada, hilos_por_worker, respuesta_saturada
 import os
-from tempfile import NamedTemporaryFile
+import json
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
-import cairosvg
-from PIL import Image
+from typing import List, Optional
+import numpy as np
+from imagenes import decodificar_gris, rasterizar_svg, guardar_intermedio
+from asignacion import asignar, matriz_desde_listas
+from verificacion import VERIFICACION_MOTOR, binarizar, verificar as verificar_geometria
+from cascada import CASCADA_TOP_K, CASCADA_UMBRAL_HASH, huellas_fotos, huellas_svgs, seleccionar_candidatos
+from cascada import estadisticas as estadisticas_cascada
+from recorte import RECORTE_ACTIVO, RECORTE_MAX
+from recorte import estadisticas as estadisticas_recorte
+from vistas import VISTAS_REFERENCIA, firma as firma_vistas, generar_vistas
 
 VECTORES_DIR = "vectores"
 UMBRAL = 0.25
+RENDER_SIZE = 512  # Tamaño al que se rasterizan los SVGs
+ANN_MIN_REFERENCIAS = int(os.environ.get("ANN_MIN_REFERENCIAS", "2000"))  # Debajo de esto el matmul exacto es más rápido
+FOTOS_CACHE_DIR = os.environ.get("FOTOS_CACHE_DIR", "cache_fotos")
+FOTOS_CACHE_MAX_MB = float(os.environ.get("FOTOS_CACHE_MAX_MB", "2048"))  # Tope en disco del cache de fotos (0 = sin tope)
+ANN_MARGEN = 10  # Candidatos extra pedidos al ANN por si algunos ya no están vigentes
+MATCH_TOP_K_MAX = int(os.environ.get("MATCH_TOP_K_MAX", "100"))  # Tope de top_k en /match
+FORMATOS_STREAM = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+STREAM_FOTOS_POR_LOTE = int(os.environ.get("STREAM_FOTOS_POR_LOTE", "8"))  # Fotos codificadas juntas entre emisiones
+VERIFICACION_ACTIVA = os.environ.get("VERIFICACION_ACTIVA", "0") == "1"
+VERIFICACION_MARGEN = float(os.environ.get("VERIFICACION_MARGEN", "0.05"))  # Scores a esta distancia de UMBRAL son ambiguos
+VERIFICACION_MIN_INLIERS = int(os.environ.get("VERIFICACION_MIN_INLIERS", "8"))  # Con 4 matches la homografía siempre "cierra"
 
-app = FastAPI(title="Detector de Sellos API")
+estado_arranque = {"listo": False, "error": None}
+
+def _arrancar():
+    """Carga y calienta el modelo fuera del event loop; /ready responde 200 recién al terminar"""
+    global base_embeddings
+    inicio = time.perf_counter()
+    try:
+        cargar_modelo()
+        calentar()
+        # Cargar los vectores de referencia al iniciar (solo si existe el directorio)
+        if os.path.exists(VECTORES_DIR):
+            base_embeddings = cargar_vectores(VECTORES_DIR)
+        procesador_jobs.arrancar()
+        tiempos_arranque["total_s"] = round(time.perf_counter() - inicio, 3)
+        estado_arranque["listo"] = True
+        print(f"✅ Listo para recibir requests en {tiempos_arranque['total_s']}s")
+    except Exception as e:
+        estado_arranque["error"] = str(e)
+        print(f"❌ Error en el arranque: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    # uvicorn no abre el puerto hasta que termina el startup: el modelo se carga en segundo plano
+    # para que /health responda enseguida y /ready indique cuándo se puede mandar tráfico
+    threading.Thread(target=_arrancar, name="arranque", daemon=True).start()
+    yield
+    ejecutor.cerrar()
+
+app = FastAPI(title="Detector de Sellos API", lifespan=lifespan)
 
 # Configurar CORS para permitir solicitudes desde http://localhost:5173
 app.add_middleware(
@@ -32,12 +90,85 @@ async def add_cors_headers(request, call_next):
     response.headers["Access-Control-Allow-Headers"] = "*"
     return response
 
-# Cargar los vectores de referencia al iniciar (solo si existe el directorio)
-base_embeddings = cargar_vectores(VECTORES_DIR) if os.path.exists(VECTORES_DIR) else {}
+# Vectores de referencia de VECTORES_DIR (se cargan en el arranque, después del modelo)
+base_embeddings = {}
+
+# Cache de embeddings de SVGs de referencia, compartido entre requests
+cache = CacheEmbeddings()
+
+# Las fotos pendientes se vuelven a mandar cada vez que entra un pedido: sus embeddings y sus scores
+# contra las referencias ya vistas se guardan para no recalcularlos
+cache_fotos = CacheEmbeddings(FOTOS_CACHE_DIR, max_mb=FOTOS_CACHE_MAX_MB)
+cache_resultados = CacheResultados()
+
+# Índice persistente de vectores de pedidos activos (/referencias, /match)
+indice = IndiceReferencias()
+
+# Fotos sin pedido (sólo embeddings): cada pedido nuevo se puntúa contra todas
+pendientes = AlmacenPendientes()
+
+# Índice aproximado opcional (python indice_ann.py construir); sólo se usa con índices grandes.
+# Se recarga cuando ANN_DIR apunta a otra versión (otro ids.json), sin reiniciar el servidor
+_ann = {"firma": None, "indice": None}
+_ann_lock = threading.Lock()
+
+def indice_ann_actual():
+    """El índice ANN de ANN_DIR (o None si no hay), recargado si se reconstruyó desde la última consulta"""
+    try:
+        estado = os.stat(os.path.join(ANN_DIR, "ids.json"))
+        firma = (estado.st_ino, estado.st_mtime_ns)
+    except OSError:
+        firma = None
+    with _ann_lock:
+        if firma == _ann["firma"]:
+            return _ann["indice"]
+        try:
+            indice_ann = IndiceANN.cargar(ANN_DIR) if firma is not None else None
+        except Exception as e:
+            # Se reintenta en la próxima consulta; mientras tanto sigue el índice anterior
+            print(f"⚠️ No se pudo cargar el índice ANN de {ANN_DIR}: {e}")
+            return _ann["indice"]
+        if indice_ann is not None:
+            print(f"✅ Índice ANN cargado: {len(indice_ann)} entradas")
+        _ann.update(firma=firma, indice=indice_ann)
+        return indice_ann
+
+indice_ann_actual()
+
+# Pool dedicado a la inferencia: fuera del event loop y con cola acotada (503 si se llena)
+ejecutor = EjecutorInferencia(inicializador=lambda: configurar_hilos(hilos_por_worker()))
+app.add_exception_handler(ColaSaturada, respuesta_saturada)
+if clip_engine.MICROBATCH_ACTIVO and ejecutor.workers == 1:
+    print("⚠️ CLIP_MICROBATCH=1 con INFERENCIA_WORKERS=1: las requests se codifican de a una y no hay nada que juntar")
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    indice_ann = indice_ann_actual()
+    return {
+        "status": "ok",
+        "listo": estado_arranque["listo"],
+        "cache_embeddings": cache.estadisticas(),
+        "cache_fotos": cache_fotos.estadisticas(),
+        "cache_resultados": cache_resultados.estadisticas(),
+        "referencias_indice": len(indice),
+        "fotos_pendientes": len(pendientes),
+        "referencias_ann": len(indice_ann) if indice_ann is not None else 0,
+        "inferencia": ejecutor.estadisticas(),
+        "microbatching": microbatcher.estadisticas(),
+        "backend": clip_engine.backend.estadisticas() if clip_engine.backend is not None else None,
+        "cascada": estadisticas_cascada.estadisticas(),
+        "recorte": estadisticas_recorte.estadisticas(),
+    }
+
+@app.get("/ready")
+def ready():
+    """200 sólo cuando el modelo está cargado y calentado; 503 mientras tanto (para el balanceador)"""
+    if not estado_arranque["listo"]:
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "error": estado_arranque["error"], "tiempos": tiempos_arranque},
+        )
+    return {"ready": True, "tiempos": tiempos_arranque}
 
 @app.options("/predict")
 async def predict_options():
@@ -45,79 +176,548 @@ async def predict_options():
     return {"message": "OK"}
 
 @app.post("/predict")
-def predict(
+async def predict(
+    request: Request,
+    svgs: List[UploadFile] = File(..., description="SVGs de referencia"),
+    fotos: List[UploadFile] = File(..., description="Fotos a analizar"),
+    stream: Optional[str] = Query(None, description="ndjson o sse para recibir cada foto apenas se puntúa"),
+    cascada: bool = Query(False, description="Filtrar candidatos con huellas perceptuales antes de CLIP"),
+    top_k_hash: int = Query(CASCADA_TOP_K, ge=1, description="Referencias por foto que pasan del filtro a CLIP"),
+    umbral_hash: float = Query(CASCADA_UMBRAL_HASH, ge=0, le=1, description="Similitud de huella mínima para pasar a CLIP"),
+    auditar: bool = Query(False, description="Puntuar también exhaustivo para medir el recall de la cascada"),
+    verificar: bool = Query(VERIFICACION_ACTIVA, description="Confirmar con ORB/AKAZE los mejores matches cercanos a UMBRAL"),
+    asignacion: bool = Query(False, description="Asignación uno a uno fotos <-> SVGs que maximiza el score total")
+):
+    # Sólo la lectura de los uploads corre en el event loop; el resto va al pool de inferencia
+    svgs_datos = [(svg.filename, await svg.read()) for svg in svgs]
+    fotos_datos = [(foto.filename, await foto.read()) for foto in fotos]
+    formato = _formato_stream(request, stream)
+    if cascada:
+        if formato is not None:
+            raise HTTPException(status_code=400, detail="La cascada no admite respuesta en streaming")
+        return await ejecutor.ejecutar(
+            procesar_cascada, svgs_datos, fotos_datos, top_k_hash, umbral_hash, auditar, verificar, asignacion
+        )
+    if formato is not None:
+        return _respuesta_stream(svgs_datos, fotos_datos, formato, verificar, asignacion)
+    return await ejecutor.ejecutar(procesar_prediccion, svgs_datos, fotos_datos, verificar, asignacion)
+
+@app.post("/jobs", status_code=202)
+async def crear_job(
     svgs: List[UploadFile] = File(..., description="SVGs de referencia"),
     fotos: List[UploadFile] = File(..., description="Fotos a analizar")
 ):
-    # Guardar SVGs temporales y convertir a PNG
-    svg_temp_paths = []
-    png_temp_paths = []
-    png_to_svg_name = {}  # Relaciona PNG temporal con nombre original SVG
-    for svg in svgs:
-        with NamedTemporaryFile(delete=False, suffix=os.path.splitext(svg.filename)[1]) as tmp_svg:
-            shutil.copyfileobj(svg.file, tmp_svg)
-            svg_temp_paths.append(tmp_svg.name)
-            print(f"SVG recibido: {svg.filename}, guardado en: {tmp_svg.name}, tamaño: {os.path.getsize(tmp_svg.name)} bytes")
-        # Convertir SVG a PNG
-        png_path = tmp_svg.name + ".png"
+    """Igual que /predict pero asíncrono: devuelve un job_id al instante y procesa en segundo plano"""
+    svgs_datos = [(svg.filename, await svg.read()) for svg in svgs]
+    fotos_datos = [(foto.filename, await foto.read()) for foto in fotos]
+    job_id = await run_in_threadpool(almacen_jobs.crear, svgs_datos, fotos_datos)
+    procesador_jobs.encolar(job_id)
+    return {"success": True, "job_id": job_id, "estado": "pendiente", "total": len(fotos_datos)}
+
+@app.get("/jobs/{job_id}")
+def obtener_job(job_id: str):
+    """Progreso y resultados (parciales mientras se procesa) de un job"""
+    job = almacen_jobs.obtener(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job inexistente o vencido")
+    return {"success": job["estado"] != "error", **job}
+
+def clave_svg(contenido):
+    """Clave de cache del embedding de un SVG: contenido + tamaño de render + modelo + backend (+ vistas)"""
+    return clave_contenido(contenido, RENDER_SIZE, MODEL_ID, CLIP_BACKEND, *firma_vistas())
+
+def embeddings_svgs(svgs):
+    """[(nombre, clave de cache, embeddings (vistas, D))] de los SVGs (lista de (nombre, bytes)) que se pudieron leer"""
+    # Los SVGs ya vistos (mismo contenido, tamaño y modelo) salen del cache sin rasterizar ni inferir.
+    # Todo el pipeline trabaja en memoria: no se escriben archivos temporales.
+    listos = []
+    por_codificar = []  # (nombre original SVG, clave de cache, imagen rasterizada)
+    for nombre_svg, contenido in svgs:
+        clave = clave_svg(contenido)
+        emb = cache.obtener(clave)
+        if emb is not None:
+            listos.append((nombre_svg, clave, emb.reshape(-1, DIM)))
+            print(f"SVG {nombre_svg} servido desde cache ({clave[:12]})")
+            continue
+        print(f"SVG recibido: {nombre_svg}, tamaño: {len(contenido)} bytes")
         try:
-            cairosvg.svg2png(url=tmp_svg.name, write_to=png_path, output_width=512, output_height=512)
-            # Si el PNG tiene transparencia, agregar fondo blanco
-            with Image.open(png_path) as im:
-                if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
-                    fondo = Image.new("RGBA", im.size, (255, 255, 255, 255))
-                    fondo.paste(im, (0, 0), im if im.mode == "RGBA" else None)
-                    im_blanco = fondo.convert("RGB")
-                    im_blanco.save(png_path)
-                    print(f"Fondo blanco agregado a {png_path}")
-            png_temp_paths.append(png_path)
-            png_to_svg_name[os.path.basename(png_path)] = svg.filename  # Relaciona el PNG temporal con el nombre original
-            print(f"SVG convertido a PNG: {png_path}, tamaño: {os.path.getsize(png_path)} bytes")
+            im = rasterizar_svg(contenido, RENDER_SIZE)
+            guardar_intermedio(im, f"{clave[:12]}_{nombre_svg}")
+            por_codificar.append((nombre_svg, clave, im))
         except Exception as e:
-            print(f"Error convirtiendo SVG a PNG: {svg.filename} - {e}")
-    try:
-        # Generar vectores temporales a partir de los PNGs convertidos
-        vectores_temporales = cargar_vectores_desde_archivos(png_temp_paths)
-        resultados = []
-        for foto in fotos:
-            with NamedTemporaryFile(delete=False, suffix=os.path.splitext(foto.filename)[1]) as tmp_foto:
-                shutil.copyfileobj(foto.file, tmp_foto)
-                tmp_foto_path = tmp_foto.name
-            try:
-                res = comparar_muestra(tmp_foto_path, vectores_temporales)
-                print(f"\nAnálisis para la foto: {foto.filename}")
-                if res:
-                    for nombre_svg_temp, score in res:
-                        nombre_svg = png_to_svg_name.get(nombre_svg_temp, nombre_svg_temp)
-                        print(f"  - Score con {nombre_svg}: {score}")
-                    match, score = res[0]
-                    nombre_svg = png_to_svg_name.get(match, match)
-                    print(f"  => Mejor match: {nombre_svg} (score: {score})")
-                else:
-                    print("  No se encontraron matches para esta foto.")
-                foto_resultado = {
-                    "foto": foto.filename,
-                    "matches": []
-                }
-                
-                if res:
-                    for nombre_svg_temp, score in res:
-                        nombre_svg = png_to_svg_name.get(nombre_svg_temp, nombre_svg_temp)
-                        foto_resultado["matches"].append({
-                            "svg": nombre_svg,
-                            "score": float(score),
-                            "match": score >= UMBRAL
-                        })
-                
-                resultados.append(foto_resultado)
-            finally:
-                os.remove(tmp_foto_path)
-        return {
-            "success": True,
-            "results": resultados,
-            "message": f"Procesadas {len(fotos)} fotos contra {len(svgs)} SVGs"
+            print(f"Error convirtiendo SVG a PNG: {nombre_svg} - {e}")
+    # Generar vectores sólo para los SVGs que no estaban en cache: todas las vistas de todos en un lote
+    vistas = len(VISTAS_REFERENCIA)
+    embs_nuevos = codificar_normalizado([v for _, _, im in por_codificar for v in generar_vistas(im)])
+    for (nombre_svg, clave, _), emb in zip(por_codificar, embs_nuevos.reshape(len(por_codificar), vistas, DIM)):
+        cache.guardar(clave, emb)
+        listos.append((nombre_svg, clave, emb))
+    return listos
+
+def embeddings_por_posicion(svgs, posiciones):
+    """{posición en svgs: embedding} de los SVGs pedidos que se pudieron leer"""
+    por_clave = {clave: emb for _, clave, emb in embeddings_svgs([svgs[p] for p in posiciones])}
+    claves = {p: clave_svg(svgs[p][1]) for p in posiciones}
+    return {p: por_clave[clave] for p, clave in claves.items() if clave in por_clave}
+
+def preparar_referencias(svgs):
+    """(Referencias, claves de cache) de los SVGs (lista de (nombre, bytes)), usando el cache"""
+    listos = embeddings_svgs(svgs)
+    referencias = Referencias(
+        [nombre for nombre, _, _ in listos],
+        np.stack([emb for _, _, emb in listos]) if listos else np.empty((0, DIM)),
+        len(VISTAS_REFERENCIA),
+    )
+    return referencias, [clave for _, clave, _ in listos]
+
+def clave_foto(contenido):
+    """Clave de cache de los embeddings de una foto: contenido + modelo + backend (+ recorte del sello)"""
+    return clave_contenido(contenido, MODEL_ID, CLIP_BACKEND, *(("recorte", RECORTE_MAX) if RECORTE_ACTIVO else ()))
+
+def embeddings_fotos(fotos):
+    """{posición: (clave de cache, embeddings (N, D))} de las fotos (lista de (nombre, bytes)) que se pudieron leer.
+
+    N es 1, o la foto completa más sus recortes si el recorte del sello está activo.
+    """
+    listos, por_codificar = {}, []
+    for i, (_, contenido) in enumerate(fotos):
+        clave = clave_foto(contenido)
+        emb = cache_fotos.obtener(clave)
+        if emb is not None:
+            listos[i] = (clave, emb.reshape(-1, DIM))
+        else:
+            por_codificar.append((i, clave))
+    # Las fotos que no estaban en cache se codifican juntas en un lote
+    contenidos = [fotos[i][1] for i, _ in por_codificar]
+    if RECORTE_ACTIVO:
+        validas, embs, inicios = codificar_recortes(contenidos)
+        bloques = np.split(embs, inicios[1:])
+    else:
+        validas, embs = codificar_muestras(contenidos)
+        bloques = embs[:, None]
+    for v, emb in zip(validas, bloques):
+        i, clave = por_codificar[v]
+        cache_fotos.guardar(clave, emb)
+        listos[i] = (clave, emb)
+    return listos
+
+def _scores_foto(clave, emb, referencias, claves):
+    """Scores (R,) de una foto (el mejor entre sus recortes); con claves, reutilizando el cache de resultados"""
+    if claves is None:
+        return calcular_scores(emb, referencias).max(axis=0)
+    return cache_resultados.fila(
+        clave, claves, lambda posiciones: calcular_scores(emb, referencias.subconjunto(posiciones)).max(axis=0)
+    )
+
+def puntuar_fotos(fotos, referencias, claves=None):
+    """Resultados {"foto", "matches"} para cada foto (lista de (nombre, bytes)) contra las referencias.
+
+    Con las claves de cache de las referencias, los scores ya calculados para la misma foto se reutilizan y sólo
+    se puntúan las referencias que la foto no vio (por ejemplo, los pedidos nuevos).
+    """
+    embs = embeddings_fotos(fotos)
+    nombres_svg = referencias.nombres
+    resultados = []
+    for i, (nombre_foto, _) in enumerate(fotos):
+        print(f"\nAnálisis para la foto: {nombre_foto}")
+        foto_resultado = {
+            "foto": nombre_foto,
+            "matches": []
         }
-    finally:
-        for path in svg_temp_paths:
-            os.remove(path)
-        # No borramos los PNGs para inspección manual 
\ No newline at end of file
+        if i in embs and len(referencias):
+            scores = _scores_foto(*embs[i], referencias, claves)
+            for j in np.argsort(-scores):
+                score = float(scores[j])
+                print(f"  - Score con {nombres_svg[j]}: {score}")
+                foto_resultado["matches"].append({
+                    "svg": nombres_svg[j],
+                    "score": score,
+                    "match": score >= UMBRAL
+                })
+            mejor = foto_resultado["matches"][0]
+            print(f"  => Mejor match: {mejor['svg']} (score: {mejor['score']})")
+        else:
+            print("  No se encontraron matches para esta foto.")
+        
+        resultados.append(foto_resultado)
+    return resultados
+
+@app.put("/referencias/{pedido_id}")
+async def guardar_referencia(
+    pedido_id: str,
+    svg: UploadFile = File(..., description="Vector (SVG) del pedido")
+):
+    """Alta o actualización del vector de un pedido en el índice del servidor"""
+    contenido = await svg.read()
+    listos = await ejecutor.ejecutar(embeddings_svgs, [(svg.filename, contenido)])
+    if not listos:
+        raise HTTPException(status_code=400, detail=f"No se pudo procesar {svg.filename}")
+    nombre, clave, emb = listos[0]
+    await run_in_threadpool(indice.guardar, pedido_id, nombre, clave, emb)
+    # Un solo matmul contra todas las fotos pendientes; el front se entera por GET /pendientes/candidatos
+    candidatos = await run_in_threadpool(pendientes.puntuar_referencia, pedido_id, nombre, emb)
+    return {"success": True, "pedido_id": pedido_id, "svg": nombre, "candidatos": candidatos}
+
+@app.delete("/referencias/{pedido_id}")
+def borrar_referencia(pedido_id: str):
+    if not indice.borrar(pedido_id):
+        raise HTTPException(status_code=404, detail="Pedido no encontrado en el índice")
+    pendientes.borrar_pedido(pedido_id)
+    return {"success": True, "pedido_id": pedido_id}
+
+@app.get("/referencias")
+def listar_referencias():
+    referencias = indice.listar()
+    return {"success": True, "total": len(referencias), "referencias": referencias}
+
+@app.post("/match")
+async def match(
+    fotos: List[UploadFile] = File(..., description="Fotos a analizar"),
+    top_k: int = Query(5, ge=1, le=MATCH_TOP_K_MAX, description="Cantidad de pedidos candidatos por foto")
+):
+    """Compara fotos contra todo el índice de pedidos, sin tener que subir los SVGs"""
+    fotos_datos = [(foto.filename, await foto.read()) for foto in fotos]
+    return await ejecutor.ejecutar(procesar_match, fotos_datos, top_k)
+
+@app.post("/pendientes")
+async def agregar_pendientes(
+    fotos: List[UploadFile] = File(..., description="Fotos que todavía no tienen pedido")
+):
+    """Guarda fotos pendientes en el servidor (sólo sus embeddings) y las puntúa contra los pedidos actuales"""
+    fotos_datos = [(foto.filename, await foto.read()) for foto in fotos]
+    return await ejecutor.ejecutar(procesar_pendientes, fotos_datos)
+
+@app.get("/pendientes")
+def listar_pendientes():
+    fotos = pendientes.listar()
+    return {"success": True, "total": len(fotos), "fotos": fotos}
+
+@app.get("/pendientes/candidatos")
+def candidatos_pendientes(
+    desde: int = Query(0, ge=0, description="Cursor devuelto por la consulta anterior"),
+    limite: int = Query(500, ge=1, le=5000)
+):
+    """Candidatos (foto pendiente, pedido) nuevos desde el cursor, para consultar por polling"""
+    candidatos, cursor = pendientes.candidatos(desde, limite)
+    return {"success": True, "candidatos": candidatos, "cursor": cursor}
+
+@app.delete("/pendientes/{foto_id}")
+def borrar_pendiente(foto_id: str):
+    if not pendientes.borrar(foto_id):
+        raise HTTPException(status_code=404, detail="Foto no encontrada entre las pendientes")
+    return {"success": True, "foto_id": foto_id}
+
+def procesar_pendientes(fotos):
+    embs = embeddings_fotos(fotos)
+    referencias, nombres_svg, _ = indice.referencias()
+    resultados = []
+    for i, (nombre_foto, contenido) in enumerate(fotos):
+        if i not in embs:
+            resultados.append({"foto": nombre_foto, "error": "No se pudo leer la foto"})
+            continue
+        # El id es el hash del contenido: volver a subir la misma foto no la duplica
+        foto_id = clave_contenido(contenido)
+        _, emb = embs[i]
+        pendientes.agregar(foto_id, nombre_foto, emb)
+        pares = []
+        if len(referencias):
+            scores = calcular_scores(emb, referencias).max(axis=0)
+            elegidas = np.flatnonzero(scores >= PENDIENTES_UMBRAL)
+            pares = [(referencias.nombres[j], nombres_svg[j], float(scores[j])) for j in elegidas[np.argsort(-scores[elegidas])]]
+        pendientes.guardar_candidatos(foto_id, pares)
+        resultados.append({
+            "foto": nombre_foto,
+            "foto_id": foto_id,
+            "candidatos": [{"pedido_id": p, "svg": svg, "score": score} for p, svg, score in pares],
+        })
+    return {"success": True, "results": resultados, "message": f"{len(embs)} de {len(fotos)} fotos pendientes guardadas"}
+
+def _candidatos_match(embs, top_k):
+    """Por cada foto, (posiciones, scores) de los top_k pedidos, más (ids de pedido, nombres de archivo).
+
+    Exacto contra la matriz del índice, o vía el ANN si corresponde: en ese caso no se arma la matriz completa.
+    """
+    indice_ann = indice_ann_actual()
+    if indice_ann is None or len(indice) < ANN_MIN_REFERENCIAS:
+        referencias, nombres_svg, _ = indice.referencias()
+        scores = calcular_scores(embs, referencias)
+        orden = ordenar_scores(scores, top_k)
+        return [(orden[fila], scores[fila, orden[fila]]) for fila in range(len(embs))], referencias.nombres, nombres_svg
+    ids, nombres_svg, claves = indice.metadatos()
+    # Las entradas vigentes del ANN ya traen el score exacto (rescore contra sus vectores en memmap). Lo que cambió
+    # desde que se construyó se lee de la base por id, se puntúa exacto y se mezcla con sus candidatos
+    posicion_actual, delta = indice_ann.alinear(ids, claves)
+    por_id = indice.embeddings(ids[p] for p in delta)
+    delta = np.array([p for p in delta if ids[p] in por_id], dtype=np.int64)
+    embs_delta = [por_id[ids[p]] for p in delta]
+    candidatos = []
+    # El ANN tiene una entrada por vista: se piden más y cada pedido se queda con su mejor vista.
+    # El rescore exacto tiene que cubrir todo lo pedido, si no buscar devuelve menos de `pedidos` candidatos
+    pedidos = (top_k + ANN_MARGEN) * indice_ann.vistas
+    rescore = max(ANN_RESCORE, pedidos)
+    for emb, (pos_ann, scores_ann) in zip(embs, indice_ann.buscar(embs, pedidos, rescore=rescore)):
+        posiciones = posicion_actual[pos_ann]
+        vigentes = posiciones >= 0
+        posiciones = np.concatenate([posiciones[vigentes], delta])
+        scores_delta = np.array([(vistas @ emb).max() for vistas in embs_delta], dtype=np.float32)
+        scores = np.concatenate([scores_ann[vigentes], scores_delta])
+        orden = np.argsort(-scores)
+        _, primeras = np.unique(posiciones[orden], return_index=True)
+        orden = orden[np.sort(primeras)][:top_k]
+        candidatos.append((posiciones[orden], scores[orden]))
+    return candidatos, ids, nombres_svg
+
+def procesar_match(fotos, top_k):
+    validas, embs = codificar_muestras([contenido for _, contenido in fotos])
+    candidatos, ids, nombres_svg = _candidatos_match(embs, top_k)
+    fila_por_foto = {i: fila for fila, i in enumerate(validas)}
+    resultados = []
+    for i, (nombre_foto, _) in enumerate(fotos):
+        fila = fila_por_foto.get(i)
+        matches = []
+        if fila is not None:
+            for j, score in zip(*candidatos[fila]):
+                matches.append({
+                    "pedido_id": ids[j],
+                    "svg": nombres_svg[j],
+                    "score": float(score),
+                    "match": float(score) >= UMBRAL
+                })
+        resultados.append({"foto": nombre_foto, "matches": matches})
+    return {
+        "success": True,
+        "results": resultados,
+        "message": f"Procesadas {len(fotos)} fotos contra {len(ids)} pedidos del índice"
+    }
+
+def verificar_ambiguos(resultados, svgs, fotos, motor=VERIFICACION_MOTOR):
+    """Confirma con verificación geométrica el mejor match de cada foto cuando su score CLIP está cerca de UMBRAL.
+
+    Agrega "verificacion" al match y redefine su "match" según los inliers; el score CLIP no se toca.
+    """
+    contenido_svg = dict(svgs)
+    for (nombre_foto, contenido_foto), resultado in zip(fotos, resultados):
+        if not resultado["matches"]:
+            continue
+        mejor = resultado["matches"][0]
+        if abs(mejor["score"] - UMBRAL) > VERIFICACION_MARGEN:
+            continue
+        try:
+            foto = decodificar_gris(contenido_foto, RENDER_SIZE)
+            ref = np.asarray(rasterizar_svg(contenido_svg[mejor["svg"]], RENDER_SIZE).convert("L"))
+            geometria = verificar_geometria(binarizar(foto), binarizar(ref), motor)
+        except Exception as e:
+            print(f"⚠️ No se pudo verificar {nombre_foto} contra {mejor['svg']}: {e}")
+            continue
+        mejor["verificacion"] = {"motor": motor, **geometria}
+        mejor["match"] = geometria["inliers"] >= VERIFICACION_MIN_INLIERS
+        print(f"  Verificación {motor} de {nombre_foto} con {mejor['svg']}: {geometria['inliers']} inliers "
+              f"de {geometria['matches']} -> {'confirmado' if mejor['match'] else 'descartado'}")
+
+def asignar_resultados(resultados):
+    """Asignación uno a uno fotos <-> SVGs sobre los scores de los resultados (húngaro, con UMBRAL como holgura).
+
+    Respeta la verificación geométrica: un match descartado no se puede asignar y uno confirmado se puede
+    asignar aunque su score CLIP quede bajo UMBRAL. Marca cada resultado con "asignado" ({"svg", "score"} o None)
+    y devuelve la lista de pares.
+    """
+    def verificado(m, confirmado):
+        return "verificacion" in m and m["match"] == confirmado
+
+    matriz, nombres = matriz_desde_listas([
+        [(m["svg"], np.nan if verificado(m, False) else m["score"]) for m in r["matches"]] for r in resultados
+    ])
+    confirmados, _ = matriz_desde_listas(
+        [[(m["svg"], 1.0) for m in r["matches"] if verificado(m, True)] for r in resultados], nombres
+    )
+    asignados = {i: (nombres[j], score) for i, j, score in asignar(matriz, UMBRAL, confirmados > 0)}
+    pares = []
+    for i, resultado in enumerate(resultados):
+        resultado["asignado"] = None
+        if i in asignados:
+            svg, score = asignados[i]
+            resultado["asignado"] = {"svg": svg, "score": score}
+            pares.append({"foto": resultado["foto"], "svg": svg, "score": score})
+    return pares
+
+def procesar_prediccion(svgs, fotos, verificar=VERIFICACION_ACTIVA, asignacion=False):
+    """Compara fotos contra SVGs. Ambos son listas de (nombre, bytes)"""
+    referencias, claves = preparar_referencias(svgs)
+    resultados = puntuar_fotos(fotos, referencias, claves)
+    if verificar:
+        verificar_ambiguos(resultados, svgs, fotos)
+    respuesta = {
+        "success": True,
+        "results": resultados,
+        "message": f"Procesadas {len(fotos)} fotos contra {len(svgs)} SVGs"
+    }
+    if asignacion:
+        respuesta["asignacion"] = asignar_resultados(resultados)
+    return respuesta
+
+def procesar_cascada(svgs, fotos, top_k=CASCADA_TOP_K, umbral_hash=CASCADA_UMBRAL_HASH, auditar=False,
+                     verificar=VERIFICACION_ACTIVA, asignacion=False):
+    """Como procesar_prediccion, pero CLIP sólo puntúa las referencias que el filtro de huellas deja para cada foto.
+
+    Con auditar=True además se puntúa todo exhaustivamente para medir cuánto recall se pierde (cuesta lo mismo
+    que sin cascada: es para calibrar top_k y el umbral, no para producción).
+    """
+    # Etapa 1: huellas perceptuales, todas las fotos contra todos los SVGs
+    inicio = time.perf_counter()
+    svgs_validos, huellas_r = huellas_svgs(svgs, cache=cache)
+    fotos_validas, huellas_f = huellas_fotos(fotos)
+    mascara = seleccionar_candidatos(huellas_f, huellas_r, top_k, umbral_hash)
+    ms_huellas = 1000 * (time.perf_counter() - inicio)
+    # Etapa 2: CLIP sólo para los SVGs que son candidatos de alguna foto
+    necesarias = [svgs_validos[j] for j in np.flatnonzero(mascara.any(axis=0))]
+    embs_ref = embeddings_por_posicion(svgs, necesarias)
+    validas_clip, embs_f = codificar_muestras([fotos[i][1] for i in fotos_validas])
+    fila_clip = {fotos_validas[v]: fila for fila, v in enumerate(validas_clip)}
+    fila_hash = {i: fila for fila, i in enumerate(fotos_validas)}
+
+    resultados = []
+    candidatos_por_foto = {}
+    pares_clip = 0
+    for i, (nombre_foto, _) in enumerate(fotos):
+        matches = []
+        fila = fila_clip.get(i)
+        if fila is not None:
+            candidatos = [svgs_validos[j] for j in np.flatnonzero(mascara[fila_hash[i]]) if svgs_validos[j] in embs_ref]
+            candidatos_por_foto[i] = set(candidatos)
+            if candidatos:
+                scores = (np.stack([embs_ref[p] for p in candidatos]) @ embs_f[fila]).max(axis=1)
+                pares_clip += len(candidatos)
+                for k in np.argsort(-scores):
+                    score = float(scores[k])
+                    matches.append({"svg": svgs[candidatos[k]][0], "score": score, "match": score >= UMBRAL})
+        resultados.append({"foto": nombre_foto, "matches": matches})
+
+    resumen = {
+        "top_k": top_k,
+        "umbral_hash": umbral_hash,
+        "pares_totales": len(fotos) * len(svgs),
+        "pares_clip": pares_clip,
+        "pares_evitados": len(fotos) * len(svgs) - pares_clip,
+        "referencias_totales": len(svgs),
+        "referencias_clip": len(embs_ref),
+        "ms_huellas": round(ms_huellas, 1),
+        "ms_total": round(1000 * (time.perf_counter() - inicio), 1),
+    }
+    if auditar:
+        resumen["auditoria"] = _auditar_cascada(svgs, embs_f, fila_clip, candidatos_por_foto)
+    estadisticas_cascada.registrar(resumen)
+    if verificar:
+        verificar_ambiguos(resultados, svgs, fotos)
+    print(f"Cascada: {pares_clip} de {resumen['pares_totales']} pares puntuados con CLIP "
+          f"({len(embs_ref)} de {len(svgs)} SVGs codificados)")
+    respuesta = {
+        "success": True,
+        "results": resultados,
+        "message": f"Procesadas {len(fotos)} fotos contra {len(svgs)} SVGs (cascada)",
+        "cascada": resumen,
+    }
+    if asignacion:
+        # Sólo sobre los pares que pasaron el filtro de huellas
+        respuesta["asignacion"] = asignar_resultados(resultados)
+    return respuesta
+
+def _auditar_cascada(svgs, embs_f, fila_clip, candidatos_por_foto):
+    """Recall de la cascada contra la puntuación exhaustiva: mejor match y matches sobre UMBRAL conservados"""
+    todas = embeddings_por_posicion(svgs, range(len(svgs)))
+    posiciones = list(todas)
+    auditoria = {"fotos": 0, "top1_conservados": 0, "matches_exhaustivos": 0, "matches_conservados": 0}
+    if not posiciones:
+        return auditoria
+    matriz = np.stack([todas[p] for p in posiciones])
+    for i, fila in fila_clip.items():
+        scores = (matriz @ embs_f[fila]).max(axis=1)
+        candidatos = candidatos_por_foto.get(i, set())
+        auditoria["fotos"] += 1
+        auditoria["top1_conservados"] += posiciones[int(np.argmax(scores))] in candidatos
+        sobre_umbral = [posiciones[j] for j in np.flatnonzero(scores >= UMBRAL)]
+        auditoria["matches_exhaustivos"] += len(sobre_umbral)
+        auditoria["matches_conservados"] += sum(p in candidatos for p in sobre_umbral)
+    auditoria["recall_top1"] = round(auditoria["top1_conservados"] / auditoria["fotos"], 4) if auditoria["fotos"] else None
+    auditoria["recall_matches"] = (
+        round(auditoria["matches_conservados"] / auditoria["matches_exhaustivos"], 4) if auditoria["matches_exhaustivos"] else None
+    )
+    return auditoria
+
+def procesar_en_stream(svgs, fotos, emitir, verificar=VERIFICACION_ACTIVA, asignacion=False,
+                       fotos_por_lote=STREAM_FOTOS_POR_LOTE):
+    """Igual que procesar_prediccion pero llama a emitir(resultado) por cada foto.
+
+    Las fotos se codifican de a `fotos_por_lote` en un mismo batch de CLIP y los resultados de cada lote se
+    emiten apenas termina: el primer resultado sale sin esperar a todas las fotos y no se pierde el batching.
+    """
+    referencias, claves = preparar_referencias(svgs)
+    resultados = []
+    paso = max(1, fotos_por_lote)
+    for inicio in range(0, len(fotos), paso):
+        lote = fotos[inicio:inicio + paso]
+        resultados_lote = puntuar_fotos(lote, referencias, claves)
+        if verificar:
+            verificar_ambiguos(resultados_lote, svgs, lote)
+        for resultado in resultados_lote:
+            emitir(resultado)
+            # Copia: el registro emitido lo serializa el event loop, no se toca desde este hilo
+            resultados.append(dict(resultado))
+    resumen = {
+        "success": True,
+        "message": f"Procesadas {len(fotos)} fotos contra {len(svgs)} SVGs"
+    }
+    if asignacion:
+        # La asignación necesita todas las fotos: viaja en el resumen final
+        resumen["asignacion"] = asignar_resultados(resultados)
+    return resumen
+
+def _formato_stream(request, stream):
+    """ndjson / sse según el query param ?stream= o el header Accept; None para la respuesta JSON de siempre"""
+    if stream in FORMATOS_STREAM:
+        return stream
+    accept = request.headers.get("accept", "")
+    for formato, media_type in FORMATOS_STREAM.items():
+        if media_type in accept:
+            return formato
+    return None
+
+def _serializar(registro, formato, evento):
+    datos = json.dumps(registro, ensure_ascii=False)
+    if formato == "sse":
+        return f"event: {evento}\ndata: {datos}\n\n"
+    return datos + "\n"
+
+def _respuesta_stream(svgs_datos, fotos_datos, formato, verificar=VERIFICACION_ACTIVA, asignacion=False):
+    loop = asyncio.get_running_loop()
+    cola = asyncio.Queue()
+    fin = object()
+    # La admisión se decide acá: si el pool está lleno sale un 503 antes de empezar a streamear
+    futuro = ejecutor.enviar(
+        procesar_en_stream, svgs_datos, fotos_datos,
+        lambda registro: loop.call_soon_threadsafe(cola.put_nowait, registro),
+        verificar,
+        asignacion,
+    )
+    futuro.add_done_callback(lambda _: loop.call_soon_threadsafe(cola.put_nowait, fin))
+
+    async def generar():
+        while True:
+            registro = await cola.get()
+            if registro is fin:
+                break
+            yield _serializar(registro, formato, "resultado")
+        try:
+            resumen = futuro.result()
+        except Exception as e:
+            print(f"Error en predict (stream): {e}")
+            resumen = {"success": False, "error": str(e)}
+        yield _serializar(resumen, formato, "resumen")
+
+    # X-Accel-Buffering evita que nginx junte todo el stream antes de mandarlo
+    return StreamingResponse(
+        generar(), media_type=FORMATOS_STREAM[formato], headers={"X-Accel-Buffering": "no"}
+    )
+
+# Jobs asíncronos (/jobs): se procesan en un hilo de fondo y se guardan en SQLite
+almacen_jobs = AlmacenJobs()
+procesador_jobs = ProcesadorJobs(almacen_jobs, procesar_prediccion, ejecutor=ejecutor)
@@ -5,13 +5,18 @@ from typing import List
 import tempfile
 import os
 from PIL import Image
-import hashlib
-import shutil
+import numpy as np
+import io
 import cairosvg
-import mimetypes
+from ejecutor import EjecutorInferencia, ColaSaturada, respuesta_saturada
+from huellas import HASHES, calcular_huellas, miniatura, similitud_fusionada
 
 app = FastAPI(title="Detector de Sellos - Servidor Hetzner", version="1.0.0")
 
+# Pool para el procesamiento de imágenes, con cola acotada (503 + Retry-After si se llena)
+ejecutor = EjecutorInferencia()
+app.add_exception_handler(ColaSaturada, respuesta_saturada)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -21,29 +26,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def calcular_hash_imagen(imagen_path):
-    """Calcula hash perceptual basado en thumbnail"""
+UMBRAL_HASH = float(os.environ.get("UMBRAL_HASH", "0.5"))  # Similitud mínima para marcar un match
+
+def miniatura_imagen(imagen):
+    """Miniatura de la que sale la huella perceptual, o None si no se puede leer. Acepta ruta o archivo en memoria"""
     try:
-        with Image.open(imagen_path) as img:
-            img = img.convert('L').resize((8, 8), Image.Resampling.LANCZOS)
-            pixels = list(img.getdata())
-            avg = sum(pixels) / len(pixels)
-            hash_bits = ''.join(['1' if p > avg else '0' for p in pixels])
-            return hash_bits
+        return miniatura(imagen)
     except Exception as e:
-        print(f"Error calculando hash: {e}")
-        return "0" * 64
+        print(f"Error leyendo imagen: {e}")
+        return None
+
+def calcular_huellas_lote(miniaturas):
+    """(huellas, validas) de una lista de miniaturas (o None): todas las huellas (aHash, dHash, pHash) en un lote"""
+    validas = np.array([m is not None for m in miniaturas], dtype=bool)
+    huellas = np.zeros((len(miniaturas), len(HASHES)), dtype=np.uint64)
+    if validas.any():
+        huellas[validas] = calcular_huellas(np.stack([m for m in miniaturas if m is not None]))
+    return huellas, validas
 
-def calcular_hash_contenido(content):
-    """Calcula hash MD5 del contenido del archivo"""
-    return hashlib.md5(content).hexdigest()
+def calcular_hash_imagen(imagen):
+    """Calcula la huella perceptual (aHash, dHash, pHash) de una imagen, o None si no se puede leer"""
+    huellas, validas = calcular_huellas_lote([miniatura_imagen(imagen)])
+    return huellas[0] if validas[0] else None
+
+def matriz_similitud(huellas_fotos, huellas_refs, fotos_validas=None, refs_validas=None):
+    """Similitud (0-1) fotos x referencias: fusión ponderada de los hashes (HUELLA_PESOS).
+
+    Las fotos y referencias marcadas como no válidas (no se pudieron leer) quedan con similitud 0: una huella
+    cualquiera coincide en la mitad de los bits con cualquier otra y daría matches falsos.
+    """
+    similitud = similitud_fusionada(huellas_fotos, huellas_refs)
+    if fotos_validas is not None:
+        similitud[~np.asarray(fotos_validas, dtype=bool)] = 0.0
+    if refs_validas is not None:
+        similitud[:, ~np.asarray(refs_validas, dtype=bool)] = 0.0
+    return similitud
 
 def comparar_hashes(hash1, hash2):
     """Compara dos hashes y retorna similitud (0-1)"""
-    if len(hash1) != len(hash2):
-        return 0.0
-    matches = sum(c1 == c2 for c1, c2 in zip(hash1, hash2))
-    return matches / len(hash1)
+    return float(matriz_similitud([hash1], [hash2])[0, 0])
+
+def _hex(huella):
+    return "-".join(f"{int(h):016x}" for h in huella)
 
 def detectar_tipo_archivo(filename, content):
     """Detecta si el archivo es SVG, PNG, JPG, etc."""
@@ -75,39 +99,26 @@ def detectar_tipo_archivo(filename, content):
         except:
             return 'unknown'
 
-def procesar_archivo_referencia(file: UploadFile):
-    """Procesa un archivo de referencia (SVG o imagen) y retorna su hash"""
-    content = file.file.read()
-    file.file.seek(0)  # Resetear posición del archivo
-    
-    tipo = detectar_tipo_archivo(file.filename, content)
-    print(f"Procesando {file.filename} como tipo: {tipo}")
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{file.filename.split(".")[-1]}') as tmp_file:
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
+def miniatura_referencia(filename, content):
+    """Miniatura de un archivo de referencia (SVG o imagen), o None si no se puede leer como imagen"""
+    tipo = detectar_tipo_archivo(filename, content)
+    print(f"Procesando {filename} como tipo: {tipo}")
     
     try:
         if tipo == 'svg':
-            # Convertir SVG a PNG para análisis
-            png_path = tmp_path + '.png'
-            cairosvg.svg2png(url=tmp_path, write_to=png_path, output_width=256, output_height=256)
-            hash_result = calcular_hash_imagen(png_path)
-            os.unlink(png_path)
+            # Rasterizar el SVG en memoria para el análisis
+            png = cairosvg.svg2png(bytestring=content, output_width=256, output_height=256)
+            return miniatura_imagen(io.BytesIO(png))
         elif tipo == 'image':
             # Procesar imagen directamente
-            hash_result = calcular_hash_imagen(tmp_path)
+            return miniatura_imagen(io.BytesIO(content))
         else:
-            # Fallback: hash del contenido
-            hash_result = calcular_hash_contenido(content)
-        
-        os.unlink(tmp_path)
-        return hash_result
+            print(f"⚠️ {filename} no es SVG ni imagen: no se compara")
+            return None
         
     except Exception as e:
-        print(f"Error procesando {file.filename}: {e}")
-        os.unlink(tmp_path)
-        return calcular_hash_contenido(content)
+        print(f"Error procesando {filename}: {e}")
+        return None
 
 @app.get("/")
 def root():
@@ -124,7 +135,11 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "message": "API funcionando correctamente"}
+    return {
+        "status": "ok",
+        "message": "API funcionando correctamente",
+        "procesamiento": ejecutor.estadisticas(),
+    }
 
 @app.post("/predict")
 async def predict(
@@ -134,63 +149,52 @@ async def predict(
     """
     Procesa fotos contra archivos de referencia y retorna matches
     """
+    # El trabajo de PIL/cairosvg es bloqueante: se hace en el pool para no frenar el event loop
+    svgs_datos = [(svg.filename, await svg.read()) for svg in svgs]
+    fotos_datos = [(foto.filename, await foto.read()) for foto in fotos]
+    return await ejecutor.ejecutar(procesar_prediccion, svgs_datos, fotos_datos)
+
+def procesar_prediccion(svgs, fotos):
     try:
         print(f"Recibidos {len(svgs)} archivos de referencia y {len(fotos)} fotos")
         
         # Procesar archivos de referencia
-        referencia_hashes = {}
+        ref_nombres = [filename for filename, _ in svgs]
+        # Cada archivo se decodifica una vez a su miniatura; las huellas salen todas juntas en un lote
+        ref_hashes, refs_validas = calcular_huellas_lote(
+            [miniatura_referencia(filename, content) for filename, content in svgs]
+        )
+        for filename, huella, valida in zip(ref_nombres, ref_hashes, refs_validas):
+            if valida:
+                print(f"Hash para {filename}: {_hex(huella)}")
         
-        for archivo in svgs:
-            print(f"Procesando archivo de referencia: {archivo.filename}")
-            hash_result = procesar_archivo_referencia(archivo)
-            referencia_hashes[archivo.filename] = hash_result
-            print(f"Hash para {archivo.filename}: {hash_result[:20]}...")
+        # Fotos en memoria, sin archivos temporales
+        foto_hashes, fotos_validas = calcular_huellas_lote(
+            [miniatura_imagen(io.BytesIO(content)) for _, content in fotos]
+        )
+        for (foto_filename, _), huella, valida in zip(fotos, foto_hashes, fotos_validas):
+            if valida:
+                print(f"Hash de foto {foto_filename}: {_hex(huella)}")
+        
+        # Todas las fotos contra todas las referencias en una sola operación; lo que no se pudo leer no matchea
+        similitudes = matriz_similitud(foto_hashes, ref_hashes, fotos_validas, refs_validas)
         
-        # Procesar fotos
         results = []
         
-        for foto in fotos:
-            print(f"Procesando foto: {foto.filename}")
-            content = await foto.read()
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp_foto:
-                tmp_foto.write(content)
-                tmp_foto_path = tmp_foto.name
-            
-            try:
-                # Calcular hash de la foto
-                foto_hash = calcular_hash_imagen(tmp_foto_path)
-                print(f"Hash de foto {foto.filename}: {foto_hash[:20]}...")
-                
-                # Comparar con cada archivo de referencia
-                matches = []
-                for ref_name, ref_hash in referencia_hashes.items():
-                    similarity = comparar_hashes(foto_hash[:32], ref_hash[:32])
-                    print(f"Similitud entre {foto.filename} y {ref_name}: {similarity}")
-                    matches.append({
-                        "svg": ref_name,
-                        "score": similarity,
-                        "match": similarity > 0.5  # Umbral de similitud
-                    })
-                
-                # Ordenar por score descendente
-                matches.sort(key=lambda x: x["score"], reverse=True)
-                
-                results.append({
-                    "foto": foto.filename,
-                    "matches": matches
-                })
-                
-                os.unlink(tmp_foto_path)
-                
-            except Exception as e:
-                print(f"Error procesando foto {foto.filename}: {e}")
-                results.append({
-                    "foto": foto.filename,
-                    "error": str(e)
-                })
-                if os.path.exists(tmp_foto_path):
-                    os.unlink(tmp_foto_path)
+        for (foto_filename, _), fila in zip(fotos, similitudes):
+            # Ordenar por score descendente
+            orden = np.argsort(-fila, kind="stable")
+            results.append({
+                "foto": foto_filename,
+                "matches": [
+                    {
+                        "svg": ref_nombres[j],
+                        "score": float(fila[j]),
+                        "match": bool(fila[j] > UMBRAL_HASH)  # Umbral de similitud
+                    }
+                    for j in orden
+                ]
+            })
         
         print(f"Resultados finales: {results}")
         return {
@@ -0,0 +1,52 @@
+# asignacion.py
+"""Asignación uno a uno fotos <-> diseños que maximiza el score total (húngaro, scipy linear_sum_assignment).
+
+Cada foto tiene además una columna de holgura propia que cuesta lo mismo que un match justo en el umbral: una
+foto sólo se asigna si le conviene al total, y nunca a un diseño con score menor al umbral. Es equivalente a
+maximizar la suma de (score - umbral) de los pares asignados. Las celdas sin score (NaN o -inf, por ejemplo
+pares que no están en el top-k o descartados por verificación) no se pueden asignar.
+
+Los pares marcados como confirmados (por ejemplo, por verificación geométrica) se pueden asignar aunque su score
+quede bajo el umbral: cuentan como si valieran apenas más que dejar la foto sin asignar.
+"""
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+_PROHIBIDO = 1e9
+_DESEMPATE = 1e-6  # Lo que un par confirmado vale por encima de la holgura
+
+def asignar(scores, umbral, confirmados=None):
+    """scores (F, R) -> lista de (fila, columna, score) de la asignación óptima, ordenada por fila.
+
+    confirmados: máscara (F, R) opcional de pares que se aceptan aunque su score no llegue al umbral.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if scores.ndim != 2 or scores.size == 0:
+        return []
+    f, r = scores.shape
+    validos = np.isfinite(scores) & (scores >= umbral)
+    valores = np.nan_to_num(scores, nan=0.0, neginf=0.0)
+    if confirmados is not None:
+        confirmados = np.asarray(confirmados, dtype=bool) & np.isfinite(scores)
+        validos |= confirmados
+        valores = np.where(confirmados, np.maximum(valores, umbral + _DESEMPATE), valores)
+    costos = np.full((f, r + f), _PROHIBIDO)
+    costos[:, :r] = np.where(validos, -valores, _PROHIBIDO)
+    costos[np.arange(f), r + np.arange(f)] = -umbral  # Holgura: dejar la foto sin asignar
+    filas, columnas = linear_sum_assignment(costos)
+    return [
+        (int(i), int(j), float(scores[i, j]))
+        for i, j in zip(filas, columnas) if j < r and validos[i, j]
+    ]
+
+def matriz_desde_listas(listas, nombres=None):
+    """[[(nombre, score), ...] por fila] -> (matriz (F, R) con -inf donde no hay score, nombres de columnas)"""
+    if nombres is None:
+        nombres = sorted({nombre for lista in listas for nombre, _ in lista or []})
+    columna = {nombre: j for j, nombre in enumerate(nombres)}
+    matriz = np.full((len(listas), len(nombres)), -np.inf)
+    for i, lista in enumerate(listas):
+        for nombre, score in lista or []:
+            matriz[i, columna[nombre]] = score
+    return matriz, nombres
@@ -0,0 +1,101 @@
+# backends_clip.py
+"""Backends intercambiables para la torre de imagen de CLIP (pixel_values -> embedding sin normalizar).
+
+- fp32:        el modelo de PyTorch tal cual (referencia)
+- int8:        cuantización dinámica int8 de las capas Linear (sólo CPU)
+- torchscript: grafo trazado y congelado con torch.jit
+- onnx:        grafo exportado a ONNX y ejecutado con onnxruntime (dependencia opcional)
+"""
+
+import os
+import time
+import threading
+import numpy as np
+import torch
+
+BACKENDS = ("fp32", "int8", "torchscript", "onnx")
+ONNX_PATH = os.environ.get("CLIP_ONNX_PATH", os.path.join("modelos", "clip_vision.onnx"))
+
+class TorreVisual(torch.nn.Module):
+    """Sólo la parte de imagen de CLIP: vision_model + visual_projection"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.vision_model = model.vision_model
+        self.visual_projection = model.visual_projection
+
+    def forward(self, pixel_values):
+        return self.visual_projection(self.vision_model(pixel_values=pixel_values).pooler_output)
+
+class Backend:
+    """Envuelve una función pixel_values -> embeddings y lleva la cuenta del throughput"""
+
+    def __init__(self, nombre, fn):
+        self.nombre = nombre
+        self._fn = fn
+        self._lock = threading.Lock()
+        self.imagenes = 0
+        self.segundos = 0.0
+
+    def __call__(self, pixel_values):
+        inicio = time.perf_counter()
+        with torch.inference_mode():
+            embs = self._fn(pixel_values)
+        duracion = time.perf_counter() - inicio
+        with self._lock:
+            self.imagenes += len(pixel_values)
+            self.segundos += duracion
+        return embs
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "backend": self.nombre,
+                "imagenes": self.imagenes,
+                "segundos": round(self.segundos, 3),
+                "imagenes_por_s": round(self.imagenes / self.segundos, 2) if self.segundos else 0.0,
+            }
+
+def _ejemplo(device):
+    return torch.zeros((1, 3, 224, 224), device=device)
+
+def crear_backend(nombre, model, device):
+    """Construye el backend pedido a partir del CLIPModel ya cargado"""
+    torre = TorreVisual(model).eval()
+    if nombre == "fp32":
+        return Backend(nombre, torre)
+    if nombre == "int8":
+        if device != "cpu":
+            raise ValueError("El backend int8 (cuantización dinámica) sólo corre en CPU")
+        cuantizada = torch.ao.quantization.quantize_dynamic(torre, {torch.nn.Linear}, dtype=torch.qint8)
+        return Backend(nombre, cuantizada)
+    if nombre == "torchscript":
+        with torch.inference_mode():
+            trazada = torch.jit.trace(torre, _ejemplo(device), check_trace=False)
+        return Backend(nombre, torch.jit.optimize_for_inference(torch.jit.freeze(trazada.eval())))
+    if nombre == "onnx":
+        return Backend(nombre, _crear_onnx(torre, device))
+    raise ValueError(f"Backend desconocido: {nombre} (opciones: {', '.join(BACKENDS)})")
+
+def _crear_onnx(torre, device, path=ONNX_PATH):
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        raise RuntimeError("El backend onnx necesita onnxruntime (pip install onnxruntime)")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        torch.onnx.export(
+            torre, (_ejemplo(device),), path,
+            input_names=["pixel_values"], output_names=["embeddings"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "embeddings": {0: "batch"}},
+            opset_version=17,
+        )
+        print(f"Exportado ONNX en {path}")
+    opciones = ort.SessionOptions()
+    opciones.intra_op_num_threads = torch.get_num_threads()
+    sesion = ort.InferenceSession(path, opciones, providers=["CPUExecutionProvider"])
+
+    def correr(pixel_values):
+        salida = sesion.run(None, {"pixel_values": pixel_values.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(salida)
+    return correr
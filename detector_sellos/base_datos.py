@@ -0,0 +1,14 @@
+# base_datos.py
+
+import sqlite3
+from contextlib import contextmanager
+
+@contextmanager
+def conectar(path, timeout=30):
+    """Conexión SQLite que confirma al salir sin error (o deshace si hubo excepción) y siempre se cierra"""
+    con = sqlite3.connect(path, timeout=timeout)
+    try:
+        with con:
+            yield con
+    finally:
+        con.close()
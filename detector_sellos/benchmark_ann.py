@@ -0,0 +1,66 @@
+# benchmark_ann.py
+"""Recall@k y tiempo por consulta del índice ANN contra la búsqueda coseno exacta.
+
+Sin --db usa embeddings sintéticos agrupados (parecidos a diseños de sellos con variantes);
+con --db usa la base real del índice de referencias y consultas que son referencias con ruido.
+
+    python benchmark_ann.py --n 20000 --consultas 200
+    python benchmark_ann.py --db indice_referencias.sqlite3
+"""
+
+import time
+import argparse
+import numpy as np
+from indice_ann import IndiceANN, _leer_indice_sqlite, _normalizar
+
+def datos_sinteticos(n, d, grupos, semilla=0):
+    rng = np.random.default_rng(semilla)
+    centros = rng.normal(size=(grupos, d))
+    asignacion = rng.integers(0, grupos, n)
+    return _normalizar(centros[asignacion] + 0.6 * rng.normal(size=(n, d)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=None)
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--d", type=int, default=512)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--rescore", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    if args.db:
+        _, _, vectores = _leer_indice_sqlite(args.db)
+        vectores = _normalizar(vectores)
+    else:
+        vectores = datos_sinteticos(args.n, args.d, grupos=max(1, args.n // 20))
+    n, d = vectores.shape
+    # Consultas: referencias con ruido, como una foto de un sello que está en el índice
+    elegidas = rng.choice(n, args.consultas)
+    consultas = _normalizar(vectores[elegidas] + 0.04 * rng.normal(size=(args.consultas, d)))
+
+    inicio = time.perf_counter()
+    indice = IndiceANN.construir([str(i) for i in range(n)], [""] * n, vectores)
+    print(f"Construcción: {time.perf_counter() - inicio:.2f}s para {n} vectores de dimensión {d} "
+          f"({len(indice.listas)} listas)")
+
+    inicio = time.perf_counter()
+    exactos = np.argsort(-(consultas @ vectores.T), axis=1)[:, :args.top_k]
+    t_exacto = (time.perf_counter() - inicio) / args.consultas
+    print(f"Exacto: {1000 * t_exacto:.3f} ms/consulta")
+
+    print(f"{'nprobe':>7} {'recall@' + str(args.top_k):>10} {'top1':>7} {'ms/consulta':>12} {'speedup':>8}")
+    for nprobe in args.nprobe:
+        inicio = time.perf_counter()
+        aproximados = indice.buscar(consultas, args.top_k, nprobe=nprobe, rescore=args.rescore)
+        t_ann = (time.perf_counter() - inicio) / args.consultas
+        recall = np.mean([
+            len(set(pos.tolist()) & set(ex.tolist())) / args.top_k for (pos, _), ex in zip(aproximados, exactos)
+        ])
+        top1 = np.mean([len(pos) > 0 and pos[0] == ex[0] for (pos, _), ex in zip(aproximados, exactos)])
+        print(f"{nprobe:>7} {recall:>10.4f} {top1:>7.4f} {1000 * t_ann:>12.3f} {t_exacto / t_ann:>8.2f}")
+
+if __name__ == "__main__":
+    main()
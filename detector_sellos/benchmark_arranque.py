@@ -0,0 +1,56 @@
+# benchmark_arranque.py
+"""Mide el arranque en frío del motor CLIP: import, carga del modelo, calentamiento y primeras inferencias.
+
+Cada corrida se hace en un proceso nuevo para que no haya nada cacheado en memoria.
+
+    python benchmark_arranque.py --corridas 3
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+
+MEDICION = r"""
+import json, time
+t0 = time.perf_counter()
+import clip_engine
+from PIL import Image
+t_import = time.perf_counter() - t0
+clip_engine.cargar_modelo()
+clip_engine.calentar()
+imagen = Image.new("RGB", (512, 512), (255, 255, 255))
+t1 = time.perf_counter()
+clip_engine.codificar_imagenes([imagen])
+t_primera = time.perf_counter() - t1
+t2 = time.perf_counter()
+clip_engine.codificar_imagenes([imagen])
+t_segunda = time.perf_counter() - t2
+print(json.dumps({
+    "import_s": round(t_import, 3),
+    "carga_s": clip_engine.tiempos_arranque["carga_s"],
+    "calentamiento_s": clip_engine.tiempos_arranque["calentamiento_s"],
+    "primera_inferencia_s": round(t_primera, 3),
+    "segunda_inferencia_s": round(t_segunda, 3),
+    "listo_s": round(time.perf_counter() - t0 - t_primera - t_segunda, 3),
+}))
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corridas", type=int, default=3)
+    args = parser.parse_args()
+
+    corridas = []
+    for i in range(args.corridas):
+        salida = subprocess.run(
+            [sys.executable, "-c", MEDICION], capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        corridas.append(json.loads(salida))
+        print(f"Corrida {i + 1}: {corridas[-1]}")
+    for campo in corridas[0]:
+        valores = sorted(c[campo] for c in corridas)
+        print(f"{campo:>22}: mediana {valores[len(valores) // 2]:.3f}s  (min {valores[0]:.3f}s, max {valores[-1]:.3f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmark_cascada.py
+"""Latencia de /predict exhaustivo contra la cascada hash -> CLIP sobre las mismas fotos y SVGs.
+
+La cascada se mide en frío (sin huellas de SVG en el cache, como la primera request con un diseño nuevo) y en
+caliente (las huellas salen del cache, como en las requests siguientes). Reporta ms por request, cuánto de eso se
+va en las huellas y qué fracción de pares llega a CLIP.
+
+    python benchmark_cascada.py --muestras Muestras --svgs SVGs
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import api
+from cache_embeddings import CacheEmbeddings
+from cascada import clave_huella
+
+def _leer(directorio, extension=None):
+    archivos = []
+    for nombre in sorted(os.listdir(directorio)):
+        if extension is None or nombre.lower().endswith(extension):
+            with open(os.path.join(directorio, nombre), "rb") as f:
+                archivos.append((nombre, f.read()))
+    return archivos
+
+def _medir(funcion, repeticiones, antes=None):
+    tiempos, respuesta = [], None
+    for _ in range(repeticiones):
+        if antes is not None:
+            antes()
+        inicio = time.perf_counter()
+        respuesta = funcion()
+        tiempos.append(1000 * (time.perf_counter() - inicio))
+    return float(np.median(tiempos)), respuesta
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--muestras", default="Muestras")
+    parser.add_argument("--svgs", default="SVGs")
+    parser.add_argument("--top-k", type=int, default=api.CASCADA_TOP_K)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    fotos = _leer(args.muestras)
+    svgs = _leer(args.svgs, ".svg")
+    if not fotos or not svgs:
+        print("⚠️ Hacen falta fotos y SVGs para comparar")
+        return
+    print(f"{len(fotos)} fotos x {len(svgs)} SVGs, top-k {args.top_k}")
+    api.cargar_modelo()
+
+    # Cache propio y vacío: los embeddings CLIP de los SVGs se calculan en el calentamiento, las huellas no
+    directorio = tempfile.mkdtemp(prefix="benchmark_cascada_")
+    try:
+        api.cache = CacheEmbeddings(directorio)
+        api.procesar_prediccion(svgs, fotos)
+
+        def olvidar_huellas():
+            # Cache nuevo (memoria vacía) sobre el mismo directorio, sin los .npy de las huellas
+            for _, contenido in svgs:
+                try:
+                    os.remove(os.path.join(directorio, clave_huella(contenido) + ".npy"))
+                except OSError:
+                    pass
+            api.cache = CacheEmbeddings(directorio)
+
+        ms_exhaustivo, _ = _medir(lambda: api.procesar_prediccion(svgs, fotos), args.repeticiones)
+        cascada = lambda: api.procesar_cascada(svgs, fotos, top_k=args.top_k)
+        ms_frio, frio = _medir(cascada, args.repeticiones, olvidar_huellas)
+        ms_caliente, caliente = _medir(cascada, args.repeticiones)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    resumen = caliente["cascada"]
+    print(f"Pares a CLIP: {resumen['pares_clip']} de {resumen['pares_totales']}")
+    print(f"{'modo':>18} {'ms/request':>11} {'ms huellas':>11} {'vs exhaustivo':>14}")
+    print(f"{'exhaustivo':>18} {ms_exhaustivo:>11.1f} {'-':>11} {'1.00x':>14}")
+    for modo, ms, respuesta in (("cascada (frío)", ms_frio, frio), ("cascada (caliente)", ms_caliente, caliente)):
+        print(f"{modo:>18} {ms:>11.1f} {respuesta['cascada']['ms_huellas']:>11.1f} {ms_exhaustivo / ms:>13.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmark_decodificacion.py
+"""Tiempo por foto y pico de memoria de la decodificación completa contra la reducida (imagenes.decodificar).
+
+Cada método corre en un proceso aparte y el pico de RSS se mide por encima de lo que ocupan los imports (Linux).
+Sin --fotos genera una foto sintética de 12 MP (4000x3000, ~3 MB) como las de celular.
+
+    python benchmark_decodificacion.py --fotos Muestras
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+METODOS = {
+    # nombre: (código que decodifica `path`, descripción)
+    "clip_completa": ("Image.open(path).convert('RGB')", "PIL completa -> RGB (antes, CLIP)"),
+    "clip_reducida": ("decodificar(path, 224)", "draft a >=224 px + EXIF (CLIP)"),
+    "sift_completa": ("cv2.imread(path, cv2.IMREAD_GRAYSCALE)", "cv2.imread completa (antes, SIFT)"),
+    "sift_reducida": ("decodificar_gris(path, 512)", "draft a >=512 px en gris (SIFT)"),
+    "hash_reducida": ("decodificar(path, 128, 'L')", "draft a >=128 px en gris (huellas)"),
+}
+
+MEDICION = r"""
+import json, sys, time
+import cv2
+from PIL import Image
+from imagenes import decodificar, decodificar_gris
+
+def memoria_kb(campo):
+    with open("/proc/self/status") as f:
+        return next(int(l.split()[1]) for l in f if l.startswith(campo + ":"))
+
+paths, repeticiones = json.loads(sys.argv[1]), int(sys.argv[2])
+# Se resetea el pico de RSS después de los imports: sólo cuenta lo que aloca la decodificación
+with open("/proc/self/clear_refs", "w") as f:
+    f.write("5")
+base = memoria_kb("VmRSS")
+inicio = time.perf_counter()
+for _ in range(repeticiones):
+    for path in paths:
+        imagen = %s
+        del imagen
+duracion = time.perf_counter() - inicio
+pico = memoria_kb("VmHWM")
+print(json.dumps({"ms_por_foto": 1000 * duracion / (repeticiones * len(paths)), "pico_mb": (pico - base) / 1024}))
+"""
+
+def _foto_sintetica(directorio):
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    # Manchas suaves más ruido de sensor: se comprime parecido a una foto real
+    manchas = Image.fromarray(rng.integers(0, 255, (94, 125, 3), dtype=np.uint8)).resize((4000, 3000), Image.Resampling.BICUBIC)
+    pixeles = np.asarray(manchas, dtype=np.int16) + rng.normal(0, 6, (3000, 4000, 3)).astype(np.int16)
+    imagen = Image.fromarray(pixeles.clip(0, 255).astype(np.uint8))
+    path = os.path.join(directorio, "sintetica_12mp.jpg")
+    imagen.save(path, quality=90)
+    return [path]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fotos", default=None, help="Carpeta con fotos (default: una sintética de 12 MP)")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.fotos:
+            paths = [os.path.join(args.fotos, n) for n in sorted(os.listdir(args.fotos))]
+        else:
+            paths = _foto_sintetica(tmp)
+        print(f"{len(paths)} fotos, {args.repeticiones} repeticiones")
+        print(f"{'método':>15} {'ms/foto':>9} {'pico MB':>8}  descripción")
+        for nombre, (codigo, descripcion) in METODOS.items():
+            salida = subprocess.run(
+                [sys.executable, "-c", MEDICION % codigo, json.dumps(paths), str(args.repeticiones)],
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout.strip().splitlines()[-1]
+            r = json.loads(salida)
+            print(f"{nombre:>15} {r['ms_por_foto']:>9.1f} {r['pico_mb']:>8.1f}  {descripcion}")
+
+if __name__ == "__main__":
+    main()
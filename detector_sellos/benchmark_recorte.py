@@ -0,0 +1,75 @@
+# benchmark_recorte.py
+"""Precisión y latencia de CLIP con y sin el recorte automático del sello (recorte.py) sobre las muestras.
+
+La respuesta correcta de cada muestra es el vector con el mismo nombre (sin extensión). Reporta aciertos top-1,
+score medio del vector correcto, cuántos correctos superan el umbral y ms por foto; aparte, el costo de la
+localización sola (p50/p95) y cuántas fotos se pasaron del presupuesto. Con --guardar deja los recortes en disco.
+
+    python benchmark_recorte.py --muestras Muestras --vectores Vectores
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from clip_engine import LADO_RECORTES, cargar_modelo, cargar_vectores, matriz_scores
+from imagenes import decodificar
+from recorte import RECORTE_PRESUPUESTO_MS, proponer_recortes
+
+def _medir(paths, referencias, correctos, recortes, repeticiones, umbral):
+    matriz_scores(paths[:1], referencias, recortes)  # Calentamiento
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        validas, scores = matriz_scores(paths, referencias, recortes)
+    ms = 1000 * (time.perf_counter() - inicio) / (repeticiones * len(paths))
+    filas = [(fila, correctos[i]) for fila, i in enumerate(validas) if correctos[i] is not None]
+    aciertos = sum(int(scores[fila].argmax() == j) for fila, j in filas)
+    score_correcto = np.array([scores[fila, j] for fila, j in filas])
+    return {
+        "top1": aciertos / len(filas) if filas else 0.0,
+        "score": float(score_correcto.mean()) if filas else 0.0,
+        "sobre_umbral": int((score_correcto >= umbral).sum()),
+        "ms": ms,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--muestras", default="Muestras")
+    parser.add_argument("--vectores", default="Vectores")
+    parser.add_argument("--umbral", type=float, default=0.25, help="El UMBRAL de api.py")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--guardar", default=None, help="Carpeta donde dejar los recortes propuestos")
+    args = parser.parse_args()
+
+    cargar_modelo()
+    referencias = cargar_vectores(args.vectores)
+    columna = {Path(n).stem: j for j, n in enumerate(referencias.nombres)}
+    nombres = sorted(os.listdir(args.muestras))
+    paths = [os.path.join(args.muestras, n) for n in nombres]
+    correctos = [columna.get(Path(n).stem) for n in nombres]
+    print(f"{len(paths)} muestras ({sum(c is not None for c in correctos)} con vector conocido) x {len(referencias)} vectores")
+
+    tiempos, recortes_por_foto, excedidas = [], [], 0
+    for nombre, path in zip(nombres, paths):
+        imagen = decodificar(path, LADO_RECORTES)
+        inicio = time.perf_counter()
+        recortes = proponer_recortes(imagen)
+        tiempos.append(1000 * (time.perf_counter() - inicio))
+        recortes_por_foto.append(len(recortes) - 1)
+        excedidas += int(tiempos[-1] > RECORTE_PRESUPUESTO_MS)
+        if args.guardar:
+            os.makedirs(args.guardar, exist_ok=True)
+            for k, recorte in enumerate(recortes[1:], 1):
+                recorte.save(os.path.join(args.guardar, f"{Path(nombre).stem}_{k}.png"))
+    print(f"Localización: p50 {np.percentile(tiempos, 50):.1f} ms, p95 {np.percentile(tiempos, 95):.1f} ms, "
+          f"{np.mean(recortes_por_foto):.1f} recortes/foto, {excedidas} fotos fuera del presupuesto "
+          f"({RECORTE_PRESUPUESTO_MS:.0f} ms)")
+
+    print(f"{'modo':>12} {'top-1':>7} {'score correcto':>15} {'>= umbral':>10} {'ms/foto':>9}")
+    for modo, recortes in (("completa", False), ("con recorte", True)):
+        r = _medir(paths, referencias, correctos, recortes, args.repeticiones, args.umbral)
+        print(f"{modo:>12} {r['top1']:>7.2%} {r['score']:>15.4f} {r['sobre_umbral']:>10} {r['ms']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmark_verificacion.py
+"""Compara los motores de verificación geométrica (ORB, AKAZE) contra SIFT sobre todas las parejas muestra x vector.
+
+Reporta tiempo por pareja (extracción de ambas imágenes + matching + homografía, como compare_images),
+la diferencia media del porcentaje de inliers respecto de SIFT, cuántas decisiones (score >= umbral) coinciden
+con SIFT y en cuántas muestras coincide el mejor vector.
+
+    python benchmark_verificacion.py --muestras Muestras --vectores Vectores
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+from utils import preprocess_image
+from verificacion import MATCHERS, MOTORES, verificar
+
+def _leer(directorio):
+    imagenes = []
+    for nombre in sorted(os.listdir(directorio)):
+        try:
+            imagenes.append((nombre, preprocess_image(os.path.join(directorio, nombre))))
+        except Exception as e:
+            print(f"❌ Error leyendo {nombre}: {e}")
+    return imagenes
+
+def _medir(muestras, vectores, motor, matcher, repeticiones):
+    ratios = np.zeros((len(muestras), len(vectores)))
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for i, (_, muestra) in enumerate(muestras):
+            for j, (_, vector) in enumerate(vectores):
+                ratios[i, j] = verificar(muestra, vector, motor, matcher)["ratio"]
+    por_par = (time.perf_counter() - inicio) / (repeticiones * ratios.size)
+    return ratios, por_par
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--muestras", default="Muestras")
+    parser.add_argument("--vectores", default="Vectores")
+    parser.add_argument("--umbral", type=float, default=0.15, help="Score mínimo para aceptar (el de main.py)")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+
+    muestras = _leer(args.muestras)
+    vectores = _leer(args.vectores)
+    if not muestras or not vectores:
+        print("⚠️ Hacen falta muestras y vectores para comparar")
+        return
+    print(f"{len(muestras)} muestras x {len(vectores)} vectores = {len(muestras) * len(vectores)} parejas")
+
+    referencia, t_sift = _medir(muestras, vectores, "sift", "bf", args.repeticiones)
+    print(f"{'motor':>12} {'ms/pareja':>10} {'speedup':>8} {'|Δ ratio|':>10} {'decisiones':>11} {'mejor vector':>13}")
+    for motor in MOTORES:
+        for matcher in (MATCHERS if motor != "sift" else ("bf",)):
+            if motor == "sift":
+                ratios, t = referencia, t_sift
+            else:
+                try:
+                    ratios, t = _medir(muestras, vectores, motor, matcher, args.repeticiones)
+                except RuntimeError as e:
+                    print(f"⚠️ {motor}: {e}")
+                    break
+            diferencia = np.abs(ratios - referencia).mean()
+            decisiones = np.mean((ratios >= args.umbral) == (referencia >= args.umbral))
+            mejor = np.mean(ratios.argmax(axis=1) == referencia.argmax(axis=1))
+            nombre = motor if motor == "sift" else f"{motor}/{matcher}"
+            print(f"{nombre:>12} {1000 * t:>10.2f} {t_sift / t:>8.2f} {diferencia:>10.3f} {decisiones:>11.2%} {mejor:>13.2%}")
+
+if __name__ == "__main__":
+    main()
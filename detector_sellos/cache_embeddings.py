@@ -0,0 +1,141 @@
+# cache_embeddings.py
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+CACHE_DIR = os.environ.get("EMBEDDINGS_CACHE_DIR", "cache_embeddings")
+CACHE_MAX_ITEMS = int(os.environ.get("EMBEDDINGS_CACHE_MAX_ITEMS", "2048"))
+CACHE_MAX_MB = float(os.environ.get("EMBEDDINGS_CACHE_MAX_MB", "1024"))  # Tope del directorio en disco (0 = sin tope)
+CACHE_PODA = 0.9  # Al pasarse del tope se borran los .npy más viejos hasta quedar en esta fracción
+
+def clave_contenido(contenido, *partes):
+    """SHA-256 del contenido más los parámetros que afectan al embedding (tamaño de render, modelo...)"""
+    h = hashlib.sha256(contenido)
+    for parte in partes:
+        h.update(b"|" + str(parte).encode())
+    return h.hexdigest()
+
+class CacheEmbeddings:
+    """LRU acotado en memoria delante de un almacén en disco (un .npy por clave).
+
+    El disco también se acota a `max_mb`: al pasarse se borran primero los archivos con fecha de modificación más
+    vieja (leer un .npy del disco lo toca, así que se van los que hace más tiempo no se usan). Con varios procesos
+    sobre el mismo directorio cada uno cuenta lo que escribe y la poda vuelve a medir el directorio entero.
+    """
+
+    def __init__(self, directorio=CACHE_DIR, max_items=CACHE_MAX_ITEMS, max_mb=CACHE_MAX_MB):
+        self.directorio = directorio
+        self.max_items = max_items
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._lock_poda = threading.Lock()
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.eliminados_disco = 0
+        os.makedirs(directorio, exist_ok=True)
+        self.bytes_disco = sum(tamano for _, _, tamano in self._archivos())
+
+    def _path(self, clave):
+        return os.path.join(self.directorio, clave + ".npy")
+
+    def _archivos(self):
+        """[(mtime, path, bytes)] de los .npy del directorio"""
+        archivos = []
+        with os.scandir(self.directorio) as entradas:
+            for entrada in entradas:
+                if not entrada.name.endswith(".npy"):
+                    continue
+                try:
+                    stat = entrada.stat()
+                except OSError:
+                    continue  # Lo borró otro proceso
+                archivos.append((stat.st_mtime, entrada.path, stat.st_size))
+        return archivos
+
+    def _podar(self):
+        """Borra los .npy más viejos hasta dejar el directorio en CACHE_PODA del tope"""
+        if not self._lock_poda.acquire(blocking=False):
+            return  # Ya está podando otro hilo
+        try:
+            archivos = sorted(self._archivos())
+            total = sum(tamano for _, _, tamano in archivos)
+            objetivo = int(self.max_bytes * CACHE_PODA)
+            eliminados = 0
+            for _, path, tamano in archivos:
+                if total <= objetivo:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= tamano
+                eliminados += 1
+            with self._lock:
+                self.bytes_disco = total
+                self.eliminados_disco += eliminados
+        finally:
+            self._lock_poda.release()
+
+    def _recordar(self, clave, emb):
+        self._memoria[clave] = emb
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_items:
+            self._memoria.popitem(last=False)
+
+    def obtener(self, clave):
+        """Devuelve el embedding guardado o None si no está en memoria ni en disco"""
+        with self._lock:
+            if clave in self._memoria:
+                self._memoria.move_to_end(clave)
+                self.hits_memoria += 1
+                return self._memoria[clave]
+        try:
+            emb = np.load(self._path(clave))
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(self._path(clave))  # Usado recién: queda último en la poda
+        except OSError:
+            pass
+        with self._lock:
+            self.hits_disco += 1
+            self._recordar(clave, emb)
+        return emb
+
+    def guardar(self, clave, emb, dtype=np.float32):
+        """Guarda el arreglo como `dtype` (las huellas perceptuales van como uint64)"""
+        emb = np.ascontiguousarray(emb, dtype=dtype)
+        # Escritura atómica: si el proceso muere a mitad no queda un .npy corrupto
+        tmp_path = self._path(clave) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, emb)
+            tamano = f.tell()
+        os.replace(tmp_path, self._path(clave))
+        with self._lock:
+            self._recordar(clave, emb)
+            self.bytes_disco += tamano
+            podar = self.max_bytes > 0 and self.bytes_disco > self.max_bytes
+        if podar:
+            self._podar()
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.hits_memoria + self.hits_disco + self.misses
+            return {
+                "hits_memoria": self.hits_memoria,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "hit_rate": round((self.hits_memoria + self.hits_disco) / total, 4) if total else 0.0,
+                "items_memoria": len(self._memoria),
+                "max_items_memoria": self.max_items,
+                "mb_disco": round(self.bytes_disco / (1024 * 1024), 1),
+                "max_mb_disco": round(self.max_bytes / (1024 * 1024), 1),
+                "eliminados_disco": self.eliminados_disco,
+            }
@@ -0,0 +1,88 @@
+# cache_resultados.py
+"""Cache de filas de scores por foto, para re-matchear las mismas fotos pendientes sin recalcular todo.
+
+Cada foto (por hash de contenido) recuerda el score contra cada referencia (por clave de contenido del SVG) que
+ya se calculó, y la última fila completa junto con la huella del conjunto de referencias que la generó:
+- misma huella: la fila sale tal cual del cache
+- conjunto distinto: sólo se puntúan las referencias que la foto todavía no vio (las de pedidos nuevos)
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+RESULTADOS_MAX_FOTOS = int(os.environ.get("RESULTADOS_CACHE_MAX_FOTOS", "4096"))
+
+def huella_referencias(claves):
+    """Huella de un conjunto ordenado de referencias (claves de contenido)"""
+    h = hashlib.sha256()
+    for clave in claves:
+        h.update(clave.encode() + b"\n")
+    return h.hexdigest()
+
+class CacheResultados:
+    """LRU en memoria: clave de foto -> scores por clave de referencia + última fila calculada"""
+
+    def __init__(self, max_fotos=RESULTADOS_MAX_FOTOS):
+        self.max_fotos = max_fotos
+        self._fotos = OrderedDict()
+        self._lock = threading.Lock()
+        self.filas_reutilizadas = 0
+        self.filas_incrementales = 0
+        self.filas_nuevas = 0
+        self.scores_reutilizados = 0
+        self.scores_calculados = 0
+
+    def fila(self, clave_foto, claves, calcular):
+        """Scores (R,) de la foto contra las referencias `claves`.
+
+        calcular(posiciones) devuelve los scores de las referencias en esas posiciones de `claves`; sólo se llama
+        con las que la foto no tiene en el cache. La fila devuelta es de sólo lectura (se comparte entre requests).
+        """
+        huella = huella_referencias(claves)
+        with self._lock:
+            entrada = self._fotos.get(clave_foto)
+            if entrada is not None:
+                self._fotos.move_to_end(clave_foto)
+                if entrada["huella"] == huella:
+                    self.filas_reutilizadas += 1
+                    self.scores_reutilizados += len(claves)
+                    return entrada["fila"]
+            conocidos = entrada["scores"] if entrada is not None else {}
+            fila = np.array([conocidos.get(clave, np.nan) for clave in claves], dtype=np.float32)
+        faltan = np.flatnonzero(np.isnan(fila))
+        if len(faltan):
+            fila[faltan] = calcular(faltan)
+        fila.flags.writeable = False
+        with self._lock:
+            if entrada is None:
+                self.filas_nuevas += 1
+            elif len(faltan):
+                self.filas_incrementales += 1
+            else:
+                self.filas_reutilizadas += 1  # Un subconjunto de referencias ya vistas
+            self.scores_calculados += len(faltan)
+            self.scores_reutilizados += len(claves) - len(faltan)
+            entrada = self._fotos.setdefault(clave_foto, {"scores": {}, "huella": None, "fila": None})
+            entrada["scores"].update((claves[j], float(fila[j])) for j in faltan)
+            entrada["huella"], entrada["fila"] = huella, fila
+            self._fotos.move_to_end(clave_foto)
+            while len(self._fotos) > self.max_fotos:
+                self._fotos.popitem(last=False)
+        return fila
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.scores_calculados + self.scores_reutilizados
+            return {
+                "fotos": len(self._fotos),
+                "max_fotos": self.max_fotos,
+                "filas_reutilizadas": self.filas_reutilizadas,
+                "filas_incrementales": self.filas_incrementales,
+                "filas_nuevas": self.filas_nuevas,
+                "scores_calculados": self.scores_calculados,
+                "scores_reutilizados": self.scores_reutilizados,
+                "reuso": round(self.scores_reutilizados / total, 4) if total else 0.0,
+            }
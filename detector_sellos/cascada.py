@@ -0,0 +1,122 @@
+# cascada.py
+"""Primera etapa de la cascada hash -> CLIP: elige, con las huellas perceptuales, qué referencias vale la pena
+pasar por CLIP para cada foto.
+
+Cada foto se queda con sus CASCADA_TOP_K referencias de mayor similitud de huella (y, si se configura, sólo las
+que superan CASCADA_UMBRAL_HASH). Los SVGs que no son candidatos de ninguna foto ni siquiera se codifican con CLIP.
+
+Las huellas de los SVGs se guardan en el cache de embeddings por contenido: un SVG que ya se vio no se vuelve a
+rasterizar ni a hashear.
+"""
+
+import os
+import threading
+import numpy as np
+from huellas import HASHES, calcular_huellas, miniatura, similitud_fusionada
+from imagenes import rasterizar_svg
+from cache_embeddings import clave_contenido
+
+CASCADA_TOP_K = int(os.environ.get("CASCADA_TOP_K", "20"))
+CASCADA_UMBRAL_HASH = float(os.environ.get("CASCADA_UMBRAL_HASH", "0"))  # 0 = sólo se corta por top-K
+HUELLA_RENDER = 128  # Los SVGs se rasterizan chicos: la huella sale de una miniatura de 32x32
+
+def _huellas_validas(nombres, abrir):
+    """(validas, huellas): índices de lo que se pudo abrir y sus huellas, calculadas en un solo lote"""
+    validas, miniaturas = [], []
+    for i, nombre in enumerate(nombres):
+        try:
+            miniaturas.append(miniatura(abrir(i)))
+            validas.append(i)
+        except Exception as e:
+            print(f"Error calculando huella de {nombre}: {e}")
+    return validas, calcular_huellas(np.stack(miniaturas) if miniaturas else [])
+
+def clave_huella(contenido, tamano=HUELLA_RENDER):
+    """Clave de cache de la huella de un SVG: contenido + tamaño de render + hashes que se calculan"""
+    return clave_contenido(contenido, tamano, "huellas", *HASHES)
+
+def huellas_svgs(svgs, tamano=HUELLA_RENDER, cache=None):
+    """(validas, huellas) de los SVGs (lista de (nombre, bytes)) rasterizados a baja resolución.
+
+    Con un CacheEmbeddings sólo se rasterizan y hashean los SVGs que no tienen la huella guardada.
+    """
+    huellas = np.empty((len(svgs), len(HASHES)), dtype=np.uint64)
+    encontradas, faltan = [], []
+    for i, (_, contenido) in enumerate(svgs):
+        huella = cache.obtener(clave_huella(contenido, tamano)) if cache is not None else None
+        if huella is not None and huella.shape == (len(HASHES),):
+            huellas[i] = huella
+            encontradas.append(i)
+        else:
+            faltan.append(i)
+    if faltan:
+        validas, nuevas = _huellas_validas(
+            [svgs[i][0] for i in faltan], lambda k: rasterizar_svg(svgs[faltan[k]][1], tamano)
+        )
+        for k, huella in zip(validas, nuevas):
+            i = faltan[k]
+            huellas[i] = huella
+            encontradas.append(i)
+            if cache is not None:
+                cache.guardar(clave_huella(svgs[i][1], tamano), huella, np.uint64)
+    validas = sorted(encontradas)
+    return validas, huellas[validas]
+
+def huellas_fotos(fotos):
+    """(validas, huellas) de las fotos (lista de (nombre, bytes))"""
+    return _huellas_validas([nombre for nombre, _ in fotos], lambda i: fotos[i][1])
+
+def seleccionar_candidatos(huellas_f, huellas_r, top_k=CASCADA_TOP_K, umbral=CASCADA_UMBRAL_HASH):
+    """Máscara (F, R): True en las referencias que pasan a CLIP para cada foto"""
+    similitud = similitud_fusionada(huellas_f, huellas_r)
+    mascara = np.zeros(similitud.shape, dtype=bool)
+    if similitud.size == 0:
+        return mascara
+    k = min(top_k, similitud.shape[1])
+    mejores = np.argpartition(-similitud, k - 1, axis=1)[:, :k]
+    np.put_along_axis(mascara, mejores, True, axis=1)
+    return mascara & (similitud >= umbral)
+
+class EstadisticasCascada:
+    """Acumula cuántas comparaciones CLIP se evitaron y, en las requests auditadas, cuánto recall se perdió"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.pares_totales = 0
+        self.pares_clip = 0
+        self.referencias_totales = 0
+        self.referencias_clip = 0
+        self.fotos_auditadas = 0
+        self.top1_conservados = 0
+        self.matches_exhaustivos = 0
+        self.matches_conservados = 0
+
+    def registrar(self, resumen):
+        with self._lock:
+            self.requests += 1
+            self.pares_totales += resumen["pares_totales"]
+            self.pares_clip += resumen["pares_clip"]
+            self.referencias_totales += resumen["referencias_totales"]
+            self.referencias_clip += resumen["referencias_clip"]
+            auditoria = resumen.get("auditoria")
+            if auditoria:
+                self.fotos_auditadas += auditoria["fotos"]
+                self.top1_conservados += auditoria["top1_conservados"]
+                self.matches_exhaustivos += auditoria["matches_exhaustivos"]
+                self.matches_conservados += auditoria["matches_conservados"]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "pares_totales": self.pares_totales,
+                "pares_clip": self.pares_clip,
+                "pares_evitados": self.pares_totales - self.pares_clip,
+                "referencias_descartadas": self.referencias_totales - self.referencias_clip,
+                "fotos_auditadas": self.fotos_auditadas,
+                "recall_top1": round(self.top1_conservados / self.fotos_auditadas, 4) if self.fotos_auditadas else None,
+                "recall_matches": round(self.matches_conservados / self.matches_exhaustivos, 4) if self.matches_exhaustivos else None,
+            }
+
+estadisticas = EstadisticasCascada()
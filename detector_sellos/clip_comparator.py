@@ -1,8 +1,8 @@
 import os
 import torch
 import clip
+import numpy as np
 from PIL import Image
-from sklearn.metrics.pairwise import cosine_similarity
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
@@ -12,7 +12,12 @@ MUESTRAS_DIR = "muestras"
 # Cargar el modelo CLIP
 model, preprocess = clip.load("ViT-B/32", device=DEVICE)
 
-# Embeddings de los vectores (base)
+def normalizar(embedding):
+    """Tensor (1, D) -> vector numpy (D,) de norma 1, para que el producto punto sea la similitud coseno"""
+    v = embedding.cpu().numpy().astype(np.float32).reshape(-1)
+    return v / max(float(np.linalg.norm(v)), 1e-12)
+
+# Embeddings de los vectores (base), normalizados
 vector_embeddings = {}
 for archivo in os.listdir(VECTORES_DIR):
     path = os.path.join(VECTORES_DIR, archivo)
@@ -20,10 +25,13 @@ for archivo in os.listdir(VECTORES_DIR):
         image = preprocess(Image.open(path)).unsqueeze(0).to(DEVICE)
         with torch.no_grad():
             embedding = model.encode_image(image)
-        vector_embeddings[archivo] = embedding
+        vector_embeddings[archivo] = normalizar(embedding)
     except Exception as e:
         print(f"❌ Error con {archivo}: {e}")
 
+nombres_vectores = list(vector_embeddings)
+matriz_vectores = np.stack([vector_embeddings[n] for n in nombres_vectores]) if nombres_vectores else None
+
 # Procesar muestras
 for muestra_nombre in os.listdir(MUESTRAS_DIR):
     path_muestra = os.path.join(MUESTRAS_DIR, muestra_nombre)
@@ -32,15 +40,14 @@ for muestra_nombre in os.listdir(MUESTRAS_DIR):
         with torch.no_grad():
             emb_muestra = model.encode_image(image)
 
-        # Comparar con todos los vectores
+        # Comparar con todos los vectores en un solo producto matriz-vector
         best_score = -1
         best_match = None
-
-        for nombre_vector, emb_vector in vector_embeddings.items():
-            score = cosine_similarity(emb_muestra.cpu().numpy(), emb_vector.cpu().numpy())[0][0]
-            if score > best_score:
-                best_score = score
-                best_match = nombre_vector
+        if matriz_vectores is not None:
+            scores = matriz_vectores @ normalizar(emb_muestra)
+            mejor = int(np.argmax(scores))
+            best_score = float(scores[mejor])
+            best_match = nombres_vectores[mejor]
 
         # Renombrar si el score supera cierto valor
         UMBRAL = 0.25  # con CLIP podés usar 0.2-0.3 como umbral mínimo
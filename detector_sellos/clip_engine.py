@@ -1,56 +1,355 @@
 # clip_engine.py
 
 import os
+import queue
+import threading
+import time
+import numpy as np
 import torch
 from transformers import CLIPProcessor, CLIPModel
 from PIL import Image
-from sklearn.metrics.pairwise import cosine_similarity
+from backends_clip import crear_backend
+from imagenes import decodificar
+from recorte import RECORTE_ACTIVO, proponer_recortes
+from vistas import VISTAS_REFERENCIA, generar_vistas
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-model.to(DEVICE)
+BATCH_SIZE = int(os.environ.get("CLIP_BATCH_SIZE", "16"))  # Imágenes por forward pass
+# Sólo junta algo si hay varias codificaciones a la vez: necesita INFERENCIA_WORKERS > 1 (ver README_API.md)
+MICROBATCH_ACTIVO = os.environ.get("CLIP_MICROBATCH", "0") == "1"
+MICROBATCH_ESPERA_MS = float(os.environ.get("CLIP_MICROBATCH_ESPERA_MS", "5"))
+MICROBATCH_MAX = int(os.environ.get("CLIP_MICROBATCH_MAX", "32"))
+MODEL_ID = "openai/clip-vit-base-patch32"
+# Copia local del modelo (python preparar_modelo.py); si existe se carga sin consultar el hub
+MODEL_PATH = os.environ.get("CLIP_MODEL_PATH", os.path.join("modelos", "clip-vit-base-patch32"))
+DIM = 512  # Dimensión de los embeddings de imagen de ViT-B/32 (projection_dim)
+LADO_ENTRADA = 224  # Lado corto al que el processor lleva las imágenes
+LADO_RECORTES = 4 * LADO_ENTRADA  # Con recorte del sello: un recorte de 1/4 del lado todavía llega a 224 px
+CLIP_BACKEND = os.environ.get("CLIP_BACKEND", "fp32")  # fp32, int8, torchscript u onnx (ver backends_clip.py)
 
-def cargar_vectores(vectores_dir):
-    embeddings = {}
-    for archivo in os.listdir(vectores_dir):
-        path = os.path.join(vectores_dir, archivo)
+# El modelo se carga explícitamente con cargar_modelo() (o la primera vez que se usa), no al importar
+model = None
+processor = None
+backend = None
+tiempos_arranque = {}
+_lock_modelo = threading.Lock()
+
+def cargar_modelo(path=MODEL_PATH, nombre_backend=CLIP_BACKEND):
+    """Carga el modelo, el processor y el backend una sola vez. Prefiere la copia local; si no existe usa el hub"""
+    global model, processor, backend
+    with _lock_modelo:
+        if model is not None:
+            return model, processor
+        inicio = time.perf_counter()
+        if os.path.isdir(path):
+            origen = path
+            kwargs = {"local_files_only": True}
+        else:
+            print(f"⚠️ No existe {path}, descargando {MODEL_ID} del hub (correr preparar_modelo.py en el build)")
+            origen = MODEL_ID
+            kwargs = {}
+        nuevo_processor = CLIPProcessor.from_pretrained(origen, **kwargs)
+        nuevo_model = CLIPModel.from_pretrained(origen, **kwargs).to(DEVICE).eval()
+        if nuevo_model.config.projection_dim != DIM:
+            raise RuntimeError(f"El modelo {origen} tiene projection_dim={nuevo_model.config.projection_dim}, se esperaba {DIM}")
+        nuevo_backend = crear_backend(nombre_backend, nuevo_model, DEVICE)
+        model, processor, backend = nuevo_model, nuevo_processor, nuevo_backend
+        tiempos_arranque["carga_s"] = round(time.perf_counter() - inicio, 3)
+        print(f"⏱️ Modelo cargado desde {origen} (backend {nombre_backend}) en {tiempos_arranque['carga_s']}s")
+        return model, processor
+
+def usar_backend(nombre):
+    """Cambia el backend de inferencia sin recargar los pesos (para benchmarks y verificaciones)"""
+    global backend
+    cargar_modelo()
+    with _lock_modelo:
+        backend = crear_backend(nombre, model, DEVICE)
+    return backend
+
+def calentar():
+    """Forward pass de calentamiento para que la primera request real no pague la inicialización"""
+    cargar_modelo()
+    inicio = time.perf_counter()
+    codificar_imagenes([Image.new("RGB", (224, 224), (255, 255, 255))])
+    tiempos_arranque["calentamiento_s"] = round(time.perf_counter() - inicio, 3)
+    print(f"⏱️ Calentamiento en {tiempos_arranque['calentamiento_s']}s")
+
+def configurar_hilos(n):
+    """Fija los hilos intra-op de torch (se llama una vez por worker de inferencia)"""
+    torch.set_num_threads(n)
+
+class Referencias:
+    """Embeddings de referencia L2-normalizados en una única matriz float32 contigua (R * vistas, D).
+
+    Las vistas de cada referencia van en filas consecutivas; el score contra la referencia es el máximo entre ellas.
+    """
+
+    def __init__(self, nombres, matriz, vistas=1):
+        self.nombres = list(nombres)
+        self.vistas = vistas
+        self.matriz = np.ascontiguousarray(
+            np.asarray(matriz, dtype=np.float32).reshape(len(self.nombres) * vistas, DIM)
+        )
+
+    def __len__(self):
+        return len(self.nombres)
+
+    @property
+    def por_vista(self):
+        """La misma matriz vista como (R, vistas, D)"""
+        return self.matriz.reshape(len(self.nombres), self.vistas, DIM)
+
+    def items(self):
+        return zip(self.nombres, self.por_vista if self.vistas > 1 else self.matriz)
+
+    def subconjunto(self, posiciones):
+        """Referencias con sólo las de esas posiciones (y todas sus vistas)"""
+        return Referencias([self.nombres[j] for j in posiciones], self.por_vista[posiciones], self.vistas)
+
+def normalizar(embs):
+    """Normaliza cada fila a norma L2 = 1 (float32, contiguo)"""
+    embs = np.asarray(embs, dtype=np.float32)
+    normas = np.linalg.norm(embs, axis=-1, keepdims=True)
+    return np.ascontiguousarray(embs / np.maximum(normas, 1e-12))
+
+def _abrir_imagen(imagen):
+    """Devuelve una imagen PIL en RGB a partir de una ruta, de bytes en memoria o de una imagen ya abierta"""
+    # El processor lleva el lado corto a LADO_ENTRADA: no hace falta decodificar la foto a resolución completa
+    return decodificar(imagen, LADO_ENTRADA)
+
+def codificar_imagenes(imagenes, batch_size=BATCH_SIZE):
+    """Calcula los embeddings de N imágenes (rutas, bytes o PIL) en lotes y devuelve un tensor (N, D)"""
+    if model is None:
+        cargar_modelo()
+    bloques = []
+    for inicio in range(0, len(imagenes), batch_size):
+        lote = [_abrir_imagen(im) for im in imagenes[inicio:inicio + batch_size]]
+        pixel_values = processor(images=lote, return_tensors="pt")["pixel_values"].to(DEVICE)
+        bloques.append(backend(pixel_values))
+    if not bloques:
+        return torch.empty((0, DIM), device=DEVICE)
+    return torch.cat(bloques)
+
+class _Trabajo:
+    def __init__(self, imagenes):
+        self.imagenes = imagenes
+        self.encolado = time.monotonic()
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+
+class MicroBatcher:
+    """Junta trabajos de codificación de requests concurrentes y los corre como un único batch.
+
+    Espera como mucho `espera_ms` desde el primer trabajo o hasta juntar `max_batch` imágenes.
+    """
+
+    def __init__(self, codificar, espera_ms=MICROBATCH_ESPERA_MS, max_batch=MICROBATCH_MAX):
+        self.codificar = codificar
+        self.espera = espera_ms / 1000.0
+        self.max_batch = max_batch
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.imagenes = 0
+        self.trabajos = 0
+        self.max_imagenes_batch = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._loop, name="clip-microbatch", daemon=True)
+                self._hilo.start()
+
+    def encolar(self, imagenes):
+        """Bloquea hasta que el batch que contiene estas imágenes termina. Devuelve un tensor (N, D)"""
+        if not imagenes:
+            return self.codificar([])
+        self._arrancar()
+        trabajo = _Trabajo(imagenes)
+        self._cola.put(trabajo)
+        trabajo.listo.wait()
+        if trabajo.error is not None:
+            raise trabajo.error
+        return trabajo.resultado
+
+    def _juntar(self):
+        lote = [self._cola.get()]
+        total = len(lote[0].imagenes)
+        limite = time.monotonic() + self.espera
+        while total < self.max_batch:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                trabajo = self._cola.get(timeout=restante)
+            except queue.Empty:
+                break
+            lote.append(trabajo)
+            total += len(trabajo.imagenes)
+        return lote
+
+    def _loop(self):
+        while True:
+            lote = self._juntar()
+            inicio = time.monotonic()
+            imagenes = [im for trabajo in lote for im in trabajo.imagenes]
+            try:
+                embs = self.codificar(imagenes, max(self.max_batch, BATCH_SIZE))
+                desde = 0
+                for trabajo in lote:
+                    trabajo.resultado = embs[desde:desde + len(trabajo.imagenes)]
+                    desde += len(trabajo.imagenes)
+            except Exception as e:
+                for trabajo in lote:
+                    trabajo.error = e
+            with self._lock:
+                self.batches += 1
+                self.trabajos += len(lote)
+                self.imagenes += len(imagenes)
+                self.max_imagenes_batch = max(self.max_imagenes_batch, len(imagenes))
+                for trabajo in lote:
+                    espera = inicio - trabajo.encolado
+                    self.espera_total += espera
+                    self.espera_max = max(self.espera_max, espera)
+            for trabajo in lote:
+                trabajo.listo.set()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "trabajos": self.trabajos,
+                "imagenes": self.imagenes,
+                "imagenes_por_batch": round(self.imagenes / self.batches, 2) if self.batches else 0.0,
+                "max_imagenes_batch": self.max_imagenes_batch,
+                "espera_media_ms": round(1000 * self.espera_total / self.trabajos, 2) if self.trabajos else 0.0,
+                "espera_max_ms": round(1000 * self.espera_max, 2),
+                "en_cola": self._cola.qsize(),
+            }
+
+microbatcher = MicroBatcher(codificar_imagenes)
+
+def codificar_normalizado(imagenes, batch_size=BATCH_SIZE):
+    """Igual que codificar_imagenes pero devuelve una matriz numpy (N, D) normalizada.
+
+    Si el micro-batching está activo, el trabajo se combina con el de otras requests concurrentes.
+    """
+    if MICROBATCH_ACTIVO:
+        embs = microbatcher.encolar([_abrir_imagen(im) for im in imagenes])
+    else:
+        embs = codificar_imagenes(imagenes, batch_size)
+    return normalizar(embs.cpu().numpy())
+
+def _abrir_validas(items):
+    # Abrimos cada archivo por separado para que uno roto no tire abajo el lote entero
+    validos, imagenes = [], []
+    for clave, imagen in items:
         try:
-            image = Image.open(path)
-            inputs = processor(images=image, return_tensors="pt").to(DEVICE)
-            with torch.no_grad():
-                emb = model.get_image_features(**inputs)
-            embeddings[archivo] = emb
+            imagenes.append(_abrir_imagen(imagen))
+            validos.append(clave)
         except Exception as e:
-            print(f"❌ Error con {archivo}: {e}")
-    return embeddings
+            print(f"❌ Error con {clave}: {e}")
+    return validos, imagenes
+
+def codificar_referencias(nombres, imagenes, vistas=VISTAS_REFERENCIA):
+    """Referencias con todas las vistas de cada imagen, codificadas en un solo batch"""
+    embs = codificar_normalizado([vista for im in imagenes for vista in generar_vistas(im, vistas)])
+    return Referencias(nombres, embs, len(vistas))
+
+def _cargar_embeddings(nombres_y_paths):
+    nombres, imagenes = _abrir_validas(nombres_y_paths)
+    return codificar_referencias(nombres, imagenes)
+
+def cargar_vectores(vectores_dir):
+    return _cargar_embeddings(
+        (archivo, os.path.join(vectores_dir, archivo)) for archivo in os.listdir(vectores_dir)
+    )
 
 def cargar_vectores_desde_archivos(lista_archivos):
-    embeddings = {}
-    for path in lista_archivos:
-        nombre = os.path.basename(path)
+    return _cargar_embeddings((os.path.basename(path), path) for path in lista_archivos)
+
+def como_referencias(embeddings_base):
+    """Acepta Referencias o un dict nombre -> embedding (tensor o array) y devuelve Referencias"""
+    if isinstance(embeddings_base, Referencias):
+        return embeddings_base
+    nombres = list(embeddings_base.keys())
+    filas = [
+        emb.detach().cpu().numpy().reshape(-1) if isinstance(emb, torch.Tensor) else np.asarray(emb).reshape(-1)
+        for emb in embeddings_base.values()
+    ]
+    if not filas:
+        return Referencias([], np.empty((0, DIM), dtype=np.float32))
+    return Referencias(nombres, normalizar(np.stack(filas)))
+
+def calcular_scores(embs_muestras, referencias):
+    """Similitud coseno de todas las muestras contra todas las referencias en un solo matmul -> (P, R)"""
+    scores = embs_muestras @ referencias.matriz.T
+    if referencias.vistas > 1:
+        scores = scores.reshape(len(scores), len(referencias), referencias.vistas).max(axis=2)
+    return scores
+
+def ordenar_scores(scores, top_k=None):
+    """Índices de referencias ordenados por score descendente para cada fila -> (P, k)"""
+    if top_k is not None and top_k < scores.shape[1]:
+        candidatos = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        orden = np.argsort(-np.take_along_axis(scores, candidatos, axis=1), axis=1)
+        return np.take_along_axis(candidatos, orden, axis=1)
+    return np.argsort(-scores, axis=1)
+
+def codificar_muestras(muestras):
+    """Devuelve (validas, embs): índices de las muestras que se pudieron leer y sus embeddings normalizados"""
+    validas, imagenes = _abrir_validas(enumerate(muestras))
+    return validas, codificar_normalizado(imagenes)
+
+def codificar_recortes(muestras):
+    """(validas, embs, inicios): la foto completa y los recortes del sello de cada muestra, todos en un mismo batch.
+
+    Las filas de la muestra validas[k] empiezan en inicios[k] y terminan donde empieza la siguiente.
+    """
+    validas, imagenes, inicios = [], [], []
+    for i, muestra in enumerate(muestras):
         try:
-            image = Image.open(path)
-            inputs = processor(images=image, return_tensors="pt").to(DEVICE)
-            with torch.no_grad():
-                emb = model.get_image_features(**inputs)
-            embeddings[nombre] = emb
+            recortes = proponer_recortes(decodificar(muestra, LADO_RECORTES))
         except Exception as e:
-            print(f"❌ Error con {nombre}: {e}")
-    return embeddings
+            print(f"❌ Error con {i}: {e}")
+            continue
+        validas.append(i)
+        inicios.append(len(imagenes))
+        imagenes.extend(recortes)
+    return validas, codificar_normalizado(imagenes), np.array(inicios, dtype=np.intp)
+
+def matriz_scores(muestras, embeddings_base, recortes=RECORTE_ACTIVO):
+    """Codifica las muestras y devuelve (validas, scores): índices de muestras leídas y matriz (len(validas), R).
+
+    Con recortes=True cada muestra se queda, para cada referencia, con el mejor score entre la foto y sus recortes.
+    """
+    referencias = como_referencias(embeddings_base)
+    if not recortes:
+        validas, embs = codificar_muestras(muestras)
+        return validas, calcular_scores(embs, referencias)
+    validas, embs, inicios = codificar_recortes(muestras)
+    scores = calcular_scores(embs, referencias)
+    if not validas:
+        return validas, scores
+    return validas, np.maximum.reduceat(scores, inicios, axis=0)
+
+def comparar_muestras(muestras, embeddings_base, top_k=None, recortes=RECORTE_ACTIVO):
+    """Compara varias muestras (rutas, bytes o PIL) contra la base. Devuelve una lista de resultados por muestra"""
+    referencias = como_referencias(embeddings_base)
+    validas, scores = matriz_scores(muestras, referencias, recortes)
+    orden = ordenar_scores(scores, top_k)
+    resultados = [[] for _ in muestras]
+    for fila, i in enumerate(validas):
+        resultados[i] = [(referencias.nombres[j], float(scores[fila, j])) for j in orden[fila]]
+    return resultados
 
-def comparar_muestra(path_muestra, embeddings_base):
+def comparar_muestra(path_muestra, embeddings_base, recortes=RECORTE_ACTIVO):
     try:
-        image = Image.open(path_muestra)
-        inputs = processor(images=image, return_tensors="pt").to(DEVICE)
-        with torch.no_grad():
-            emb_muestra = model.get_image_features(**inputs)
-        resultados = []
-        for nombre_vector, emb_vector in embeddings_base.items():
-            score = cosine_similarity(emb_muestra.cpu().numpy(), emb_vector.cpu().numpy())[0][0]
-            resultados.append((nombre_vector, score))
-        resultados.sort(key=lambda x: x[1], reverse=True)
-        return resultados  # lista de (nombre_vector, score)
+        return comparar_muestras([path_muestra], embeddings_base, recortes=recortes)[0]  # lista de (nombre_vector, score)
     except Exception as e:
         print(f"❌ Error comparando {path_muestra}: {e}")
         return []
@@ -0,0 +1,145 @@
+# descriptores_sift.py
+"""Extracción de keypoints/descriptores SIFT con cache e índice FLANN reutilizable para el matcher de OpenCV.
+
+- Los descriptores de cada imagen se calculan una sola vez: se guardan en memoria y en disco (SIFT_CACHE_DIR)
+  con la misma clave de contenido que el cache de embeddings. Cada keypoint se serializa como una fila numpy
+  (x, y, size, angle, response, octave, class_id) seguida de su descriptor de 128 floats.
+- IndiceSIFT junta los descriptores de todas las referencias en un único índice FLANN (kd-trees), entrenado una
+  vez. Cada foto se extrae una vez y se busca contra todas las referencias en una sola consulta kNN.
+"""
+
+import os
+import threading
+import cv2
+import numpy as np
+from cache_embeddings import CacheEmbeddings, clave_contenido
+
+SIFT_CACHE_DIR = os.environ.get("SIFT_CACHE_DIR", "cache_sift")
+SIFT_KNN = int(os.environ.get("SIFT_KNN", "8"))  # Vecinos pedidos al índice global por descriptor de la foto
+SIFT_CHECKS = int(os.environ.get("SIFT_CHECKS", "64"))
+RATIO_LOWE = 0.75
+CAMPOS_PUNTO = 7  # x, y, size, angle, response, octave, class_id
+DIM_SIFT = 128
+VERSION = "sift-v1"  # Cambiarla invalida el cache si cambian los parámetros de extracción
+
+_local = threading.local()
+
+def _sift():
+    # cv2.SIFT no es thread-safe: una instancia por hilo, creada una sola vez
+    if not hasattr(_local, "sift"):
+        _local.sift = cv2.SIFT_create()
+    return _local.sift
+
+def serializar_puntos(keypoints):
+    """Lista de cv2.KeyPoint -> array (N, CAMPOS_PUNTO) float32"""
+    return np.array(
+        [(k.pt[0], k.pt[1], k.size, k.angle, k.response, k.octave, k.class_id) for k in keypoints], dtype=np.float32
+    ).reshape(-1, CAMPOS_PUNTO)
+
+def deserializar_puntos(puntos):
+    """Array (N, CAMPOS_PUNTO) -> lista de cv2.KeyPoint"""
+    return [
+        cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave), int(class_id))
+        for x, y, size, angle, response, octave, class_id in puntos
+    ]
+
+def extraer(img):
+    """(puntos (N, CAMPOS_PUNTO), descriptores (N, 128)) de una imagen en escala de grises, sin cache"""
+    keypoints, descriptores = _sift().detectAndCompute(img, None)
+    if descriptores is None:
+        return np.empty((0, CAMPOS_PUNTO), dtype=np.float32), np.empty((0, DIM_SIFT), dtype=np.float32)
+    return serializar_puntos(keypoints), np.ascontiguousarray(descriptores, dtype=np.float32)
+
+class CacheDescriptores:
+    """Descriptores por contenido de la imagen preprocesada, en memoria y en disco"""
+
+    def __init__(self, directorio=SIFT_CACHE_DIR):
+        self._cache = CacheEmbeddings(directorio=directorio)
+
+    def extraer(self, img):
+        clave = clave_contenido(np.ascontiguousarray(img).tobytes(), img.shape, VERSION)
+        guardado = self._cache.obtener(clave)
+        if guardado is None:
+            puntos, descriptores = extraer(img)
+            guardado = np.hstack([puntos, descriptores])
+            self._cache.guardar(clave, guardado)
+        return guardado[:, :CAMPOS_PUNTO], np.ascontiguousarray(guardado[:, CAMPOS_PUNTO:])
+
+    def estadisticas(self):
+        return self._cache.estadisticas()
+
+def score_homografia(src_pts, dst_pts):
+    """Porcentaje de inliers de la homografía RANSAC entre los puntos emparejados (0 con menos de 4)"""
+    if len(src_pts) < 4:
+        return 0.0
+    M, mask = cv2.findHomography(
+        np.float32(src_pts).reshape(-1, 1, 2), np.float32(dst_pts).reshape(-1, 1, 2), cv2.RANSAC, 5.0
+    )
+    if mask is None:
+        return 0.0
+    return float(np.sum(mask)) / len(mask)
+
+class IndiceSIFT:
+    """Índice FLANN único sobre los descriptores de todas las referencias"""
+
+    def __init__(self, nombres, puntos, descriptores):
+        """nombres: lista de R nombres; puntos/descriptores: listas de R arrays por referencia"""
+        self.nombres = list(nombres)
+        self.cantidades = np.array([len(d) for d in descriptores], dtype=np.int64)
+        self.duenio = np.repeat(np.arange(len(self.nombres)), self.cantidades)  # referencia de cada descriptor
+        self.puntos = np.vstack(puntos)[:, :2] if len(puntos) else np.empty((0, 2), dtype=np.float32)
+        todos = np.vstack(descriptores) if len(descriptores) else np.empty((0, DIM_SIFT), dtype=np.float32)
+        self._flann = None
+        if len(todos):
+            self._flann = cv2.flann_Index(np.ascontiguousarray(todos, dtype=np.float32), dict(algorithm=1, trees=5))
+
+    @classmethod
+    def desde_imagenes(cls, referencias, cache=None):
+        """referencias: lista de (nombre, imagen preprocesada). Usa el cache de descriptores si se pasa"""
+        extraer_ref = cache.extraer if cache is not None else extraer
+        nombres, puntos, descriptores = [], [], []
+        for nombre, img in referencias:
+            p, d = extraer_ref(img)
+            nombres.append(nombre)
+            puntos.append(p)
+            descriptores.append(d)
+        return cls(nombres, puntos, descriptores)
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def puntuar(self, img, knn=SIFT_KNN, checks=SIFT_CHECKS):
+        """Score (porcentaje de inliers, como compare_images) de la imagen contra cada referencia -> array (R,)"""
+        puntos_foto, descriptores = extraer(img)
+        return self.puntuar_descriptores(puntos_foto, descriptores, knn, checks)
+
+    def puntuar_descriptores(self, puntos_foto, descriptores, knn=SIFT_KNN, checks=SIFT_CHECKS):
+        scores = np.zeros(len(self), dtype=np.float64)
+        if self._flann is None or len(descriptores) == 0:
+            return scores
+        knn = min(knn, len(self.duenio))
+        indices, distancias = self._flann.knnSearch(descriptores, knn, params=dict(checks=checks))
+        if knn == 1:
+            # Sin segundo vecino no hay ratio test posible
+            return scores
+        indices = indices.astype(np.int64)
+        distancias = np.sqrt(np.maximum(distancias, 0))  # flann devuelve L2 al cuadrado
+        duenios = self.duenio[indices]
+        # Ratio test de Lowe por referencia: para el primer vecino de cada referencia en la fila, su segundo vecino
+        # es la próxima aparición de esa misma referencia; si no está entre los knn, la distancia del último vecino
+        # es una cota inferior (el test sólo acepta cuando pasa seguro)
+        primero = np.ones(duenios.shape, dtype=bool)
+        segundo = np.repeat(distancias[:, -1:], knn, axis=1)
+        for j in range(knn):
+            for j2 in range(j + 1, knn):
+                misma = duenios[:, j2] == duenios[:, j]
+                primero[:, j2] &= ~misma
+                segundo[:, j] = np.where(misma, np.minimum(segundo[:, j], distancias[:, j2]), segundo[:, j])
+        buenos = primero & (distancias < RATIO_LOWE * segundo)
+        filas, columnas = np.nonzero(buenos)
+        destino = indices[filas, columnas]
+        duenio_bueno = duenios[filas, columnas]
+        for r in np.unique(duenio_bueno):
+            sel = duenio_bueno == r
+            scores[r] = score_homografia(puntos_foto[filas[sel], :2], self.puntos[destino[sel]])
+        return scores
@@ -0,0 +1,86 @@
+# ejecutor.py
+
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.responses import JSONResponse
+
+INFERENCIA_WORKERS = int(os.environ.get("INFERENCIA_WORKERS", "1"))
+INFERENCIA_MAX_COLA = int(os.environ.get("INFERENCIA_MAX_COLA", "8"))  # Requests esperando además de las que corren
+RETRY_AFTER = int(os.environ.get("INFERENCIA_RETRY_AFTER", "5"))  # Segundos sugeridos al cliente en un 503
+
+def hilos_por_worker(workers=INFERENCIA_WORKERS):
+    """Hilos intra-op por worker para que workers concurrentes no sobresuscriban los núcleos"""
+    por_defecto = max(1, (os.cpu_count() or 1) // max(1, workers))
+    return int(os.environ.get("TORCH_THREADS", str(por_defecto)))
+
+class ColaSaturada(Exception):
+    """La cola de inferencia está llena; el cliente debe reintentar más tarde"""
+
+class EjecutorInferencia:
+    """Pool de hilos dedicado a trabajo CPU con una cola de admisión acotada"""
+
+    def __init__(self, workers=INFERENCIA_WORKERS, max_cola=INFERENCIA_MAX_COLA, inicializador=None):
+        self.workers = workers
+        self.max_cola = max_cola
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="inferencia", initializer=inicializador
+        )
+        self._admision = threading.BoundedSemaphore(workers + max_cola)
+        self._lock = threading.Lock()
+        self.admitidas = 0
+        self.rechazadas = 0
+        self.en_sistema = 0
+
+    def _ejecutar_y_liberar(self, fn):
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self.en_sistema -= 1
+            self._admision.release()
+
+    def enviar(self, fn, *args, **kwargs):
+        """Encola fn en el pool o lanza ColaSaturada si no hay lugar. Devuelve un Future"""
+        if not self._admision.acquire(blocking=False):
+            with self._lock:
+                self.rechazadas += 1
+            raise ColaSaturada()
+        with self._lock:
+            self.admitidas += 1
+            self.en_sistema += 1
+        try:
+            return self._pool.submit(self._ejecutar_y_liberar, functools.partial(fn, *args, **kwargs))
+        except Exception:
+            with self._lock:
+                self.en_sistema -= 1
+            self._admision.release()
+            raise
+
+    async def ejecutar(self, fn, *args, **kwargs):
+        """Ejecuta fn fuera del event loop y espera su resultado"""
+        return await asyncio.wrap_future(self.enviar(fn, *args, **kwargs))
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_cola": self.max_cola,
+                "en_sistema": self.en_sistema,
+                "en_cola": max(0, self.en_sistema - self.workers),
+                "admitidas": self.admitidas,
+                "rechazadas": self.rechazadas,
+            }
+
+    def cerrar(self):
+        self._pool.shutdown(wait=False)
+
+def respuesta_saturada(request, exc):
+    """Handler de FastAPI para ColaSaturada: 503 con Retry-After"""
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": "Servidor ocupado, reintentar más tarde"},
+        headers={"Retry-After": str(RETRY_AFTER)},
+    )
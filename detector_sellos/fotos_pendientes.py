@@ -0,0 +1,179 @@
+# fotos_pendientes.py
+"""Fotos del taller que todavía no tienen pedido, guardadas en el servidor (sólo sus embeddings, no las imágenes).
+
+Cuando se da de alta un pedido (PUT /referencias/{pedido_id}) su vector se puntúa contra todas las fotos
+pendientes en un solo matmul y los pares sobre el umbral quedan como candidatos, que el front consulta por
+polling (GET /pendientes/candidatos?desde=<cursor>) en lugar de volver a subir las fotos.
+
+Un candidato que deja de serlo (el pedido cambió y el score quedó bajo el umbral, se dio de baja el pedido o se
+sacó la foto) no se borra sin más: se reescribe con cursor nuevo y eliminado=1, así el cliente que consulta por
+cursor se entera y lo descarta. Esas bajas se guardan PENDIENTES_RETENCION_HORAS; un cliente que pasó más
+tiempo sin consultar tiene que volver a empezar desde cursor 0.
+"""
+
+import os
+import time
+import threading
+import numpy as np
+from clip_engine import DIM
+from base_datos import conectar
+
+PENDIENTES_DB = os.environ.get("PENDIENTES_DB", "fotos_pendientes.sqlite3")
+PENDIENTES_UMBRAL = float(os.environ.get("PENDIENTES_UMBRAL", "0.25"))  # Score mínimo para proponer un candidato
+PENDIENTES_RETENCION_HORAS = float(os.environ.get("PENDIENTES_RETENCION_HORAS", "24"))  # Cuánto se guardan las bajas
+
+class AlmacenPendientes:
+    """Embeddings de fotos pendientes y candidatos (foto, pedido, score) persistidos en SQLite.
+
+    En memoria se mantiene la matriz de todas las fotos (P, N, D), con N = foto completa + recortes. Se reconstruye
+    cuando cambia la tabla, aunque el cambio lo haya hecho otro worker.
+    """
+
+    def __init__(self, path=PENDIENTES_DB, retencion_horas=PENDIENTES_RETENCION_HORAS):
+        self.path = path
+        self.retencion = retencion_horas * 3600
+        self._lock = threading.Lock()
+        self._instantanea = (None, None)  # (firma de la tabla, (ids, matriz))
+        with conectar(self.path) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS pendientes (
+                    foto_id TEXT PRIMARY KEY,
+                    nombre TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    agregada REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS candidatos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    foto_id TEXT NOT NULL,
+                    pedido_id TEXT NOT NULL,
+                    svg TEXT NOT NULL,
+                    score REAL NOT NULL,
+                    creado REAL NOT NULL,
+                    eliminado INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (foto_id, pedido_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_candidatos_pedido ON candidatos (pedido_id);
+            """)
+            # Bases creadas antes de que hubiera registros de baja
+            if "eliminado" not in {fila[1] for fila in con.execute("PRAGMA table_info(candidatos)")}:
+                con.execute("ALTER TABLE candidatos ADD COLUMN eliminado INTEGER NOT NULL DEFAULT 0")
+
+    def agregar(self, foto_id, nombre, embedding):
+        """Alta (o reemplazo) de una foto pendiente con sus embeddings (D,) o (N, D)"""
+        emb = np.ascontiguousarray(embedding, dtype=np.float32).reshape(-1, DIM)
+        with conectar(self.path) as con:
+            con.execute(
+                "INSERT OR REPLACE INTO pendientes (foto_id, nombre, embedding, agregada) VALUES (?, ?, ?, ?)",
+                (foto_id, nombre, emb.tobytes(), time.time()),
+            )
+
+    def borrar(self, foto_id):
+        """Saca una foto (por ejemplo, porque ya se asignó) y da de baja sus candidatos. True si estaba"""
+        with conectar(self.path) as con:
+            borradas = con.execute("DELETE FROM pendientes WHERE foto_id = ?", (foto_id,)).rowcount
+            self._reemplazar(con, "foto_id", foto_id, [])
+        return borradas > 0
+
+    def borrar_pedido(self, pedido_id):
+        """Los candidatos de un pedido que se dio de baja dejan de tener sentido"""
+        with conectar(self.path) as con:
+            self._reemplazar(con, "pedido_id", pedido_id, [])
+
+    def _reemplazar(self, con, columna, valor, filas):
+        """Deja como candidatos vigentes de `columna = valor` exactamente `filas` [(foto_id, pedido_id, svg, score)].
+
+        Los vigentes que no están en `filas` se reescriben como bajas (cursor nuevo, eliminado=1, último score).
+        """
+        ahora = time.time()
+        # Todo lo que se escribe desde acá tiene id mayor que el corte (AUTOINCREMENT no reutiliza ids)
+        (corte,) = con.execute("SELECT COALESCE(MAX(id), 0) FROM candidatos").fetchone()
+        con.executemany(
+            "INSERT OR REPLACE INTO candidatos (foto_id, pedido_id, svg, score, creado, eliminado) "
+            "VALUES (?, ?, ?, ?, ?, 0)",
+            [(foto_id, pedido_id, svg, score, ahora) for foto_id, pedido_id, svg, score in filas],
+        )
+        con.execute(
+            "INSERT OR REPLACE INTO candidatos (foto_id, pedido_id, svg, score, creado, eliminado) "
+            f"SELECT foto_id, pedido_id, svg, score, ?, 1 FROM candidatos WHERE {columna} = ? AND eliminado = 0 AND id <= ?",
+            (ahora, valor, corte),
+        )
+        con.execute("DELETE FROM candidatos WHERE eliminado = 1 AND creado < ?", (ahora - self.retencion,))
+
+    def listar(self):
+        with conectar(self.path) as con:
+            return [
+                {"foto_id": foto_id, "nombre": nombre, "agregada": agregada, "candidatos": candidatos}
+                for foto_id, nombre, agregada, candidatos in con.execute("""
+                    SELECT p.foto_id, p.nombre, p.agregada, COUNT(c.id)
+                    FROM pendientes p LEFT JOIN candidatos c ON c.foto_id = p.foto_id AND c.eliminado = 0
+                    GROUP BY p.foto_id ORDER BY p.agregada
+                """)
+            ]
+
+    def __len__(self):
+        with conectar(self.path) as con:
+            return con.execute("SELECT COUNT(*) FROM pendientes").fetchone()[0]
+
+    def _matriz(self):
+        """(ids, matriz (P, N, D)) de las fotos pendientes, reconstruida sólo si la tabla cambió"""
+        with conectar(self.path) as con:
+            con.execute("BEGIN")  # Firma y filas de la misma foto de la base
+            firma = con.execute("SELECT COUNT(*), MAX(agregada) FROM pendientes").fetchone()
+            with self._lock:
+                if self._instantanea[0] == firma:
+                    return self._instantanea[1]
+            filas = con.execute("SELECT foto_id, embedding FROM pendientes ORDER BY foto_id").fetchall()
+        por_foto = [np.frombuffer(emb, dtype=np.float32).reshape(-1, DIM) for _, emb in filas]
+        # Fotos con distinta cantidad de recortes: se completan repitiendo sus propias filas (no cambia el máximo)
+        n = max((len(e) for e in por_foto), default=1)
+        matriz = np.empty((len(filas), n, DIM), dtype=np.float32)
+        for i, e in enumerate(por_foto):
+            matriz[i] = np.resize(e, (n, DIM))
+        instantanea = ([foto_id for foto_id, _ in filas], matriz)
+        with self._lock:
+            self._instantanea = (firma, instantanea)
+        return instantanea
+
+    def puntuar_referencia(self, pedido_id, svg, embedding, umbral=PENDIENTES_UMBRAL):
+        """Puntúa un pedido nuevo (o actualizado) contra todas las fotos pendientes de una vez.
+
+        Reemplaza los candidatos del pedido (los que quedaron bajo el umbral se dan de baja) y devuelve los nuevos
+        [{"foto_id", "score"}], de mayor a menor score.
+        """
+        ids, matriz = self._matriz()
+        vistas = np.asarray(embedding, dtype=np.float32).reshape(-1, DIM)
+        if ids:
+            # (P * N, D) @ (D, vistas) -> máximo sobre los recortes de cada foto y las vistas del pedido
+            scores = (matriz.reshape(-1, DIM) @ vistas.T).reshape(len(ids), -1).max(axis=1)
+        else:
+            scores = np.empty(0, dtype=np.float32)
+        elegidas = np.flatnonzero(scores >= umbral)
+        elegidas = elegidas[np.argsort(-scores[elegidas])]
+        with conectar(self.path) as con:
+            self._reemplazar(con, "pedido_id", pedido_id, [(ids[i], pedido_id, svg, float(scores[i])) for i in elegidas])
+        return [{"foto_id": ids[i], "score": float(scores[i])} for i in elegidas]
+
+    def guardar_candidatos(self, foto_id, pares):
+        """Reemplaza los candidatos de una foto por pares [(pedido_id, svg, score)]; los que sobran se dan de baja"""
+        with conectar(self.path) as con:
+            self._reemplazar(con, "foto_id", foto_id, [(foto_id, pedido_id, svg, score) for pedido_id, svg, score in pares])
+
+    def candidatos(self, desde=0, limite=500):
+        """(candidatos con cursor > desde, en orden de creación; cursor para la próxima consulta).
+
+        Un par que se vuelve a puntuar (pedido actualizado) reaparece con cursor nuevo y su score actual; uno que
+        dejó de ser candidato reaparece con eliminado=True (y "foto" None si la foto ya no está pendiente).
+        """
+        with conectar(self.path) as con:
+            filas = con.execute("""
+                SELECT c.id, c.foto_id, p.nombre, c.pedido_id, c.svg, c.score, c.creado, c.eliminado
+                FROM candidatos c LEFT JOIN pendientes p ON p.foto_id = c.foto_id
+                WHERE c.id > ? ORDER BY c.id LIMIT ?
+            """, (desde, limite)).fetchall()
+        candidatos = [
+            {"cursor": id_, "foto_id": foto_id, "foto": nombre, "pedido_id": pedido_id, "svg": svg,
+             "score": score, "creado": creado, "eliminado": bool(eliminado)}
+            for id_, foto_id, nombre, pedido_id, svg, score, creado, eliminado in filas
+        ]
+        return candidatos, (filas[-1][0] if filas else desde)
@@ -0,0 +1,121 @@
+# huellas.py
+"""Huellas perceptuales baratas para comparar fotos de sellos contra sus diseños.
+
+Cada imagen se decodifica una sola vez a una miniatura en gris de 32x32 y de ahí salen, en lote con numpy,
+tres hashes de 64 bits empaquetados en uint64:
+
+- ahash: promedio 8x8 contra la media (el hash histórico del servidor)
+- dhash: signo del gradiente horizontal entre celdas vecinas (8x9 -> 8x8)
+- phash: coeficientes DCT de baja frecuencia (8x8) contra su mediana
+
+La similitud final es una suma ponderada de la fracción de bits iguales de cada hash (HUELLA_PESOS).
+
+No hay wHash: con Haar, sacar la componente continua y quedarse con la banda LL de nivel 2 es el promedio 8x8
+menos la media de la imagen, o sea el mismo aHash cortado en la mediana; no agrega información.
+"""
+
+import os
+import numpy as np
+from PIL import Image
+from imagenes import decodificar
+
+HASHES = ("ahash", "dhash", "phash")
+BITS_HASH = 64
+LADO = 32  # Lado de la miniatura de la que salen todos los hashes
+PESOS_DEFAULT = "ahash:0.15,dhash:0.35,phash:0.5"
+
+# Cantidad de bits en 1 de cada byte, para el popcount cuando numpy no trae bitwise_count (< 2.0)
+_BITS_POR_BYTE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+def parsear_pesos(texto):
+    """'dhash:0.3,phash:0.7' -> vector de pesos alineado con HASHES (los que no figuran valen 0)"""
+    pesos = dict.fromkeys(HASHES, 0.0)
+    for parte in filter(None, (p.strip() for p in texto.split(","))):
+        nombre, _, valor = parte.partition(":")
+        if nombre not in pesos:
+            raise ValueError(f"Hash desconocido en los pesos: {nombre} (opciones: {', '.join(HASHES)})")
+        pesos[nombre] = float(valor)
+    vector = np.array([pesos[h] for h in HASHES], dtype=np.float64)
+    if vector.sum() <= 0:
+        raise ValueError("Los pesos de las huellas tienen que sumar más que 0")
+    return vector / vector.sum()
+
+PESOS = parsear_pesos(os.environ.get("HUELLA_PESOS", PESOS_DEFAULT))
+
+def _matriz_promedio(salida, entrada):
+    """Matriz (salida, entrada) que promedia por área, para reducir con un producto de matrices"""
+    bordes = np.linspace(0, entrada, salida + 1)
+    m = np.zeros((salida, entrada), dtype=np.float32)
+    for i in range(salida):
+        for j in range(entrada):
+            m[i, j] = max(0.0, min(bordes[i + 1], j + 1) - max(bordes[i], j))
+    return m / m.sum(axis=1, keepdims=True)
+
+def _matriz_dct(n):
+    """DCT-II ortonormal (n, n)"""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m.astype(np.float32)
+
+_PROMEDIO_8 = _matriz_promedio(8, LADO)
+_PROMEDIO_9 = _matriz_promedio(9, LADO)
+_DCT = _matriz_dct(LADO)
+
+def miniatura(imagen, lado=LADO):
+    """Decodifica una vez (ruta, bytes o PIL) y devuelve la miniatura en gris (lado, lado) float32"""
+    # Se decodifica a ~4x el lado final (en JPEG, escalado DCT) y el LANCZOS hace el resto
+    img = decodificar(imagen, lado * 4, "L")
+    return np.asarray(img.resize((lado, lado), Image.Resampling.LANCZOS), dtype=np.float32)
+
+def _empaquetar(bits):
+    """(N, 8, 8) bool -> (N,) uint64"""
+    return np.packbits(bits.reshape(len(bits), 64), axis=1).view(">u8")[:, 0].astype(np.uint64)
+
+def _mayor_que_mediana(valores, excluir_primero=False):
+    planos = valores.reshape(len(valores), -1)
+    referencia = planos[:, 1:] if excluir_primero else planos
+    return valores > np.median(referencia, axis=1)[:, None, None]
+
+def calcular_huellas(miniaturas):
+    """(N, LADO, LADO) -> (N, len(HASHES)) uint64, columnas en el orden de HASHES"""
+    x = np.asarray(miniaturas, dtype=np.float32).reshape(-1, LADO, LADO)
+    if len(x) == 0:
+        return np.empty((0, len(HASHES)), dtype=np.uint64)
+    promedio = _PROMEDIO_8 @ x @ _PROMEDIO_8.T  # (N, 8, 8)
+    ahash = promedio > promedio.mean(axis=(1, 2), keepdims=True)
+    ancho = _PROMEDIO_8 @ x @ _PROMEDIO_9.T  # (N, 8, 9)
+    dhash = ancho[:, :, 1:] > ancho[:, :, :-1]
+    dct = (_DCT @ x @ _DCT.T)[:, :8, :8]
+    phash = _mayor_que_mediana(dct, excluir_primero=True)
+    return np.stack([_empaquetar(b) for b in (ahash, dhash, phash)], axis=1)
+
+def huellas_imagenes(imagenes):
+    """Huellas de una lista de imágenes (ruta, bytes o PIL) -> (N, len(HASHES)) uint64"""
+    return calcular_huellas(np.stack([miniatura(im) for im in imagenes]) if imagenes else [])
+
+def popcount(x):
+    """Bits en 1 de cada elemento uint64"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    return _BITS_POR_BYTE[x.view(np.uint8)].reshape(*x.shape, 8).sum(axis=-1)
+
+def matriz_hamming(hashes_fotos, hashes_refs):
+    """Distancias de Hamming fotos x referencias con un solo XOR + popcount vectorizado"""
+    fotos = np.asarray(hashes_fotos, dtype=np.uint64).reshape(-1, 1)
+    refs = np.asarray(hashes_refs, dtype=np.uint64).reshape(1, -1)
+    return popcount(fotos ^ refs).astype(np.int32)
+
+def similitud_fusionada(huellas_fotos, huellas_refs, pesos=None, bloque=256):
+    """Similitud (0-1) fotos x referencias: promedio ponderado de la fracción de bits iguales de cada hash"""
+    pesos = PESOS if pesos is None else np.asarray(pesos, dtype=np.float64)
+    fotos = np.asarray(huellas_fotos, dtype=np.uint64).reshape(-1, len(HASHES))
+    refs = np.asarray(huellas_refs, dtype=np.uint64).reshape(-1, len(HASHES))
+    similitud = np.empty((len(fotos), len(refs)), dtype=np.float64)
+    # Por bloques de fotos para no armar un (F, R, K) enorme
+    for inicio in range(0, len(fotos), bloque):
+        distancias = popcount(fotos[inicio:inicio + bloque, None, :] ^ refs[None, :, :])
+        similitud[inicio:inicio + bloque] = 1.0 - (distancias @ pesos) / BITS_HASH
+    return similitud
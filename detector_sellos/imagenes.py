@@ -0,0 +1,57 @@
+# imagenes.py
+
+import io
+import os
+import numpy as np
+from PIL import Image, ImageOps
+
+# Modo debug: guardar en disco los PNG intermedios para inspección manual
+GUARDAR_INTERMEDIOS = os.environ.get("GUARDAR_INTERMEDIOS", "0") == "1"
+INTERMEDIOS_DIR = os.environ.get("INTERMEDIOS_DIR", "intermedios")
+
+def fondo_blanco(im):
+    """Si la imagen tiene transparencia la compone sobre fondo blanco. Devuelve siempre RGB"""
+    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+        im = im.convert("RGBA")
+        fondo = Image.new("RGBA", im.size, (255, 255, 255, 255))
+        fondo.alpha_composite(im)
+        return fondo.convert("RGB")
+    return im.convert("RGB")
+
+def decodificar(imagen, lado=None, modo="RGB"):
+    """Abre una foto (ruta, bytes, archivo o PIL) decodificando directo cerca del tamaño que se va a usar.
+
+    Con JPEG, draft hace el escalado en el dominio DCT (1/2, 1/4, 1/8) y el resultado mide al menos `lado` en
+    ambos ejes; así una foto de 12 MP no se descomprime entera para terminar en 224 px. Después se aplica la
+    orientación EXIF y se convierte al modo pedido una sola vez.
+    """
+    if isinstance(imagen, Image.Image):
+        return imagen.convert(modo)
+    if isinstance(imagen, (bytes, bytearray)):
+        imagen = io.BytesIO(imagen)
+    with Image.open(imagen) as im:
+        if lado is not None:
+            im.draft(modo, (lado, lado))
+        return ImageOps.exif_transpose(im).convert(modo)
+
+def decodificar_gris(imagen, lado=None):
+    """Como decodificar, en escala de grises y como array uint8 para OpenCV"""
+    return np.asarray(decodificar(imagen, lado, "L"))
+
+def rasterizar_svg(contenido, tamano=512):
+    """Renderiza los bytes de un SVG en memoria y devuelve una imagen PIL RGB sobre fondo blanco"""
+    # Import acá: cairosvg necesita libcairo, y decodificar fotos (benchmarks, huellas, recortes) no debería
+    import cairosvg
+    png = cairosvg.svg2png(bytestring=contenido, output_width=tamano, output_height=tamano)
+    with Image.open(io.BytesIO(png)) as im:
+        return fondo_blanco(im)
+
+def guardar_intermedio(im, nombre):
+    """Guarda una imagen intermedia sólo si el modo debug está activo"""
+    if not GUARDAR_INTERMEDIOS:
+        return None
+    os.makedirs(INTERMEDIOS_DIR, exist_ok=True)
+    path = os.path.join(INTERMEDIOS_DIR, os.path.basename(nombre) + ".png")
+    im.save(path)
+    print(f"Intermedio guardado en: {path}")
+    return path
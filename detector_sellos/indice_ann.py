@@ -0,0 +1,236 @@
+# indice_ann.py
+"""Índice aproximado (IVF + product quantization) en numpy puro para muchos embeddings CLIP.
+
+- IVF: k-means esférico sobre los embeddings normalizados; cada referencia va a la lista de su centroide.
+- PQ: cada vector se comprime en `m` bytes (un código por subespacio) para el puntaje aproximado.
+- Rescore exacto: los `rescore` mejores candidatos se puntúan con los vectores float32 completos,
+  que quedan en disco y se leen con memmap (no hace falta tenerlos todos en RAM).
+
+`nprobe` es la perilla recall/velocidad: cuántas listas se recorren por consulta.
+
+Uso:
+    python indice_ann.py construir [--db indice_referencias.sqlite3] [--salida indice_ann]
+"""
+
+import os
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from collections import Counter
+import numpy as np
+
+ANN_DIR = os.environ.get("ANN_DIR", "indice_ann")
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", "16"))
+ANN_RESCORE = int(os.environ.get("ANN_RESCORE", "64"))
+ANN_MUESTRA = int(os.environ.get("ANN_MUESTRA", "20000"))  # Vectores usados para entrenar k-means
+DIM = 512  # Embeddings de imagen de CLIP ViT-B/32 (para separar las vistas guardadas en la base)
+
+def _normalizar(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+def kmeans(datos, k, iteraciones=20, semilla=0, esferico=True):
+    """Lloyd en numpy. Con esferico=True los centroides se renormalizan (similitud coseno)"""
+    rng = np.random.default_rng(semilla)
+    k = min(k, len(datos))
+    centroides = datos[rng.choice(len(datos), k, replace=False)].copy()
+    for _ in range(iteraciones):
+        asignacion = _asignar(datos, centroides, esferico)
+        sumas = np.zeros_like(centroides)
+        np.add.at(sumas, asignacion, datos)
+        cuentas = np.bincount(asignacion, minlength=k)
+        vacios = cuentas == 0
+        # Los centroides vacíos se resiembran con puntos al azar
+        sumas[vacios] = datos[rng.choice(len(datos), int(vacios.sum()))]
+        cuentas[vacios] = 1
+        centroides = sumas / cuentas[:, None]
+        if esferico:
+            centroides = _normalizar(centroides)
+    return centroides.astype(np.float32), asignacion
+
+def _asignar(datos, centroides, esferico, bloque=8192):
+    """Centroide más cercano de cada fila, por bloques para acotar la memoria"""
+    asignacion = np.empty(len(datos), dtype=np.int64)
+    for inicio in range(0, len(datos), bloque):
+        parte = datos[inicio:inicio + bloque]
+        if esferico:
+            asignacion[inicio:inicio + bloque] = np.argmax(parte @ centroides.T, axis=1)
+        else:
+            asignacion[inicio:inicio + bloque] = np.argmin((centroides ** 2).sum(1) - 2 * parte @ centroides.T, axis=1)
+    return asignacion
+
+class IndiceANN:
+    def __init__(self, ids, claves, centroides, listas, codebooks, codigos, vectores):
+        self.ids = list(ids)
+        self.claves = list(claves)
+        self.centroides = centroides  # (nlist, D)
+        self.listas = listas  # lista de arrays de posiciones
+        self.codebooks = codebooks  # (m, ks, D/m)
+        self.codigos = codigos  # (N, m) uint8
+        self.vectores = vectores  # (N, D) float32, normalmente memmap
+        self.m = codebooks.shape[0]
+        self.vistas = max(Counter(self.ids).values(), default=1)  # Entradas por referencia (una por vista)
+        self._alineado = (None, None)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def construir(cls, ids, claves, vectores, nlist=None, m=32, iteraciones=15, muestra=ANN_MUESTRA, semilla=0):
+        vectores = _normalizar(vectores)
+        n, d = vectores.shape
+        if d % m:
+            raise ValueError(f"La dimensión {d} no es divisible por m={m}")
+        # Se entrena sobre una muestra y después se codifican todos los vectores
+        rng = np.random.default_rng(semilla)
+        entrenamiento = vectores[rng.choice(n, muestra, replace=False)] if n > muestra else vectores
+        nlist = nlist or max(1, int(np.sqrt(n)))
+        centroides, _ = kmeans(entrenamiento, nlist, iteraciones, semilla)
+        asignacion = _asignar(vectores, centroides, esferico=True)
+        listas = [np.flatnonzero(asignacion == c) for c in range(len(centroides))]
+        sub = d // m
+        ks = min(256, len(entrenamiento))
+        codebooks = np.empty((m, ks, sub), dtype=np.float32)
+        codigos = np.empty((n, m), dtype=np.uint8)
+        for j in range(m):
+            trozo = slice(j * sub, (j + 1) * sub)
+            codebooks[j], _ = kmeans(
+                np.ascontiguousarray(entrenamiento[:, trozo]), ks, iteraciones, semilla + j, esferico=False
+            )
+            codigos[:, j] = _asignar(np.ascontiguousarray(vectores[:, trozo]), codebooks[j], esferico=False)
+        return cls(ids, claves, centroides, listas, codebooks, codigos, vectores)
+
+    def buscar(self, consultas, top_k=5, nprobe=ANN_NPROBE, rescore=ANN_RESCORE):
+        """Para cada consulta (normalizada) devuelve (posiciones, scores exactos) de los top_k candidatos"""
+        consultas = _normalizar(np.atleast_2d(consultas))
+        sub = consultas.shape[1] // self.m
+        nprobe = min(nprobe, len(self.centroides))
+        listas_consulta = np.argsort(-(consultas @ self.centroides.T), axis=1)[:, :nprobe]
+        resultados = []
+        for q, listas in zip(consultas, listas_consulta):
+            candidatos = np.concatenate([self.listas[c] for c in listas])
+            if len(candidatos) == 0:
+                resultados.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            # Puntaje aproximado (ADC): tabla de productos parciales por subespacio
+            tabla = np.einsum("mkd,md->mk", self.codebooks, q.reshape(self.m, sub))
+            aproximado = tabla[np.arange(self.m), self.codigos[candidatos]].sum(axis=1)
+            if len(candidatos) > rescore:
+                candidatos = candidatos[np.argpartition(-aproximado, rescore - 1)[:rescore]]
+            # Rescore exacto con los vectores completos
+            candidatos = np.sort(candidatos)
+            exactos = np.asarray(self.vectores[candidatos]) @ q
+            orden = np.argsort(-exactos)[:top_k]
+            resultados.append((candidatos[orden], exactos[orden]))
+        return resultados
+
+    def alinear(self, ids, claves):
+        """Cruza el índice ANN con el estado actual de las referencias (ids y claves de contenido).
+
+        Devuelve (posicion_actual, delta): para cada entrada del ANN su posición en `ids` (-1 si se borró
+        o cambió desde la construcción) y las posiciones de `ids` que el ANN no conoce (se puntúan exacto).
+        El resultado se memoriza mientras se pase la misma lista `ids`.
+        """
+        lista_memo, resultado = self._alineado
+        if lista_memo is ids:
+            return resultado
+        vigentes = {(i, c): pos for pos, (i, c) in enumerate(zip(ids, claves))}
+        # Con varias vistas por referencia el mismo (id, clave) aparece en varias entradas del ANN
+        posicion_actual = np.array([vigentes.get((i, c), -1) for i, c in zip(self.ids, self.claves)], dtype=np.int64)
+        conocidas = set(zip(self.ids, self.claves))
+        delta = np.array(sorted(pos for par, pos in vigentes.items() if par not in conocidas), dtype=np.int64)
+        self._alineado = (ids, (posicion_actual, delta))
+        return posicion_actual, delta
+
+    def guardar(self, directorio=ANN_DIR):
+        """Escribe el índice en una versión nueva (`<directorio>.v*`) y la publica cambiando el symlink `directorio`.
+
+        Los archivos de una versión publicada no se reescriben nunca: un servidor con `vectores.npy` en memmap sigue
+        leyendo la versión anterior (ya borrada del directorio, pero viva mientras esté mapeada) hasta recargar.
+        """
+        directorio = os.path.abspath(directorio)
+        padre, nombre = os.path.split(directorio)
+        version = tempfile.mkdtemp(prefix=f"{nombre}.v", dir=padre)
+        os.chmod(version, 0o755)
+        np.save(os.path.join(version, "centroides.npy"), self.centroides)
+        np.save(os.path.join(version, "codebooks.npy"), self.codebooks)
+        np.save(os.path.join(version, "codigos.npy"), self.codigos)
+        np.save(os.path.join(version, "vectores.npy"), np.asarray(self.vectores, dtype=np.float32))
+        asignacion = np.empty(len(self), dtype=np.int32)
+        for c, posiciones in enumerate(self.listas):
+            asignacion[posiciones] = c
+        np.save(os.path.join(version, "asignacion.npy"), asignacion)
+        with open(os.path.join(version, "ids.json"), "w") as f:
+            json.dump({"ids": self.ids, "claves": self.claves}, f)
+
+        if os.path.isdir(directorio) and not os.path.islink(directorio):
+            # Formato anterior (directorio real): se aparta como una versión vieja más
+            os.replace(directorio, tempfile.mkdtemp(prefix=f"{nombre}.v", dir=padre))
+        enlace = f"{directorio}.enlace-{os.getpid()}"
+        if os.path.lexists(enlace):
+            os.remove(enlace)
+        os.symlink(os.path.basename(version), enlace)
+        os.replace(enlace, directorio)  # Atómico: quien abre `directorio` ve la versión vieja o la nueva entera
+
+        for viejo in glob.glob(os.path.join(glob.escape(padre), glob.escape(nombre) + ".v*")):
+            if viejo != version:
+                shutil.rmtree(viejo, ignore_errors=True)
+
+    @classmethod
+    def cargar(cls, directorio=ANN_DIR):
+        """Carga el índice; los vectores completos quedan en disco (memmap) para el rescore"""
+        # Se resuelve el symlink una vez para no mezclar archivos de dos versiones si se publica otra a mitad de carga
+        directorio = os.path.realpath(directorio)
+        with open(os.path.join(directorio, "ids.json")) as f:
+            meta = json.load(f)
+        centroides = np.load(os.path.join(directorio, "centroides.npy"))
+        asignacion = np.load(os.path.join(directorio, "asignacion.npy"))
+        listas = [np.flatnonzero(asignacion == c) for c in range(len(centroides))]
+        return cls(
+            meta["ids"], meta["claves"], centroides, listas,
+            np.load(os.path.join(directorio, "codebooks.npy")),
+            np.load(os.path.join(directorio, "codigos.npy")),
+            np.load(os.path.join(directorio, "vectores.npy"), mmap_mode="r"),
+        )
+
+def _leer_indice_sqlite(path, dim=DIM):
+    """(ids, claves, vectores): una entrada por vista, así que una referencia con varias vistas repite id y clave"""
+    import sqlite3
+    con = sqlite3.connect(path)
+    try:
+        filas = con.execute("SELECT pedido_id, clave, embedding FROM referencias ORDER BY pedido_id").fetchall()
+    finally:
+        con.close()
+    ids, claves, vectores = [], [], []
+    for pedido_id, clave, emb in filas:
+        vistas = np.frombuffer(emb, dtype=np.float32).reshape(-1, dim)
+        ids.extend([pedido_id] * len(vistas))
+        claves.extend([clave] * len(vistas))
+        vectores.append(vistas)
+    return ids, claves, np.concatenate(vectores) if vectores else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye el índice aproximado de referencias")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    construir = sub.add_parser("construir", help="(Re)construye el índice desde la base SQLite de referencias")
+    construir.add_argument("--db", default=os.environ.get("INDICE_DB", "indice_referencias.sqlite3"))
+    construir.add_argument("--salida", default=ANN_DIR)
+    construir.add_argument("--nlist", type=int, default=None, help="Cantidad de listas (default: sqrt(N))")
+    construir.add_argument("--m", type=int, default=32, help="Subespacios de PQ (bytes por vector)")
+    args = parser.parse_args()
+
+    ids, claves, vectores = _leer_indice_sqlite(args.db)
+    if vectores is None:
+        print("⚠️ El índice de referencias está vacío, no hay nada que construir")
+        return
+    inicio = time.perf_counter()
+    indice = IndiceANN.construir(ids, claves, vectores, nlist=args.nlist, m=args.m)
+    indice.guardar(args.salida)
+    print(f"✅ Índice ANN con {len(set(ids))} referencias ({len(ids)} vistas) y {len(indice.listas)} listas "
+          f"en {args.salida} ({time.perf_counter() - inicio:.1f}s)")
+
+if __name__ == "__main__":
+    main()
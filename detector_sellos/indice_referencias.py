@@ -0,0 +1,133 @@
+# indice_referencias.py
+
+import os
+import time
+import threading
+import numpy as np
+from clip_engine import DIM, Referencias
+from base_datos import conectar
+
+INDICE_DB = os.environ.get("INDICE_DB", "indice_referencias.sqlite3")
+
+class IndiceReferencias:
+    """Embeddings normalizados de los vectores de pedidos activos, persistidos en SQLite por id de pedido.
+
+    En memoria se mantiene una instantánea Referencias (matriz contigua) que se reconstruye sólo
+    cuando el índice cambia; quien la está usando para puntuar no se ve afectado por altas o bajas.
+    Cada escritura incrementa una versión guardada en la misma base, así un worker se entera también de
+    los cambios hechos por otro proceso. Con el índice ANN no hace falta la matriz: alcanza con los metadatos
+    (también por versión) y los embeddings de unos pocos pedidos leídos por id.
+    """
+
+    def __init__(self, path=INDICE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._instantanea = (None, None)  # (versión de la base, instantánea)
+        self._metadatos = (None, None)  # (versión de la base, (ids, nombres, claves))
+        with conectar(self.path) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS referencias (
+                    pedido_id TEXT PRIMARY KEY,
+                    nombre TEXT NOT NULL,
+                    clave TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    actualizado REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE TABLE IF NOT EXISTS version (id INTEGER PRIMARY KEY CHECK (id = 0), valor INTEGER NOT NULL)")
+            con.execute("INSERT OR IGNORE INTO version (id, valor) VALUES (0, 0)")
+
+    def guardar(self, pedido_id, nombre, clave, embedding):
+        """Alta o actualización de la referencia de un pedido (embedding (D,) o (vistas, D))"""
+        emb = np.ascontiguousarray(embedding, dtype=np.float32).reshape(-1)
+        with conectar(self.path) as con:
+            con.execute(
+                "INSERT OR REPLACE INTO referencias (pedido_id, nombre, clave, embedding, actualizado) VALUES (?, ?, ?, ?, ?)",
+                (pedido_id, nombre, clave, emb.tobytes(), time.time()),
+            )
+            self._incrementar_version(con)
+
+    @staticmethod
+    def _incrementar_version(con):
+        # En la misma transacción que el cambio: ningún lector ve el cambio sin la versión nueva
+        con.execute("UPDATE version SET valor = valor + 1 WHERE id = 0")
+
+    def borrar(self, pedido_id):
+        """Devuelve True si el pedido estaba en el índice"""
+        with conectar(self.path) as con:
+            borradas = con.execute("DELETE FROM referencias WHERE pedido_id = ?", (pedido_id,)).rowcount
+            if borradas:
+                self._incrementar_version(con)
+        return borradas > 0
+
+    def listar(self):
+        with conectar(self.path) as con:
+            return [
+                {"pedido_id": pedido_id, "nombre": nombre, "actualizado": actualizado}
+                for pedido_id, nombre, actualizado in con.execute(
+                    "SELECT pedido_id, nombre, actualizado FROM referencias ORDER BY pedido_id"
+                )
+            ]
+
+    @staticmethod
+    def _version(con):
+        return con.execute("SELECT valor FROM version WHERE id = 0").fetchone()[0]
+
+    def referencias(self):
+        """Instantánea (Referencias con nombres = ids de pedido, nombres de archivo, claves de contenido)"""
+        with conectar(self.path) as con:
+            con.execute("BEGIN")  # Versión y filas de la misma foto de la base
+            version = self._version(con)
+            with self._lock:
+                if self._instantanea[0] == version:
+                    return self._instantanea[1]
+            filas = con.execute(
+                "SELECT pedido_id, nombre, clave, embedding FROM referencias ORDER BY pedido_id"
+            ).fetchall()
+        por_fila = [np.frombuffer(emb, dtype=np.float32).reshape(-1, DIM) for _, _, _, emb in filas]
+        # Referencias dadas de alta con otra configuración de vistas: se completan repitiendo sus propias vistas,
+        # que no cambia el máximo
+        vistas = max((len(v) for v in por_fila), default=1)
+        matriz = np.empty((len(filas), vistas, DIM), dtype=np.float32)
+        for i, v in enumerate(por_fila):
+            matriz[i] = np.resize(v, (vistas, DIM))
+        instantanea = (
+            Referencias([f[0] for f in filas], matriz, vistas), [f[1] for f in filas], [f[2] for f in filas]
+        )
+        with self._lock:
+            self._instantanea = (version, instantanea)
+        return instantanea
+
+    def metadatos(self):
+        """(ids de pedido, nombres de archivo, claves de contenido) sin leer los embeddings, en el orden de referencias()"""
+        with conectar(self.path) as con:
+            con.execute("BEGIN")
+            version = self._version(con)
+            with self._lock:
+                if self._metadatos[0] == version:
+                    return self._metadatos[1]
+            filas = con.execute("SELECT pedido_id, nombre, clave FROM referencias ORDER BY pedido_id").fetchall()
+        metadatos = ([f[0] for f in filas], [f[1] for f in filas], [f[2] for f in filas])
+        with self._lock:
+            self._metadatos = (version, metadatos)
+        return metadatos
+
+    def embeddings(self, pedido_ids):
+        """{pedido_id: embeddings (vistas, D)} de esos pedidos, salvo los que ya no están en el índice"""
+        embs = {}
+        pedido_ids = list(pedido_ids)
+        with conectar(self.path) as con:
+            # Por tandas: SQLite limita la cantidad de parámetros de una consulta
+            for inicio in range(0, len(pedido_ids), 500):
+                tanda = pedido_ids[inicio:inicio + 500]
+                for pedido_id, emb in con.execute(
+                    f"SELECT pedido_id, embedding FROM referencias WHERE pedido_id IN ({','.join('?' * len(tanda))})",
+                    tanda,
+                ):
+                    embs[pedido_id] = np.frombuffer(emb, dtype=np.float32).reshape(-1, DIM)
+        return embs
+
+    def __len__(self):
+        with conectar(self.path) as con:
+            return con.execute("SELECT COUNT(*) FROM referencias").fetchone()[0]
@@ -0,0 +1,285 @@
+# jobs.py
+
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import TimeoutError as TiempoAgotado
+from ejecutor import ColaSaturada
+from base_datos import conectar
+
+JOBS_DB = os.environ.get("JOBS_DB", "jobs.sqlite3")
+JOBS_TTL_HORAS = float(os.environ.get("JOBS_TTL_HORAS", "24"))  # Cuánto se guardan los jobs terminados
+JOBS_FOTOS_POR_PASO = int(os.environ.get("JOBS_FOTOS_POR_PASO", "8"))  # Cada cuánto se publican resultados parciales
+JOBS_ACTIVO = os.environ.get("JOBS_ACTIVO", "1") == "1"  # Si este proceso toma jobs de la base
+JOBS_POLL_S = float(os.environ.get("JOBS_POLL_S", "2"))  # Cada cuánto se revisa la base estando ocioso
+JOBS_VENCIMIENTO_S = float(os.environ.get("JOBS_VENCIMIENTO_S", "120"))  # Sin latido por más que esto, otro lo retoma
+
+PENDIENTE = "pendiente"
+PROCESANDO = "procesando"
+TERMINADO = "terminado"
+ERROR = "error"
+
+class AlmacenJobs:
+    """Jobs persistidos en SQLite: entradas, estado y resultados parciales sobreviven a un reinicio"""
+
+    def __init__(self, path=JOBS_DB, ttl_horas=JOBS_TTL_HORAS):
+        self.path = path
+        self.ttl = ttl_horas * 3600
+        with conectar(self.path) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    estado TEXT NOT NULL,
+                    creado REAL NOT NULL,
+                    actualizado REAL NOT NULL,
+                    total INTEGER NOT NULL,
+                    procesadas INTEGER NOT NULL DEFAULT 0,
+                    mensaje TEXT,
+                    error TEXT,
+                    dueno TEXT,
+                    latido REAL
+                );
+                CREATE TABLE IF NOT EXISTS job_archivos (
+                    job_id TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    orden INTEGER NOT NULL,
+                    nombre TEXT NOT NULL,
+                    contenido BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS job_resultados (
+                    job_id TEXT NOT NULL,
+                    orden INTEGER NOT NULL,
+                    resultado TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_job_archivos ON job_archivos (job_id, tipo, orden);
+                CREATE INDEX IF NOT EXISTS idx_job_resultados ON job_resultados (job_id, orden);
+            """)
+            # Bases creadas antes de que los jobs tuvieran dueño
+            columnas = {fila[1] for fila in con.execute("PRAGMA table_info(jobs)")}
+            for columna, tipo in (("dueno", "TEXT"), ("latido", "REAL")):
+                if columna not in columnas:
+                    con.execute(f"ALTER TABLE jobs ADD COLUMN {columna} {tipo}")
+
+    def crear(self, svgs, fotos):
+        """Guarda un job nuevo. svgs y fotos son listas de (nombre, bytes). Devuelve el id"""
+        job_id = uuid.uuid4().hex
+        ahora = time.time()
+        with conectar(self.path) as con:
+            con.execute(
+                "INSERT INTO jobs (id, estado, creado, actualizado, total) VALUES (?, ?, ?, ?, ?)",
+                (job_id, PENDIENTE, ahora, ahora, len(fotos)),
+            )
+            con.executemany(
+                "INSERT INTO job_archivos (job_id, tipo, orden, nombre, contenido) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, "svg", i, nombre, contenido) for i, (nombre, contenido) in enumerate(svgs)]
+                + [(job_id, "foto", i, nombre, contenido) for i, (nombre, contenido) in enumerate(fotos)],
+            )
+        return job_id
+
+    def archivos(self, job_id, tipo, desde=0):
+        with conectar(self.path) as con:
+            filas = con.execute(
+                "SELECT nombre, contenido FROM job_archivos WHERE job_id = ? AND tipo = ? AND orden >= ? ORDER BY orden",
+                (job_id, tipo, desde),
+            ).fetchall()
+        return [(nombre, bytes(contenido)) for nombre, contenido in filas]
+
+    def marcar(self, job_id, estado, mensaje=None, error=None, dueno=None):
+        """Cambia el estado; con dueno, sólo si el job sigue siendo suyo. True si se actualizó"""
+        with conectar(self.path) as con:
+            actualizados = con.execute(
+                "UPDATE jobs SET estado = ?, mensaje = COALESCE(?, mensaje), error = ?, actualizado = ? "
+                "WHERE id = ? AND (? IS NULL OR dueno = ?)",
+                (estado, mensaje, error, time.time(), job_id, dueno, dueno),
+            ).rowcount
+            if actualizados and estado in (TERMINADO, ERROR):
+                # Las entradas ya no hacen falta: sólo se conservan los resultados hasta que venza el TTL
+                con.execute("DELETE FROM job_archivos WHERE job_id = ?", (job_id,))
+        return actualizados > 0
+
+    def reclamar(self, job_id, dueno, vencimiento_s=JOBS_VENCIMIENTO_S):
+        """Toma el job para `dueno` si está pendiente o si su dueño dejó de latir.
+
+        Es un solo UPDATE condicional, así que entre varios procesos lo gana uno solo. Devuelve la cantidad de
+        fotos ya procesadas (desde dónde seguir) o None si el job no se pudo tomar.
+        """
+        ahora = time.time()
+        with conectar(self.path) as con:
+            tomados = con.execute(
+                "UPDATE jobs SET estado = ?, dueno = ?, latido = ?, actualizado = ? "
+                "WHERE id = ? AND (estado = ? OR (estado = ? AND COALESCE(latido, 0) < ?))",
+                (PROCESANDO, dueno, ahora, ahora, job_id, PENDIENTE, PROCESANDO, ahora - vencimiento_s),
+            ).rowcount
+            if not tomados:
+                return None
+            return con.execute("SELECT procesadas FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+    def latir(self, job_id, dueno):
+        """Renueva el latido del job. False si ya no es de `dueno` (lo retomó otro)"""
+        with conectar(self.path) as con:
+            return con.execute(
+                "UPDATE jobs SET latido = ? WHERE id = ? AND dueno = ? AND estado = ?",
+                (time.time(), job_id, dueno, PROCESANDO),
+            ).rowcount > 0
+
+    def agregar_resultados(self, job_id, resultados, dueno=None):
+        """Agrega resultados parciales (en orden) y avanza el contador de fotos procesadas.
+
+        Con dueno, sólo si el job sigue siendo suyo (y de paso renueva el latido). True si se agregaron.
+        """
+        ahora = time.time()
+        with conectar(self.path) as con:
+            fila = con.execute(
+                "SELECT procesadas FROM jobs WHERE id = ? AND (? IS NULL OR (dueno = ? AND estado = ?))",
+                (job_id, dueno, dueno, PROCESANDO),
+            ).fetchone()
+            if fila is None:
+                return False
+            (procesadas,) = fila
+            con.executemany(
+                "INSERT INTO job_resultados (job_id, orden, resultado) VALUES (?, ?, ?)",
+                [(job_id, procesadas + i, json.dumps(r)) for i, r in enumerate(resultados)],
+            )
+            con.execute(
+                "UPDATE jobs SET procesadas = ?, actualizado = ?, latido = ? WHERE id = ?",
+                (procesadas + len(resultados), ahora, ahora, job_id),
+            )
+        return True
+
+    def obtener(self, job_id):
+        """Estado, progreso y resultados (parciales o finales) del job, o None si no existe o venció"""
+        self.purgar()
+        with conectar(self.path) as con:
+            fila = con.execute(
+                "SELECT estado, creado, actualizado, total, procesadas, mensaje, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if fila is None:
+                return None
+            resultados = [
+                json.loads(r) for (r,) in con.execute(
+                    "SELECT resultado FROM job_resultados WHERE job_id = ? ORDER BY orden", (job_id,)
+                )
+            ]
+        estado, creado, actualizado, total, procesadas, mensaje, error = fila
+        return {
+            "job_id": job_id,
+            "estado": estado,
+            "creado": creado,
+            "actualizado": actualizado,
+            "total": total,
+            "procesadas": procesadas,
+            "progreso": round(procesadas / total, 4) if total else 1.0,
+            "results": resultados,
+            "message": mensaje,
+            "error": error,
+        }
+
+    def sin_terminar(self, vencimiento_s=JOBS_VENCIMIENTO_S):
+        """Ids de jobs pendientes o cuyo dueño dejó de latir (p. ej. tras un reinicio), del más viejo al más nuevo"""
+        with conectar(self.path) as con:
+            return [
+                job_id for (job_id,) in con.execute(
+                    "SELECT id FROM jobs WHERE estado = ? OR (estado = ? AND COALESCE(latido, 0) < ?) ORDER BY creado",
+                    (PENDIENTE, PROCESANDO, time.time() - vencimiento_s),
+                )
+            ]
+
+    def purgar(self):
+        """Borra los jobs terminados cuyo TTL venció"""
+        limite = time.time() - self.ttl
+        with conectar(self.path) as con:
+            vencidos = [
+                job_id for (job_id,) in con.execute(
+                    "SELECT id FROM jobs WHERE estado IN (?, ?) AND actualizado < ?", (TERMINADO, ERROR, limite)
+                )
+            ]
+            for job_id in vencidos:
+                con.execute("DELETE FROM job_resultados WHERE job_id = ?", (job_id,))
+                con.execute("DELETE FROM job_archivos WHERE job_id = ?", (job_id,))
+                con.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+class ProcesadorJobs:
+    """Hilo de fondo que procesa los jobs por pasos de pocas fotos, publicando resultados parciales.
+
+    `procesar(svgs, fotos)` debe devolver un dict con "results" (uno por foto, en orden). Los pasos corren en el
+    EjecutorInferencia (si se pasa uno), así compiten por los mismos workers que las requests en vez de sumar
+    inferencias concurrentes. Cuando está ocioso revisa la base, así también toma los jobs creados por otros
+    procesos y los que quedaron a medias cuando su dueño dejó de latir. Cada job se reclama con un UPDATE
+    condicional: aunque varios procesos tengan activo=True, cada job lo procesa uno solo.
+    """
+
+    def __init__(self, almacen, procesar, fotos_por_paso=JOBS_FOTOS_POR_PASO, activo=JOBS_ACTIVO, poll_s=JOBS_POLL_S,
+                 ejecutor=None, vencimiento_s=JOBS_VENCIMIENTO_S):
+        self.almacen = almacen
+        self.procesar = procesar
+        self.fotos_por_paso = fotos_por_paso
+        self.activo = activo
+        self.poll_s = poll_s
+        self.ejecutor = ejecutor
+        self.vencimiento_s = vencimiento_s
+        self.dueno = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._cola = queue.Queue()
+        self._hilo = threading.Thread(target=self._loop, name="jobs", daemon=True)
+
+    def arrancar(self):
+        if self.activo:
+            self._hilo.start()
+
+    def encolar(self, job_id):
+        if self.activo:
+            self._cola.put(job_id)
+
+    def _loop(self):
+        while True:
+            try:
+                job_id = self._cola.get(timeout=self.poll_s)
+            except queue.Empty:
+                # Pendientes de otros procesos o abandonados (sin latido): el UPDATE de reclamar decide quién los toma
+                for job_id in self.almacen.sin_terminar(self.vencimiento_s):
+                    self._cola.put(job_id)
+                continue
+            try:
+                self._procesar_job(job_id)
+            except Exception as e:
+                print(f"Error procesando job {job_id}: {e}")
+                self.almacen.marcar(job_id, ERROR, error=str(e), dueno=self.dueno)
+
+    def _procesar_job(self, job_id):
+        desde = self.almacen.reclamar(job_id, self.dueno, self.vencimiento_s)
+        if desde is None:
+            return  # Terminado, o lo tiene otro proceso que sigue latiendo
+        if desde:
+            print(f"Retomando job {job_id} desde la foto {desde}")
+        svgs = self.almacen.archivos(job_id, "svg")
+        fotos = self.almacen.archivos(job_id, "foto", desde)
+        for inicio in range(0, len(fotos), self.fotos_por_paso):
+            paso = fotos[inicio:inicio + self.fotos_por_paso]
+            if not self.almacen.agregar_resultados(job_id, self._ejecutar(job_id, svgs, paso)["results"], self.dueno):
+                print(f"⚠️ El job {job_id} lo retomó otro proceso")
+                return
+        total = desde + len(fotos)
+        self.almacen.marcar(job_id, TERMINADO, mensaje=f"Procesadas {total} fotos contra {len(svgs)} SVGs",
+                            dueno=self.dueno)
+
+    def _ejecutar(self, job_id, svgs, fotos):
+        """Corre un paso en el ejecutor, esperando lugar si está saturado y latiendo mientras espera"""
+        if self.ejecutor is None:
+            return self.procesar(svgs, fotos)
+        while True:
+            try:
+                futuro = self.ejecutor.enviar(self.procesar, svgs, fotos)
+                break
+            except ColaSaturada:
+                # Las requests tienen prioridad: el job espera en vez de fallar
+                self.almacen.latir(job_id, self.dueno)
+                time.sleep(self.poll_s)
+        while True:
+            try:
+                return futuro.result(timeout=self.poll_s)
+            except TiempoAgotado:
+                self.almacen.latir(job_id, self.dueno)
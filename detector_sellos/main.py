@@ -1,6 +1,8 @@
 import os
 import cv2
-from utils import preprocess_image, compare_images
+import numpy as np
+from utils import preprocess_image
+from descriptores_sift import CacheDescriptores, IndiceSIFT
 
 MUESTRAS_DIR = "muestras"
 VECTORES_DIR = "vectores"
@@ -15,6 +17,9 @@ for nombre_vector in os.listdir(VECTORES_DIR):
     except Exception as e:
         print(f"❌ Error cargando vector {nombre_vector}: {e}")
 
+# Los descriptores de los vectores se calculan una sola vez (y quedan en disco para la próxima corrida)
+indice = IndiceSIFT.desde_imagenes(vectores, CacheDescriptores())
+
 # Procesar cada muestra
 for nombre_muestra in os.listdir(MUESTRAS_DIR):
     path_muestra = os.path.join(MUESTRAS_DIR, nombre_muestra)
@@ -27,14 +32,15 @@ for nombre_muestra in os.listdir(MUESTRAS_DIR):
     mejor_match = None
     mejor_score = 0
 
-    for nombre_vector, img_vector in vectores:
-        try:
-            score = compare_images(img_muestra, img_vector)
-            if score > mejor_score:
-                mejor_score = score
-                mejor_match = nombre_vector
-        except Exception as e:
-            print(f"⚠️ Falló comparación con {nombre_vector}: {e}")
+    try:
+        # La muestra se extrae una vez y se busca contra todos los vectores en el índice
+        scores = indice.puntuar(img_muestra)
+        if len(scores) and scores.max() > 0:
+            mejor = int(np.argmax(scores))
+            mejor_score = float(scores[mejor])
+            mejor_match = indice.nombres[mejor]
+    except Exception as e:
+        print(f"⚠️ Falló comparación de {nombre_muestra}: {e}")
 
     UMBRAL_SCORE_MIN = 0.15  # o 0.10 si querés menos estricto
 
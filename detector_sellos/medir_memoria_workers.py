@@ -0,0 +1,90 @@
+# medir_memoria_workers.py
+"""Mide la memoria del servidor multi-worker para distintas cantidades de workers.
+
+Levanta servidor_multiworker.py, espera a que /ready responda y suma la memoria de todo el árbol de
+procesos (padre + workers). Reporta RSS (cuenta las páginas compartidas una vez por proceso) y PSS
+(las reparte entre quienes las comparten): la diferencia es lo que ahorra el modelo compartido. Sólo Linux.
+
+    python medir_memoria_workers.py --workers 1 2 4
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import subprocess
+import urllib.request
+
+def _hijos(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+def _memoria_kb(pid):
+    """(rss, pss) en kB según /proc/<pid>/smaps_rollup"""
+    valores = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for linea in f:
+            partes = linea.split()
+            if partes[0] in ("Rss:", "Pss:"):
+                valores[partes[0]] = int(partes[1])
+    return valores.get("Rss:", 0), valores.get("Pss:", 0)
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _esperar_listo(url, workers, timeout):
+    """Espera a que /ready dé 200 varias veces seguidas (el balanceo entre workers lo hace el kernel)"""
+    limite = time.time() + timeout
+    seguidos = 0
+    while time.time() < limite:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=2) as r:
+                seguidos = seguidos + 1 if r.status == 200 else 0
+        except Exception:
+            seguidos = 0
+        if seguidos >= 4 * workers:
+            return True
+        time.sleep(0.25)
+    return False
+
+def medir(workers, timeout):
+    puerto = _puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, "servidor_multiworker.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(puerto)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not _esperar_listo(f"http://127.0.0.1:{puerto}", workers, timeout):
+            raise RuntimeError(f"El servidor con {workers} workers no quedó listo en {timeout}s")
+        pids = [proceso.pid] + _hijos(proceso.pid)
+        rss, pss = map(sum, zip(*(_memoria_kb(p) for p in pids)))
+        return {"workers": workers, "procesos": len(pids), "rss_mb": rss / 1024, "pss_mb": pss / 1024}
+    finally:
+        proceso.send_signal(signal.SIGTERM)
+        try:
+            proceso.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("❌ Hace falta Linux con /proc/<pid>/smaps_rollup")
+    print(f"{'workers':>8} {'procesos':>9} {'RSS total MB':>13} {'PSS total MB':>13} {'PSS/worker MB':>14}")
+    for n in args.workers:
+        r = medir(n, args.timeout)
+        print(f"{r['workers']:>8} {r['procesos']:>9} {r['rss_mb']:>13.0f} {r['pss_mb']:>13.0f} {r['pss_mb'] / n:>14.0f}")
+
+if __name__ == "__main__":
+    main()
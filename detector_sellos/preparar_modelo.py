@@ -0,0 +1,15 @@
+# preparar_modelo.py
+# Descarga el modelo CLIP una vez y lo guarda en CLIP_MODEL_PATH para que el servidor
+# arranque sin consultar el hub (correr en el build de la imagen o en el setup del servidor).
+
+import os
+import time
+from transformers import CLIPProcessor, CLIPModel
+from clip_engine import MODEL_ID, MODEL_PATH
+
+if __name__ == "__main__":
+    inicio = time.perf_counter()
+    os.makedirs(MODEL_PATH, exist_ok=True)
+    CLIPProcessor.from_pretrained(MODEL_ID).save_pretrained(MODEL_PATH)
+    CLIPModel.from_pretrained(MODEL_ID).save_pretrained(MODEL_PATH, safe_serialization=True)
+    print(f"✅ {MODEL_ID} guardado en {MODEL_PATH} ({time.perf_counter() - inicio:.1f}s)")
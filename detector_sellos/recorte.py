@@ -0,0 +1,120 @@
+# recorte.py
+"""Localización del sello en las fotos del taller antes de pasarlas por CLIP.
+
+El sello grabado suele ocupar una parte chica del cuadro (mesa, manos, packaging) y CLIP lo ve todo a 224x224.
+Esta etapa trabaja sobre una versión reducida de la foto en gris: bordes de Canny con umbrales sacados del de
+Otsu y densidad de bordes en ventanas cuadradas de un par de tamaños. Los máximos de densidad que no se solapan
+se proponen como recortes con margen: el grabado y el sello de metal están llenos de trazos, la mesa y el cuero
+no. La foto completa siempre va primera, así que tomar el máximo sobre los recortes nunca puntúa peor que sin
+recorte.
+
+Si el análisis pasa de RECORTE_PRESUPUESTO_MS se corta ahí y la foto sigue con los recortes que ya tenía.
+"""
+
+import os
+import time
+import threading
+import cv2
+import numpy as np
+
+RECORTE_ACTIVO = os.environ.get("RECORTE_SELLO", "0") == "1"
+RECORTE_MAX = int(os.environ.get("RECORTE_MAX", "3"))  # Recortes por foto además de la foto completa
+RECORTE_PRESUPUESTO_MS = float(os.environ.get("RECORTE_PRESUPUESTO_MS", "20"))
+RECORTE_LADO = 256  # Lado largo de la imagen que se analiza
+RECORTE_ESCALAS = (0.3, 0.5)  # Lado de las ventanas, relativo al lado corto de la foto
+RECORTE_MARGEN = 0.15  # Margen alrededor de la ventana, relativo a su lado
+RECORTE_SOLAPAMIENTO = 0.4  # IoU a partir del cual dos propuestas son la misma
+
+def _iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    interseccion = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - interseccion
+    return interseccion / union if union else 0.0
+
+def _cuadrado(x, y, w, h, ancho, alto):
+    """Caja cuadrada con margen centrada en la región, dentro de la imagen: (x1, y1, x2, y2)"""
+    lado = min(max(w, h) * (1 + 2 * RECORTE_MARGEN), ancho, alto)
+    cx = min(max(x + w / 2, lado / 2), ancho - lado / 2)
+    cy = min(max(y + h / 2, lado / 2), alto - lado / 2)
+    return cx - lado / 2, cy - lado / 2, cx + lado / 2, cy + lado / 2
+
+def _vencido(limite):
+    return limite is not None and time.perf_counter() > limite
+
+def regiones(gris, max_regiones=RECORTE_MAX, limite=None):
+    """Cajas (x1, y1, x2, y2) candidatas a sello en una imagen en gris, de más a menos densidad de bordes"""
+    alto, ancho = gris.shape
+    # Los umbrales de Canny salen del de Otsu (el de preprocess_image): se adaptan a la iluminación de cada foto
+    otsu, _ = cv2.threshold(gris, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    bordes = cv2.Canny(cv2.GaussianBlur(gris, (3, 3), 0), 0.5 * otsu, otsu).astype(np.float32) / 255
+    propuestas = []
+    for escala in RECORTE_ESCALAS:
+        if _vencido(limite):
+            break
+        lado = max(8, round(escala * min(ancho, alto)))
+        # Densidad de bordes en una ventana de lado x lado centrada en cada píxel
+        densidad = cv2.boxFilter(bordes, -1, (lado, lado), borderType=cv2.BORDER_CONSTANT)
+        # Máximos locales: el píxel es el mayor de su vecindario de medio lado
+        maximos = densidad >= cv2.dilate(densidad, np.ones((lado // 2 | 1, lado // 2 | 1), np.uint8))
+        ys, xs = np.nonzero(maximos & (densidad > 0))
+        for k in np.argsort(-densidad[ys, xs])[:4 * max_regiones]:
+            caja = _cuadrado(xs[k] - lado / 2, ys[k] - lado / 2, lado, lado, ancho, alto)
+            propuestas.append((float(densidad[ys[k], xs[k]]), caja))
+    cajas = []
+    if _vencido(limite):
+        return cajas
+    for _, caja in sorted(propuestas, key=lambda p: -p[0]):
+        if all(_iou(caja, otra) < RECORTE_SOLAPAMIENTO for otra in cajas):
+            cajas.append(caja)
+            if len(cajas) == max_regiones:
+                break
+    return cajas
+
+def proponer_recortes(imagen, max_recortes=RECORTE_MAX, presupuesto_ms=RECORTE_PRESUPUESTO_MS):
+    """[foto completa, recortes...] de una imagen PIL. Respeta el presupuesto de tiempo por foto"""
+    inicio = time.perf_counter()
+    limite = inicio + presupuesto_ms / 1000
+    escala = RECORTE_LADO / max(imagen.size)
+    gris = np.asarray(imagen.convert("L"))
+    if escala < 1:
+        gris = cv2.resize(gris, (max(1, round(imagen.width * escala)), max(1, round(imagen.height * escala))),
+                          interpolation=cv2.INTER_AREA)
+    else:
+        escala = 1.0
+    cajas = regiones(gris, max_recortes, limite)
+    recortes = [imagen]
+    for x1, y1, x2, y2 in cajas:
+        recortes.append(imagen.crop(tuple(round(v / escala) for v in (x1, y1, x2, y2))))
+    duracion = time.perf_counter() - inicio
+    estadisticas.registrar(len(recortes) - 1, duracion, duracion * 1000 > presupuesto_ms)
+    return recortes
+
+class EstadisticasRecorte:
+    """Cuántos recortes se proponen por foto, cuánto tarda la localización y cuántas fotos se pasan del presupuesto"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fotos = 0
+        self.recortes = 0
+        self.segundos = 0.0
+        self.fuera_de_presupuesto = 0
+
+    def registrar(self, recortes, segundos, excedida):
+        with self._lock:
+            self.fotos += 1
+            self.recortes += recortes
+            self.segundos += segundos
+            self.fuera_de_presupuesto += int(excedida)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "activo": RECORTE_ACTIVO,
+                "fotos": self.fotos,
+                "recortes_por_foto": round(self.recortes / self.fotos, 2) if self.fotos else None,
+                "ms_por_foto": round(1000 * self.segundos / self.fotos, 2) if self.fotos else None,
+                "fuera_de_presupuesto": self.fuera_de_presupuesto,
+            }
+
+estadisticas = EstadisticasRecorte()
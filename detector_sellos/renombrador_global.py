@@ -2,6 +2,7 @@
 
 import os
 from clip_engine import cargar_vectores, comparar_muestra
+from asignacion import asignar, matriz_desde_listas
 from pathlib import Path
 
 VECTORES_DIR = "vectores"
@@ -12,34 +13,24 @@ UMBRAL = 0.25
 print("📦 Cargando vectores...")
 base_embeddings = cargar_vectores(VECTORES_DIR)
 
-# Armar candidatos
-candidatos = []
+# Scores de cada muestra contra todos los vectores
+muestras = []
+listas = []
 for nombre_muestra in os.listdir(MUESTRAS_DIR):
     path = os.path.join(MUESTRAS_DIR, nombre_muestra)
-    resultados = comparar_muestra(path, base_embeddings)
-    if resultados and resultados[0][1] >= UMBRAL:
-        candidatos.append({
-            "muestra": nombre_muestra,
-            "match": resultados[0][0],
-            "score": resultados[0][1]
-        })
+    muestras.append(nombre_muestra)
+    listas.append(comparar_muestra(path, base_embeddings))
 
-# Ordenar por score descendente
-candidatos.sort(key=lambda x: x["score"], reverse=True)
-
-# Renombrar de forma óptima
-usados = set()
-for c in candidatos:
-    nuevo_nombre = Path(c["match"]).stem + ".jpg"
-    path_actual = os.path.join(MUESTRAS_DIR, c["muestra"])
+# Renombrar de forma óptima: asignación uno a uno que maximiza el score total (no sólo el top-1 de cada muestra)
+matriz, vectores = matriz_desde_listas(listas, base_embeddings.nombres)
+for i, j, score in asignar(matriz, UMBRAL):
+    nombre_muestra = muestras[i]
+    nuevo_nombre = Path(vectores[j]).stem + ".jpg"
+    path_actual = os.path.join(MUESTRAS_DIR, nombre_muestra)
     path_nuevo = os.path.join(MUESTRAS_DIR, nuevo_nombre)
 
-    if nuevo_nombre in usados:
-        print(f"⚠️ {c['muestra']} no se renombró: {nuevo_nombre} ya fue asignado")
+    if path_actual != path_nuevo and not os.path.exists(path_nuevo):
+        os.rename(path_actual, path_nuevo)
+        print(f"✅ {nombre_muestra} → {nuevo_nombre} (score: {score:.4f})")
     else:
-        if path_actual != path_nuevo and not os.path.exists(path_nuevo):
-            os.rename(path_actual, path_nuevo)
-            print(f"✅ {c['muestra']} → {nuevo_nombre} (score: {c['score']:.4f})")
-        else:
-            print(f"⚠️ {c['muestra']} ya se llama {nuevo_nombre}")
-        usados.add(nuevo_nombre)
+        print(f"⚠️ {nombre_muestra} ya se llama {nuevo_nombre}")
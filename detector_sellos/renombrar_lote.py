@@ -0,0 +1,253 @@
+# renombrar_lote.py
+"""Procesa en paralelo una carpeta de muestras (fotos del taller) contra los vectores y, opcionalmente, las renombra.
+
+- Motores: clip (embeddings + coseno) o sift (descriptores cacheados + índice FLANN + homografía).
+- Pool de procesos: las referencias se preparan una vez en el proceso principal y se pasan a cada worker.
+- Muestra el progreso a medida que terminan los lotes y escribe un reporte CSV o JSON (según la extensión).
+- Manifiesto JSONL: cada muestra procesada queda anotada apenas termina; al relanzar se saltean las que
+  ya están (mismo motor, tamaño y fecha de modificación, y mismo conjunto de vectores: si se agrega, saca o
+  cambia un vector se reprocesa todo).
+- Renombrado con asignación óptima uno a uno (húngaro) sobre los --top-k vectores guardados por muestra.
+
+    python renombrar_lote.py --motor clip --procesos 8 --reporte reporte.csv
+    python renombrar_lote.py --motor sift --renombrar
+"""
+
+import os
+import csv
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from asignacion import asignar, matriz_desde_listas
+
+MOTORES = ("clip", "sift")
+UMBRALES = {"clip": 0.25, "sift": 0.15}  # Los de renombrador_global.py y main.py
+EXTENSIONES = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+
+# Estado de cada worker, armado una vez por proceso en _iniciar_worker
+_worker = {}
+
+def _iniciar_worker(motor, referencias, hilos):
+    _worker["motor"] = motor
+    if motor == "clip":
+        import clip_engine
+        clip_engine.configurar_hilos(hilos)
+        clip_engine.cargar_modelo()
+        _worker["referencias"] = clip_engine.Referencias(*referencias)
+    else:
+        from descriptores_sift import IndiceSIFT
+        _worker["indice"] = IndiceSIFT(*referencias)
+
+def _procesar_lote(paths, top_k):
+    """[(nombre de la muestra, [(vector, score), ...] o None si no se pudo leer)]"""
+    if _worker["motor"] == "clip":
+        import clip_engine
+        resultados = clip_engine.comparar_muestras(paths, _worker["referencias"], top_k)
+        return [(os.path.basename(p), r or None) for p, r in zip(paths, resultados)]
+    from utils import preprocess_image
+    indice = _worker["indice"]
+    salida = []
+    for path in paths:
+        try:
+            scores = indice.puntuar(preprocess_image(path))
+        except Exception as e:
+            print(f"❌ Error con {os.path.basename(path)}: {e}")
+            salida.append((os.path.basename(path), None))
+            continue
+        orden = scores.argsort()[::-1][:top_k]
+        salida.append((os.path.basename(path), [(indice.nombres[j], float(scores[j])) for j in orden]))
+    return salida
+
+def preparar_referencias(motor, vectores_dir):
+    """Lo que necesita cada worker, calculado una sola vez: embeddings (clip) o descriptores (sift)"""
+    if motor == "clip":
+        import clip_engine
+        referencias = clip_engine.cargar_vectores(vectores_dir)
+        return referencias.nombres, referencias.matriz, referencias.vistas
+    from utils import preprocess_image
+    from descriptores_sift import CacheDescriptores
+    cache = CacheDescriptores()
+    nombres, puntos, descriptores = [], [], []
+    for nombre in sorted(os.listdir(vectores_dir)):
+        try:
+            p, d = cache.extraer(preprocess_image(os.path.join(vectores_dir, nombre)))
+        except Exception as e:
+            print(f"❌ Error cargando vector {nombre}: {e}")
+            continue
+        nombres.append(nombre)
+        puntos.append(p)
+        descriptores.append(d)
+    return nombres, puntos, descriptores
+
+def firma_vectores(vectores_dir):
+    """Hash de los nombres, tamaños y fechas de los vectores: cambia si se agrega, saca o modifica alguno"""
+    h = hashlib.sha256()
+    for nombre in sorted(os.listdir(vectores_dir)):
+        stat = os.stat(os.path.join(vectores_dir, nombre))
+        h.update(f"{nombre}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:16]
+
+def _firma(path, motor, vectores):
+    stat = os.stat(path)
+    return {"motor": motor, "tamano": stat.st_size, "mtime": int(stat.st_mtime), "vectores": vectores}
+
+def leer_manifiesto(path):
+    """{muestra: registro} de lo ya procesado (la última línea de cada muestra gana)"""
+    procesadas = {}
+    if not os.path.exists(path):
+        return procesadas
+    with open(path) as f:
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue  # Línea cortada por una interrupción
+            procesadas[registro["muestra"]] = registro
+    return procesadas
+
+def escribir_reporte(path, registros, umbral):
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(registros, f, ensure_ascii=False, indent=2)
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["muestra", "mejor", "score", "segundo", "score_segundo", "match"])
+        for r in registros:
+            matches = r["matches"] or []
+            primero = matches[0] if matches else ("", "")
+            segundo = matches[1] if len(matches) > 1 else ("", "")
+            writer.writerow([
+                r["muestra"], primero[0], primero[1], segundo[0], segundo[1],
+                bool(matches) and matches[0][1] >= umbral,
+            ])
+
+def asignar_greedy(registros, umbral):
+    """Cada muestra se queda con su mejor vector, de mayor a menor score, sin repetir vectores"""
+    candidatos = sorted(
+        (r for r in registros if r["matches"] and r["matches"][0][1] >= umbral),
+        key=lambda r: r["matches"][0][1], reverse=True,
+    )
+    asignaciones, usados = [], set()
+    for r in candidatos:
+        vector, score = r["matches"][0]
+        if vector in usados:
+            print(f"⚠️ {r['muestra']} no se renombró: {vector} ya fue asignado")
+            continue
+        usados.add(vector)
+        asignaciones.append((r["muestra"], vector, score))
+    return asignaciones
+
+def asignar_optima(registros, umbral):
+    """Asignación uno a uno que maximiza el score total sobre los top-k guardados de cada muestra"""
+    matriz, vectores = matriz_desde_listas([r["matches"] for r in registros])
+    asignaciones = []
+    for i, j, score in asignar(matriz, umbral):
+        r = registros[i]
+        if r["matches"][0][0] != vectores[j]:
+            print(f"↪️ {r['muestra']} va a {vectores[j]} ({score:.4f}): su mejor opción {r['matches'][0][0]} "
+                  f"rinde más en otra muestra")
+        asignaciones.append((r["muestra"], vectores[j], score))
+    asignadas = {muestra for muestra, _, _ in asignaciones}
+    for r in registros:
+        if r["muestra"] not in asignadas and r["matches"] and r["matches"][0][1] >= umbral:
+            print(f"⚠️ {r['muestra']} no se renombró: sus candidatos quedaron asignados a otras muestras")
+    return asignaciones
+
+def renombrar(muestras_dir, asignaciones):
+    for muestra, vector, score in asignaciones:
+        nuevo_nombre = Path(vector).stem + ".jpg"
+        path_actual = os.path.join(muestras_dir, muestra)
+        path_nuevo = os.path.join(muestras_dir, nuevo_nombre)
+        if path_actual == path_nuevo:
+            print(f"🔁 {muestra} ya tiene nombre correcto")
+        elif os.path.exists(path_nuevo):
+            print(f"⚠️ No se renombró {muestra}, ya existe {nuevo_nombre}")
+        elif os.path.exists(path_actual):
+            os.rename(path_actual, path_nuevo)
+            print(f"✅ {muestra} → {nuevo_nombre} (score: {score:.4f})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--muestras", default="muestras")
+    parser.add_argument("--vectores", default="vectores")
+    parser.add_argument("--motor", choices=MOTORES, default="clip")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--lote", type=int, default=16, help="Muestras por tarea (con clip se codifican juntas)")
+    parser.add_argument("--top-k", type=int, default=5, help="Vectores guardados por muestra en el reporte")
+    parser.add_argument("--umbral", type=float, default=None, help="Score mínimo (default: 0.25 clip, 0.15 sift)")
+    parser.add_argument("--reporte", default="reporte_lote.csv", help=".csv o .json")
+    parser.add_argument("--manifiesto", default=None, help="Default: <muestras>/.manifiesto_<motor>.jsonl")
+    parser.add_argument("--renombrar", action="store_true", help="Renombrar las muestras al terminar")
+    parser.add_argument("--asignacion", choices=("optima", "greedy"), default="optima",
+                        help="optima: húngaro sobre los top-k de cada muestra; greedy: mejor score primero")
+    args = parser.parse_args()
+
+    umbral = UMBRALES[args.motor] if args.umbral is None else args.umbral
+    manifiesto = args.manifiesto or os.path.join(args.muestras, f".manifiesto_{args.motor}.jsonl")
+    muestras = sorted(
+        n for n in os.listdir(args.muestras) if Path(n).suffix.lower() in EXTENSIONES
+    )
+    procesadas = leer_manifiesto(manifiesto)
+    vectores = firma_vectores(args.vectores)
+    pendientes = [
+        n for n in muestras
+        if procesadas.get(n, {}).get("firma") != _firma(os.path.join(args.muestras, n), args.motor, vectores)
+    ]
+    print(f"📂 {len(muestras)} muestras, {len(muestras) - len(pendientes)} ya procesadas según {manifiesto}")
+    viejas = sum(
+        1 for n in muestras if n in procesadas and procesadas[n].get("firma", {}).get("vectores") != vectores
+    )
+    if viejas:
+        print(f"🔄 {viejas} muestras se procesaron con otro conjunto de vectores: se reprocesan")
+
+    if pendientes:
+        inicio = time.perf_counter()
+        print(f"📦 Preparando vectores ({args.motor})...")
+        referencias = preparar_referencias(args.motor, args.vectores)
+        procesos = max(1, min(args.procesos, len(pendientes)))
+        hilos = max(1, (os.cpu_count() or 1) // procesos)
+        lotes = [
+            [os.path.join(args.muestras, n) for n in pendientes[i:i + args.lote]]
+            for i in range(0, len(pendientes), args.lote)
+        ]
+        print(f"⚙️ {len(pendientes)} muestras en {len(lotes)} lotes con {procesos} procesos")
+        hechas = 0
+        # spawn: cada worker arranca limpio (torch/OpenMP no se llevan bien con fork)
+        contexto = multiprocessing.get_context("spawn")
+        with open(manifiesto, "a") as salida, ProcessPoolExecutor(
+            procesos, mp_context=contexto, initializer=_iniciar_worker, initargs=(args.motor, referencias, hilos)
+        ) as pool:
+            futuros = [pool.submit(_procesar_lote, lote, args.top_k) for lote in lotes]
+            for futuro in as_completed(futuros):
+                for nombre, matches in futuro.result():
+                    registro = {
+                        "muestra": nombre,
+                        "firma": _firma(os.path.join(args.muestras, nombre), args.motor, vectores),
+                        "matches": matches,
+                    }
+                    salida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                    procesadas[nombre] = registro
+                    hechas += 1
+                    mejor = f"{matches[0][0]} ({matches[0][1]:.4f})" if matches else "sin resultado"
+                    print(f"[{hechas}/{len(pendientes)}] {nombre} → {mejor}")
+                salida.flush()
+        duracion = time.perf_counter() - inicio
+        print(f"⏱️ {len(pendientes)} muestras en {duracion:.1f}s ({len(pendientes) / duracion:.1f} muestras/s)")
+
+    registros = [
+        {"muestra": n, "matches": [tuple(m) for m in procesadas[n]["matches"] or []] or None}
+        for n in muestras if n in procesadas
+    ]
+    escribir_reporte(args.reporte, registros, umbral)
+    print(f"📝 Reporte en {args.reporte}")
+    if args.renombrar:
+        asignar_fn = asignar_optima if args.asignacion == "optima" else asignar_greedy
+        renombrar(args.muestras, asignar_fn(registros, umbral))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# servidor_multiworker.py
+"""Levanta varios workers de uvicorn que comparten una sola copia de los pesos de CLIP.
+
+El proceso padre carga el modelo, congela el GC y recién después hace fork de los workers: los
+tensores de los pesos quedan en páginas compartidas copy-on-write (nadie los escribe), así que la
+memoria total crece poco con cada worker extra. El padre no hace el forward de calentamiento
+(OpenMP no es fork-safe); cada worker calienta por su cuenta en su lifespan y, si CLIP_BACKEND no es
+fp32, arma su propio backend (esa copia derivada no se comparte).
+
+Sólo el worker 0 procesa los jobs asíncronos (JOBS_ACTIVO); el padre relanza los workers que mueren.
+
+    python servidor_multiworker.py --workers 4 --port 8000
+"""
+
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+
+def _lanzar_worker(indice, sock):
+    pid = os.fork()
+    if pid:
+        return pid
+    # Proceso hijo: api ya está importado (y el modelo cargado) desde el padre
+    import uvicorn
+    import api
+    import clip_engine
+    api.procesador_jobs.activo = indice == 0
+    if clip_engine.CLIP_BACKEND != "fp32":
+        # Los backends derivados (int8, torchscript, onnx) ejecutan el grafo al construirse: se arman después del fork
+        clip_engine.usar_backend(clip_engine.CLIP_BACKEND)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(api.app, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+    os._exit(0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", "2")))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    import clip_engine
+    # Sólo los pesos fp32: nada de forward en el padre
+    clip_engine.cargar_modelo(nombre_backend="fp32")
+    import api  # noqa: F401 - se importa antes del fork para compartir también el código cargado
+    # Los objetos que existen ahora no se vuelven a recorrer en el GC: evita tocar (y copiar) sus páginas
+    gc.collect()
+    gc.freeze()
+    print(f"⏱️ Modelo cargado en el proceso padre en {time.perf_counter() - inicio:.1f}s")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    workers = {_lanzar_worker(i, sock): i for i in range(args.workers)}
+    print(f"✅ {args.workers} workers escuchando en {args.host}:{args.port} (pids: {', '.join(map(str, workers))})")
+
+    terminando = False
+
+    def terminar(signum, frame):
+        nonlocal terminando
+        terminando = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, terminar)
+    signal.signal(signal.SIGINT, terminar)
+
+    while workers:
+        try:
+            pid, estado = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        indice = workers.pop(pid, None)
+        if indice is None or terminando:
+            continue
+        print(f"⚠️ El worker {indice} (pid {pid}) terminó con estado {estado}, relanzando")
+        workers[_lanzar_worker(indice, sock)] = indice
+    sys.exit(0)
+
+if __name__ == "__main__":
+    main()
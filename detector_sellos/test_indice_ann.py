@@ -0,0 +1,45 @@
+# test_indice_ann.py
+"""Reconstruir el índice ANN mientras otro proceso lo tiene cargado (vectores en memmap).
+
+    python -m pytest test_indice_ann.py
+"""
+
+import os
+import numpy as np
+from indice_ann import IndiceANN
+
+def _indice(n, semilla):
+    vectores = np.random.default_rng(semilla).standard_normal((n, 64)).astype(np.float32)
+    ids = [f"p{semilla}-{i}" for i in range(n)]
+    return IndiceANN.construir(ids, ids, vectores, m=8, iteraciones=3)
+
+def test_reconstruir_con_indice_cargado(tmp_path):
+    directorio = str(tmp_path / "indice_ann")
+    viejo = _indice(400, 1)
+    viejo.guardar(directorio)
+    cargado = IndiceANN.cargar(directorio)
+    esperado = np.array(cargado.vectores)
+
+    # Más chico que el anterior: reescribir vectores.npy en el lugar truncaba el archivo mapeado (SIGBUS)
+    nuevo = _indice(50, 2)
+    nuevo.guardar(directorio)
+
+    np.testing.assert_array_equal(np.asarray(cargado.vectores), esperado)
+    posiciones, scores = cargado.buscar(esperado[:3], top_k=1)[0]
+    assert len(posiciones) == 1 and scores[0] > 0.99
+
+    recargado = IndiceANN.cargar(directorio)
+    assert recargado.ids == nuevo.ids
+    np.testing.assert_array_equal(np.asarray(recargado.vectores), np.asarray(nuevo.vectores))
+    # Queda el symlink y sólo la versión vigente
+    assert os.path.islink(directorio)
+    assert sorted(os.listdir(tmp_path)) == sorted(["indice_ann", os.readlink(directorio)])
+
+def test_reconstruir_sobre_directorio_del_formato_anterior(tmp_path):
+    directorio = tmp_path / "indice_ann"
+    directorio.mkdir()
+    (directorio / "ids.json").write_text("{}")
+    nuevo = _indice(50, 3)
+    nuevo.guardar(str(directorio))
+    assert os.path.islink(directorio)
+    assert IndiceANN.cargar(str(directorio)).ids == nuevo.ids
@@ -1,22 +1,27 @@
 import cv2
-import numpy as np
 from skimage.metrics import structural_similarity as ssim
+from descriptores_sift import RATIO_LOWE, extraer, score_homografia
+from verificacion import binarizar, verificar
+from imagenes import decodificar_gris
 
 def preprocess_image(path, size=(512, 512)):
-    img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise FileNotFoundError(f"No se pudo leer la imagen en la ruta: {path}")
-    img = cv2.resize(img, size)
-    _, thresh = cv2.threshold(img, 128, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    return thresh
-
-def compare_images(img1, img2):
-    sift = cv2.SIFT_create()
-
-    kp1, des1 = sift.detectAndCompute(img1, None)
-    kp2, des2 = sift.detectAndCompute(img2, None)
-
-    if des1 is None or des2 is None:
+    try:
+        # Decodificación reducida (escalado DCT en JPEG) + orientación EXIF, directo en escala de grises
+        img = decodificar_gris(path, max(size))
+    except Exception as e:
+        raise FileNotFoundError(f"No se pudo leer la imagen en la ruta: {path}") from e
+    return binarizar(img, size)
+
+def compare_images(img1, img2, motor="sift", matcher="bf"):
+    # motor="orb" o "akaze" usa descriptores binarios con matching Hamming (mucho más rápido que SIFT)
+    if motor != "sift":
+        return verificar(img1, img2, motor, matcher)["ratio"]
+
+    # Para muchas comparaciones contra las mismas referencias conviene descriptores_sift.IndiceSIFT
+    kp1, des1 = extraer(img1)
+    kp2, des2 = extraer(img2)
+
+    if len(des1) == 0 or len(des2) == 0:
         return 0.0
 
     # Matcher FLANN (más rápido y tolerante que BFMatcher)
@@ -28,21 +33,12 @@ def compare_images(img1, img2):
 
     # Ratio test de Lowe
     good_matches = []
-    for m, n in matches:
-        if m.distance < 0.75 * n.distance:
-            good_matches.append(m)
-
-    # Si hay suficientes matches, intentamos calcular homografía
-    if len(good_matches) >= 4:
-        src_pts = np.float32([kp1[m.queryIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-        dst_pts = np.float32([kp2[m.trainIdx].pt for m in good_matches]).reshape(-1, 1, 2)
-
-        M, mask = cv2.findHomography(src_pts, dst_pts, cv2.RANSAC, 5.0)
-        if mask is not None:
-            match_score = float(np.sum(mask)) / len(mask)  # porcentaje de inliers
-        else:
-            match_score = 0.0
-    else:
-        match_score = 0.0
-
-    return match_score
+    for par in matches:
+        if len(par) == 2 and par[0].distance < RATIO_LOWE * par[1].distance:
+            good_matches.append(par[0])
+
+    # Si hay suficientes matches, intentamos calcular homografía (porcentaje de inliers)
+    return score_homografia(
+        [kp1[m.queryIdx][:2] for m in good_matches],
+        [kp2[m.trainIdx][:2] for m in good_matches],
+    )
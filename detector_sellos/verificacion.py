@@ -0,0 +1,87 @@
+# verificacion.py
+"""Verificación geométrica entre una foto y un diseño: keypoints + matching + homografía RANSAC.
+
+Motores:
+- sift:  descriptores float de 128 dims, FLANN kd-tree (el de utils.compare_images, preciso pero lento)
+- orb:   descriptores binarios, matching Hamming por fuerza bruta o LSH (el más rápido)
+- akaze: descriptores binarios M-LDB, matching Hamming (más estable que ORB ante escala y rotación)
+
+El score es el de siempre: porcentaje de inliers de la homografía. Como con 4 matches la homografía siempre tiene
+100% de inliers, `verificar` también devuelve cuántos matches e inliers hubo para poder exigir un mínimo.
+"""
+
+import os
+import threading
+import cv2
+import numpy as np
+from descriptores_sift import RATIO_LOWE, extraer as extraer_sift, score_homografia
+
+MOTORES = ("sift", "orb", "akaze")
+MATCHERS = ("bf", "lsh")
+VERIFICACION_MOTOR = os.environ.get("VERIFICACION_MOTOR", "orb")
+ORB_FEATURES = int(os.environ.get("ORB_FEATURES", "1500"))
+
+_local = threading.local()
+
+def binarizar(img, size=(512, 512)):
+    """Escala de grises -> tamaño fijo y binarización de Otsu (el preprocesamiento de utils.preprocess_image)"""
+    img = cv2.resize(img, size)
+    _, thresh = cv2.threshold(img, 128, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return thresh
+
+def _crear_akaze():
+    # En OpenCV 5 AKAZE pasó al módulo xfeatures2d de opencv-contrib
+    for modulo in (cv2, getattr(cv2, "xfeatures2d", None)):
+        if modulo is not None and hasattr(modulo, "AKAZE_create"):
+            return modulo.AKAZE_create()
+    raise RuntimeError(f"AKAZE no está disponible en OpenCV {cv2.__version__} (instalar opencv-contrib-python)")
+
+def _detector(motor):
+    # Los detectores de OpenCV no son thread-safe: uno por hilo y por motor
+    detectores = getattr(_local, "detectores", None)
+    if detectores is None:
+        detectores = _local.detectores = {}
+    if motor not in detectores:
+        if motor == "orb":
+            detectores[motor] = cv2.ORB_create(nfeatures=ORB_FEATURES)
+        elif motor == "akaze":
+            detectores[motor] = _crear_akaze()
+        else:
+            raise ValueError(f"Motor desconocido: {motor} (opciones: {', '.join(MOTORES)})")
+    return detectores[motor]
+
+def extraer(img, motor=VERIFICACION_MOTOR):
+    """(puntos (N, 2) float32, descriptores) de una imagen en escala de grises"""
+    if motor == "sift":
+        puntos, descriptores = extraer_sift(img)
+        return puntos[:, :2], descriptores
+    keypoints, descriptores = _detector(motor).detectAndCompute(img, None)
+    puntos = np.array([k.pt for k in keypoints], dtype=np.float32).reshape(-1, 2)
+    if descriptores is None:
+        descriptores = np.empty((0, 32), dtype=np.uint8)
+    return puntos, descriptores
+
+def _matcher(motor, matcher):
+    if motor == "sift":
+        return cv2.FlannBasedMatcher(dict(algorithm=1, trees=5), dict(checks=50))
+    if matcher == "lsh":
+        return cv2.FlannBasedMatcher(dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1), dict(checks=50))
+    if matcher != "bf":
+        raise ValueError(f"Matcher desconocido: {matcher} (opciones: {', '.join(MATCHERS)})")
+    return cv2.BFMatcher(cv2.NORM_HAMMING)
+
+def emparejar(descriptores1, descriptores2, motor=VERIFICACION_MOTOR, matcher="bf"):
+    """Pares (índice en 1, índice en 2) que pasan el ratio test de Lowe"""
+    if len(descriptores1) < 2 or len(descriptores2) < 2:
+        return []
+    pares = _matcher(motor, matcher).knnMatch(descriptores1, descriptores2, k=2)
+    # LSH puede devolver menos de 2 vecinos para algunos descriptores
+    return [(p[0].queryIdx, p[0].trainIdx) for p in pares if len(p) == 2 and p[0].distance < RATIO_LOWE * p[1].distance]
+
+def verificar(img1, img2, motor=VERIFICACION_MOTOR, matcher="bf"):
+    """{"matches", "inliers", "ratio"} de la homografía entre dos imágenes en escala de grises ya preprocesadas"""
+    puntos1, descriptores1 = extraer(img1, motor)
+    puntos2, descriptores2 = extraer(img2, motor)
+    pares = emparejar(descriptores1, descriptores2, motor, matcher)
+    ratio = score_homografia([puntos1[q] for q, _ in pares], [puntos2[t] for _, t in pares])
+    return {"matches": len(pares), "inliers": int(round(ratio * len(pares))), "ratio": ratio}
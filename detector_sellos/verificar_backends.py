@@ -0,0 +1,78 @@
+# verificar_backends.py
+"""Verifica que los backends cuantizados/exportados den los mismos scores que fp32.
+
+Compara la matriz de scores Muestras/ × Vectores/ de cada backend contra la de fp32 y falla (exit 1) si:
+- algún score difiere más que --tolerancia,
+- cambia el mejor match de alguna muestra,
+- cambia alguna decisión score >= UMBRAL,
+- el backend no se puede cargar o falla al codificar (para no verificarlo hay que excluirlo con --excluir).
+También informa el throughput de cada backend.
+
+    python verificar_backends.py --backends int8 torchscript onnx
+    python verificar_backends.py --excluir onnx
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import clip_engine
+from backends_clip import BACKENDS
+
+UMBRAL = 0.25
+
+def _imagenes(directorio):
+    nombres = sorted(os.listdir(directorio))
+    return nombres, [os.path.join(directorio, n) for n in nombres]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=[b for b in BACKENDS if b != "fp32"])
+    parser.add_argument("--excluir", nargs="+", default=[], help="Backends que no se verifican (p. ej. sin onnxruntime)")
+    parser.add_argument("--muestras", default="Muestras")
+    parser.add_argument("--vectores", default="Vectores")
+    parser.add_argument("--tolerancia", type=float, default=0.02)
+    parser.add_argument("--repeticiones", type=int, default=5, help="Pasadas para medir throughput")
+    args = parser.parse_args()
+
+    clip_engine.MICROBATCH_ACTIVO = False
+    nombres_m, muestras = _imagenes(args.muestras)
+    nombres_v, vectores = _imagenes(args.vectores)
+    imagenes = muestras + vectores
+
+    def scores_con(nombre):
+        clip_engine.usar_backend(nombre)
+        embs = clip_engine.codificar_normalizado(imagenes)
+        inicio = time.perf_counter()
+        for _ in range(args.repeticiones):
+            clip_engine.codificar_imagenes(imagenes)
+        throughput = args.repeticiones * len(imagenes) / (time.perf_counter() - inicio)
+        return embs[:len(muestras)] @ embs[len(muestras):].T, throughput
+
+    referencia, throughput_fp32 = scores_con("fp32")
+    print(f"fp32: {throughput_fp32:.1f} img/s")
+    fallas = 0
+    for nombre in args.excluir:
+        print(f"⚠️ {nombre}: excluido, no se verifica")
+    for nombre in [b for b in args.backends if b not in args.excluir]:
+        try:
+            scores, throughput = scores_con(nombre)
+        except Exception as e:
+            print(f"❌ {nombre}: no se pudo verificar ({e})")
+            fallas += 1
+            continue
+        diferencia = float(np.max(np.abs(scores - referencia)))
+        mismo_top1 = np.array_equal(scores.argmax(1), referencia.argmax(1))
+        mismas_decisiones = np.array_equal(scores >= UMBRAL, referencia >= UMBRAL)
+        ok = diferencia <= args.tolerancia and mismo_top1 and mismas_decisiones
+        fallas += not ok
+        print(f"{'✅' if ok else '❌'} {nombre}: {throughput:.1f} img/s ({throughput / throughput_fp32:.2f}x), "
+              f"dif. máx {diferencia:.4f}, top-1 igual: {mismo_top1}, decisiones en UMBRAL iguales: {mismas_decisiones}")
+        if not mismo_top1:
+            for i, muestra in enumerate(nombres_m):
+                print(f"    {muestra}: fp32 → {nombres_v[referencia[i].argmax()]}, {nombre} → {nombres_v[scores[i].argmax()]}")
+    sys.exit(1 if fallas else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# vistas.py
+"""Vistas aumentadas de los diseños de referencia: rotaciones, espejo y variantes de trazo.
+
+Los sellos se fotografían en cualquier orientación y a veces espejados (el sello de metal contra su impresión).
+Cada referencia se codifica una vez por vista, todas en el mismo batch, y el score de una foto contra la
+referencia es el máximo sobre sus vistas. Las vistas se guardan en el cache y en el índice junto con la
+referencia, así el costo extra se paga al dar de alta el diseño y no en cada foto.
+
+    VISTAS_REFERENCIA=original,rot90,rot180,rot270,espejo
+"""
+
+import os
+from PIL import Image, ImageFilter
+
+VISTAS_DEFAULT = "original"
+
+def _espejo(im):
+    return im.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+TRANSFORMACIONES = {
+    "original": lambda im: im,
+    "rot90": lambda im: im.transpose(Image.Transpose.ROTATE_90),
+    "rot180": lambda im: im.transpose(Image.Transpose.ROTATE_180),
+    "rot270": lambda im: im.transpose(Image.Transpose.ROTATE_270),
+    "espejo": _espejo,
+    "espejo_rot90": lambda im: _espejo(im).transpose(Image.Transpose.ROTATE_90),
+    "espejo_rot180": lambda im: _espejo(im).transpose(Image.Transpose.ROTATE_180),
+    "espejo_rot270": lambda im: _espejo(im).transpose(Image.Transpose.ROTATE_270),
+    # Trazos oscuros sobre fondo blanco: el mínimo los engrosa (grabado profundo), el máximo los afina
+    "trazo_grueso": lambda im: im.filter(ImageFilter.MinFilter(5)),
+    "trazo_fino": lambda im: im.filter(ImageFilter.MaxFilter(3)),
+}
+
+def parsear_vistas(texto):
+    """'original,rot90,espejo' -> tupla de nombres de vistas, sin repetir y en el orden dado"""
+    vistas = tuple(dict.fromkeys(filter(None, (v.strip() for v in texto.split(",")))))
+    for vista in vistas:
+        if vista not in TRANSFORMACIONES:
+            raise ValueError(f"Vista desconocida: {vista} (opciones: {', '.join(TRANSFORMACIONES)})")
+    if not vistas:
+        raise ValueError("Hace falta al menos una vista de referencia")
+    return vistas
+
+VISTAS_REFERENCIA = parsear_vistas(os.environ.get("VISTAS_REFERENCIA", VISTAS_DEFAULT))
+
+def generar_vistas(im, vistas=VISTAS_REFERENCIA):
+    """Una imagen PIL por vista, en el orden de `vistas`"""
+    return [TRANSFORMACIONES[vista](im) for vista in vistas]
+
+def firma(vistas=VISTAS_REFERENCIA):
+    """Partes extra de la clave de cache (ninguna con sólo la original: quedan las claves de siempre)"""
+    return () if vistas == ("original",) else (",".join(vistas),)